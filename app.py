@@ -1,9 +1,8 @@
 import streamlit as st
 from src.utils.state import init_session_state
+from src.utils.lazy import prewarm
 from src.ui.layout import render_header
-from src.ui.sidebar import render_model_config_section
-from src.ui.tabs.expert_qa import render_expert_qa_tab
-from src.ui.tabs.consultation import render_consultation_tab
+from src.ui.sidebar import render_model_config_section, render_debug_panel, render_profiling_panel
 
 def main():
     # 1. Render Global Header (Must be first)
@@ -18,12 +17,19 @@ def main():
         page = st.radio("选择模式", ["问答模式", "模拟模式"], index=0)
         st.divider()
         render_model_config_section()
+        render_debug_panel()
+        render_profiling_panel()
 
-    # 4. Main Content
+    # 4. Main Content (tab modules are imported only when their page is opened)
     if page == "问答模式":
+        from src.ui.tabs.expert_qa import render_expert_qa_tab
         render_expert_qa_tab()
     elif page == "模拟模式":
+        from src.ui.tabs.consultation import render_consultation_tab
         render_consultation_tab()
 
+    # 5. Load camel / Qdrant / unstructured in the background after the first paint
+    prewarm()
+
 if __name__ == "__main__":
     main()
@@ -2,16 +2,19 @@ from enum import Enum
 from typing import Dict, Any, List, Optional
 import streamlit as st
 
-# Camel Imports
-from camel.agents import ChatAgent
-from camel.messages import BaseMessage
-from camel.types import ModelPlatformType
-from camel.models import ModelFactory
-from camel.toolkits import FunctionTool
-
-
 # Project Imports
-from src.core.tools import search_medical_records
+from src.core.models import create_camel_model
+from src.core import tools
+from src.utils.chat_display import attach_display
+from src.utils.lazy import lazy_import
+from src.utils.profiling import profiler
+from src.utils.resilience import describe_provider_error
+from src.utils.telemetry import telemetry, record_llm_response
+
+# Camel Imports (loaded on first use of the agents, not at app start)
+ChatAgent = lazy_import("camel.agents", "ChatAgent")
+BaseMessage = lazy_import("camel.messages", "BaseMessage")
+FunctionTool = lazy_import("camel.toolkits", "FunctionTool")
 
 class SimulationStatus(Enum):
     IDLE = "idle"
@@ -21,41 +24,57 @@ class SimulationStatus(Enum):
 class AgentManager:
     """Manages the lifecycle and interaction of Doctor and Patient agents."""
     
-    def __init__(self):
+    def __init__(self, store: Any = None, owner: str = ""):
+        """
+        With a ConversationStore, each simulation's history is a stored Conversation
+        of `owner` (see src.core.conversations); without one it is a plain list.
+        """
         self.doctor_agent = None
         self.patient_agent = None
         self.status = SimulationStatus.IDLE
+        self.store = store
+        self.owner = owner
         self.chat_history: List[Dict[str, str]] = []
         self.max_steps = 10
         self.current_step = 0
 
+    def resume(self, conversation: Any):
+        """Show a stored simulation. Its agents are not restored, so it is treated as finished."""
+        self.doctor_agent = None
+        self.patient_agent = None
+        self.chat_history = conversation
+        self.current_step = sum(1 for msg in conversation if msg["role"] == "Doctor")
+        self.status = SimulationStatus.COMPLETED
+
     def _create_camel_model(self, model_config):
         """Helper to create Camel Model instance."""
-        return ModelFactory.create(
-            model_platform=ModelPlatformType.OPENAI, # Assuming OpenAI compatible
-            model_type=model_config.model_name or "qwen-plus", # Default fallback
-            url=model_config.base_url,
-            api_key=model_config.api_key,
-            model_config_dict={"temperature": model_config.temperature}
-        )
+        return create_camel_model(model_config)
 
-    def initialize_agents(self, patient_profile: str, doctor_instruction: str, model_config: Any, rag_content: str = "", max_steps: int = 10):
+    def initialize_agents(self, patient_profile: str, doctor_instruction: str, model_config: Any, rag_content: str = "", max_steps: int = 10,
+                          rag_manager: Any = None, patient_model_config: Any = None):
         """
         Initialize both agents with provided profiles and instructions.
+        rag_manager defaults to the session's manager (st.session_state.rag_manager).
+        patient_model_config runs the patient on its own (typically smaller, faster) model;
+        empty connection fields fall back to model_config. None shares the doctor's model.
         """
         self.status = SimulationStatus.RUNNING
-        self.chat_history = []
+        self.chat_history = (self.store.create("sim", title=patient_profile.split("\n")[0][:40], owner=self.owner)
+                             if self.store is not None else [])
         self.current_step = 0
         self.max_steps = max_steps
         
         # 1. Setup RAG Tool for Doctor
         doctor_tools = []
         if rag_content:
-            if 'rag_manager' in st.session_state:
-                retriever = st.session_state.rag_manager.create_temporary_retriever(rag_content)
+            if rag_manager is None and 'rag_manager' in st.session_state:
+                rag_manager = st.session_state.rag_manager
+            if rag_manager is not None:
+                retriever = rag_manager.create_temporary_retriever(rag_content)
                 
                 if retriever:
-                    def rag_tool_wrapper(query: str, top_k: int = 3, similarity_threshold: float = 0.5) -> str:
+                    # The function names are the tool names the model sees and the prompt below uses
+                    def search_medical_records(query: str, top_k: int = 3, similarity_threshold: float = 0.5) -> str:
                         """
                         Search the patient's medical records/reports for specific information.
                         Args:
@@ -63,18 +82,34 @@ class AgentManager:
                             top_k: Number of results to return (default: 3).
                             similarity_threshold: Threshold for relevance. It would be better to set a lower threshold(like 0.2-0.4) to get more results.
                         """
-                        return search_medical_records(query, retriever, top_k=top_k, similarity_threshold=similarity_threshold)
+                        with telemetry.span("tool.search_medical_records", top_k=top_k):
+                            return tools.search_medical_records(query, retriever, top_k=top_k, similarity_threshold=similarity_threshold)
+
+                    def search_medical_records_multi(queries: List[str], top_k: int = 3, similarity_threshold: float = 0.5) -> str:
+                        """
+                        Search the patient's medical records/reports for several items in one call.
+                        Prefer this over repeated single searches when you need multiple facts (e.g. blood pressure, lipids and glucose).
+                        Args:
+                            queries: The list of questions or keywords to search for, one per item.
+                            top_k: Number of results to return for each query (default: 3).
+                            similarity_threshold: Threshold for relevance. It would be better to set a lower threshold(like 0.2-0.4) to get more results.
+                        """
+                        with telemetry.span("tool.search_medical_records_multi", top_k=top_k, num_queries=len(queries)):
+                            return tools.search_medical_records_multi(queries, retriever, top_k=top_k, similarity_threshold=similarity_threshold)
 
-                    rag_tool = FunctionTool(rag_tool_wrapper)
-                    doctor_tools.append(rag_tool)
+                    doctor_tools.append(FunctionTool(search_medical_records))
+                    doctor_tools.append(FunctionTool(search_medical_records_multi))
 
         # 2. Create Models
         model_instance = self._create_camel_model(model_config)
+        patient_model_instance = model_instance
+        if patient_model_config is not None:
+            patient_model_instance = self._create_camel_model(patient_model_config.with_fallback(model_config))
 
         # 3. Create Doctor Agent
         doctor_sys_content = doctor_instruction
         if rag_content:
-            doctor_sys_content += "\n\n你可以使用 search_medical_records 方法查询病历信息。请只通过工具查找信息。如果没有工具或工具查不到，请根据病人描述判断。"
+            doctor_sys_content += "\n\n你可以使用 search_medical_records 方法查询病历信息。请只通过工具查找信息。如果没有工具或工具查不到，请根据病人描述判断。需要同时查询多项信息（如血压、血脂、血糖）时，请使用 search_medical_records_multi 一次传入多个查询，减少工具调用次数。"
         
         doctor_sys_msg = BaseMessage.make_assistant_message(
             role_name="Doctor",
@@ -93,7 +128,7 @@ class AgentManager:
         )
         self.patient_agent = ChatAgent(
             system_message=patient_sys_msg,
-            model=model_instance
+            model=patient_model_instance
         )
 
     def generate_opening_message(self, starter_role: str) -> Optional[Dict[str, Any]]:
@@ -128,9 +163,10 @@ class AgentManager:
             return message
             
         except Exception as e:
-            st.error(f"Failed to generate opening message: {e}")
+            st.error(f"Failed to generate opening message: {describe_provider_error(e)}")
             return None
 
+    @profiler.profiled("step_simulation")
     def step_simulation(self) -> Optional[Dict[str, Any]]:
         """
         Execute one step of the simulation (non-streaming).
@@ -163,9 +199,11 @@ class AgentManager:
         user_msg = BaseMessage.make_user_message(role_name="User", content=last_content)
 
         try:
-            response = current_agent.step(user_msg)
+            with telemetry.span("sim.step", role=role_name, step=self.current_step) as span:
+                response = current_agent.step(user_msg)
+                record_llm_response(span, response)
         except Exception as exc:
-            error_message = {"role": role_name, "content": f"Error: {exc}"}
+            error_message = {"role": role_name, "content": f"Error: {describe_provider_error(exc)}"}
             self.chat_history.append(error_message)
             return error_message
 
@@ -192,7 +230,7 @@ class AgentManager:
         if tool_calls_info:
             message["tool_calls"] = tool_calls_info
 
-        self.chat_history.append(message)
+        self.chat_history.append(attach_display(message))
         return message
 
     def send_user_message(self, message: str, role: str):
@@ -219,14 +257,14 @@ class AgentManager:
                 self.status = SimulationStatus.COMPLETED
                 content = content.replace("<DIAGNOSIS_DONE>", "").strip()
 
-            self.chat_history.append({
+            self.chat_history.append(attach_display({
                 "role": other_role,
                 "content": content,
                 "tool_calls": response.info.get('tool_calls', []) if response.info else []
-            })
+            }))
             
         except Exception as e:
-            st.error(f"Response Error: {str(e)}")
+            st.error(f"Response Error: {describe_provider_error(e)}")
 
     def add_message(self, role: str, content: str):
         """
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+
+@dataclass
+class CacheEntry:
+    """One cached answer and the normalized embedding of the question it answered."""
+    namespace: str
+    question: str
+    vector: np.ndarray
+    answer: str
+    rag_context: List[Dict[str, Any]] = field(default_factory=list)
+    rag_stats: Optional[Dict[str, Any]] = None
+    created_at: float = 0.0
+    hits: int = 0
+
+
+def make_namespace(**parts: Any) -> str:
+    """
+    Hash everything besides the question that determines an answer (KB version,
+    system prompt, model config, retrieval settings). Entries only match within a namespace.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _normalize(vector: List[float]) -> Optional[np.ndarray]:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    if norm == 0.0:
+        return None
+    return array / norm
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by question embedding. A lookup hits when a cached question
+    in the same namespace has cosine similarity >= threshold. Entries expire after
+    ttl_seconds and the least recently used ones are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600.0,
+                 clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict_expired(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, namespace: str, vector: List[float],
+               threshold: float = DEFAULT_SIMILARITY_THRESHOLD) -> Optional[Tuple[CacheEntry, float]]:
+        """Return the most similar cached entry and its similarity, or None."""
+        query = _normalize(vector)
+        if query is None:
+            return None
+        with self._lock:
+            self._evict_expired(self._clock())
+            keys = [key for key, entry in self._entries.items() if entry.namespace == namespace]
+            if not keys:
+                return None
+            matrix = np.stack([self._entries[key].vector for key in keys])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < threshold:
+                return None
+            entry = self._entries[keys[best]]
+            entry.hits += 1
+            self._entries.move_to_end(keys[best])
+            return entry, similarity
+
+    def store(self, namespace: str, question: str, vector: List[float], answer: str,
+              rag_context: Optional[List[Dict[str, Any]]] = None, rag_stats: Optional[Dict[str, Any]] = None):
+        """Add an answer; evicts the least recently used entries when full."""
+        normalized = _normalize(vector)
+        if normalized is None:
+            return
+        with self._lock:
+            self._entries[self._next_id] = CacheEntry(
+                namespace=namespace,
+                question=question,
+                vector=normalized,
+                answer=answer,
+                rag_context=list(rag_context or []),
+                rag_stats=rag_stats,
+                created_at=self._clock(),
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide cache shared by every Streamlit session
+semantic_cache = SemanticCache(
+    max_entries=int(os.getenv("MEDRAG_ANSWER_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.getenv("MEDRAG_ANSWER_CACHE_TTL", "3600")),
+)
@@ -0,0 +1,340 @@
+"""
+Knowledge-base compaction: duplicate and orphan removal, then a compact rewrite.
+
+    python -m src.core.compaction --kb textbook [--base-path local_data] [--near [0.97]] [--dry-run]
+
+One pass over a KB directory:
+1. Raw files: uploads with identical bytes under another name and stray
+   *.tmp files are deleted.
+2. Orphans: points whose source file is gone, and child chunks whose parent
+   section is missing from parents.json.
+3. Exact duplicates: chunks with the same whitespace-normalized text (the
+   earliest ingested copy is kept). This catches re-uploads and boilerplate.
+4. Near duplicates (opt-in, they are not exact copies): chunks whose vectors
+   have cosine similarity >= `near`.
+   SimHash banding proposes candidate pairs, so the cost grows with bucket
+   sizes rather than with N^2.
+The index is then rewritten without the removed points: the kept Qdrant points
+are written to a staging collection that is swapped in at the end, sharded
+storage is rewritten without tombstones. Parent sections left without children
+are dropped and the KB metadata is updated.
+
+Ingestion uses IngestDeduplicator, so chunks already in the KB, or repeated
+within one upload, are neither embedded nor stored.
+"""
+import argparse
+import hashlib
+import os
+import shutil
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from camel.embeddings.base import BaseEmbedding
+
+from src.core.hierarchy import load_parents, save_parents
+from src.core.kb_meta import KnowledgeBaseMeta, compute_content_hash, now_iso
+
+NEAR_DUP_SIMILARITY = float(os.getenv("MEDRAG_NEAR_DUP_SIMILARITY", "0.97"))
+# SimHash banding: a pair at the similarity threshold shares at least one band with probability > 99%
+LSH_BANDS = 10
+LSH_BITS = 12
+REWRITE_BATCH = 256
+# Local Qdrant keeps its collections in this directory of the KB
+QDRANT_COLLECTION_DIR = "collection"
+
+
+def chunk_key(text: str) -> str:
+    """Identity of a chunk's content: hash of its whitespace-normalized text."""
+    return hashlib.sha1(" ".join(str(text).split()).encode("utf-8")).hexdigest()
+
+
+class DedupEmbedding(BaseEmbedding[str]):
+    """Embeds only texts the deduplicator has not seen; duplicates get a placeholder vector."""
+
+    def __init__(self, model: BaseEmbedding, dedup: "IngestDeduplicator"):
+        self.model = model
+        self.dedup = dedup
+
+    def embed_list(self, objs: List[str], **kwargs: Any) -> List[List[float]]:
+        new = [i for i, text in enumerate(objs) if self.dedup.claim(text)]
+        vectors = self.model.embed_list([objs[i] for i in new], **kwargs) if new else []
+        placeholder = [float("nan")] * self.get_output_dim()
+        out = [placeholder] * len(objs)
+        for i, vector in zip(new, vectors):
+            out[i] = vector
+        return out
+
+    def get_output_dim(self) -> int:
+        return self.model.get_output_dim()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__dict__["model"], name)
+
+
+class IngestDeduplicator:
+    """
+    Chunk keys already in a KB plus those claimed during the current ingestion.
+    Hierarchical indexing calls claim() before embedding; camel's chunk-and-embed
+    path goes through embedding() and InstrumentedStorage drops the placeholder records.
+    """
+
+    def __init__(self, known: Iterable[str] = ()):
+        self.seen: Set[str] = set(known)
+        self.skipped = 0
+
+    @classmethod
+    def for_storage(cls, storage: Any) -> "IngestDeduplicator":
+        return cls(chunk_key(payload.get("text", "")) for _, _, payload in storage.iter_points(with_vectors=False))
+
+    def claim(self, text: str) -> bool:
+        """True for the first occurrence of a chunk's content; later ones count as skipped."""
+        key = chunk_key(text)
+        if key in self.seen:
+            self.skipped += 1
+            return False
+        self.seen.add(key)
+        return True
+
+    def embedding(self, model: BaseEmbedding) -> DedupEmbedding:
+        return DedupEmbedding(model, self)
+
+    @staticmethod
+    def is_placeholder(vector: Any) -> bool:
+        return len(vector) > 0 and vector[0] != vector[0]
+
+
+def find_near_duplicates(vectors: np.ndarray, threshold: float = NEAR_DUP_SIMILARITY,
+                         seed: int = 0) -> List[int]:
+    """
+    Indices of rows whose cosine similarity to an earlier kept row is >= threshold.
+    Earlier rows win, so order the input by preference.
+    """
+    n, dim = vectors.shape
+    if n < 2:
+        return []
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+    planes = np.random.default_rng(seed).normal(size=(dim, LSH_BANDS * LSH_BITS)).astype(np.float32)
+    bits = (unit @ planes) > 0
+    weights = 1 << np.arange(LSH_BITS)
+    dropped = np.zeros(n, dtype=bool)
+    for band in range(LSH_BANDS):
+        codes = bits[:, band * LSH_BITS:(band + 1) * LSH_BITS] @ weights
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        for bucket in np.split(order, boundaries):
+            members = np.sort(bucket[~dropped[bucket]])
+            if len(members) < 2:
+                continue
+            kept: List[int] = [members[0]]
+            for idx in members[1:]:
+                if float((unit[kept] @ unit[idx]).max()) >= threshold:
+                    dropped[idx] = True
+                else:
+                    kept.append(idx)
+    return [int(i) for i in np.flatnonzero(dropped)]
+
+
+@dataclass
+class CompactionReport:
+    kb: str
+    points_before: int = 0
+    points_after: int = 0
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+    orphans: int = 0
+    parents_removed: int = 0
+    files_removed: List[str] = field(default_factory=list)
+    bytes_before: int = 0
+    bytes_after: int = 0
+    dry_run: bool = False
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    def summary(self) -> str:
+        prefix = "（预演，未修改）" if self.dry_run else ""
+        text = (f"{prefix}知识库 {self.kb}: 片段 {self.points_before} → {self.points_after} · "
+                f"完全重复 {self.exact_duplicates} · 近似重复 {self.near_duplicates} · 孤立 {self.orphans}")
+        if self.parents_removed:
+            text += f" · 父段落 -{self.parents_removed}"
+        if self.files_removed:
+            text += f" · 删除文件 {', '.join(self.files_removed)}"
+        if not self.dry_run:
+            text += f" · 释放空间 {self.bytes_reclaimed / 2 ** 20:.2f} MB"
+        return text
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _point_source(payload: Dict[str, Any]) -> str:
+    return payload.get("source") or (payload.get("metadata") or {}).get("filename") or ""
+
+
+def _rewrite_qdrant(manager: Any, storage: Any, kb_path: str, dimension: int, kept: List[Any]):
+    """
+    Write the kept points to a staging local Qdrant, then swap its collection
+    directory in. The live collection is only replaced once the copy is complete;
+    at every point of the swap either `collection` or `collection.new` is whole
+    (RAGManager._open_storage finishes an interrupted swap).
+    """
+    from camel.storages import VectorRecord
+    from src.core.rag import STORAGE_QDRANT
+    from src.core.storage import _client_access
+
+    staging = os.path.join(kb_path, ".compact")
+    shutil.rmtree(staging, ignore_errors=True)
+    target = manager._open_storage(staging, dimension, STORAGE_QDRANT)
+    try:
+        target.create_payload_indexes()
+        for start in range(0, len(kept), REWRITE_BATCH):
+            target.add([VectorRecord(id=pid, vector=vector.tolist(), payload=payload)
+                        for pid, vector, payload in kept[start:start + REWRITE_BATCH]])
+        copied = target.status().vector_count
+        if copied != len(kept):
+            raise RuntimeError(f"compaction copied {copied} of {len(kept)} points")
+    except BaseException:
+        target.client.close()
+        del target
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    target.client.close()
+    del target
+
+    # camel shares one local client per path across the process; every holder of it
+    # sees the rewritten collection once its local backend is reopened
+    live = os.path.join(kb_path, QDRANT_COLLECTION_DIR)
+    client = storage.client
+    with _client_access(storage.storage):
+        local = client._client
+        local.close()
+        try:
+            os.replace(os.path.join(staging, QDRANT_COLLECTION_DIR), live + ".new")
+            os.replace(live, live + ".old")
+            os.replace(live + ".new", live)
+        finally:
+            client._client = type(local)(local.location)
+    shutil.rmtree(live + ".old", ignore_errors=True)
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def compact_knowledge_base(manager: Any, kb_name: str, near_threshold: Optional[float] = None,
+                           dry_run: bool = False) -> CompactionReport:
+    """Compact a KB of `manager` (a RAGManager); near duplicates are removed only when near_threshold is given."""
+    from src.core.rag import STORAGE_SHARDED
+
+    kb_path = os.path.join(manager.base_path, kb_name)
+    meta = KnowledgeBaseMeta.load(kb_path)
+    if meta is None:
+        raise ValueError(f"知识库 {kb_name} 不存在或缺少元数据（请先加载一次）")
+    report = CompactionReport(kb=kb_name, bytes_before=_dir_bytes(kb_path), dry_run=dry_run)
+
+    # 1. Raw files uploaded twice under different names, and leftovers of interrupted writes
+    digests: Dict[str, str] = {}
+    stale: List[str] = []
+    for path in manager._list_kb_files(kb_path):
+        digest = _file_digest(path)
+        if digest in digests:
+            stale.append(path)
+        else:
+            digests[digest] = path
+    stale += [os.path.join(kb_path, f) for f in os.listdir(kb_path) if f.endswith(".tmp")]
+    report.files_removed = [os.path.basename(p) for p in stale]
+    live_sources = {os.path.basename(p) for p in digests.values()}
+
+    # 2-4. Classify points, earliest ingested first
+    if manager.current_kb_name == kb_name and manager.storage is not None:
+        storage = manager.storage
+    else:
+        storage = manager._open_storage(kb_path, meta.dimension, meta.storage, meta.coarse_dim)
+    parents = load_parents(kb_path)
+    points = sorted(storage.iter_points(), key=lambda p: (p[2].get("ingested_at") or 0, _point_source(p[2]),
+                                                          p[2].get("chunk_ordinal") or 0))
+    report.points_before = len(points)
+    removed: Set[int] = set()
+    seen: Set[str] = set()
+    for i, (_, _, payload) in enumerate(points):
+        source = _point_source(payload)
+        parent_id = (payload.get("metadata") or {}).get("parent_id")
+        if (source and source not in live_sources) or (parent_id and parent_id not in (parents or {})):
+            report.orphans += 1
+            removed.add(i)
+            continue
+        key = chunk_key(payload.get("text", ""))
+        if key in seen:
+            report.exact_duplicates += 1
+            removed.add(i)
+        seen.add(key)
+    remaining = [i for i in range(len(points)) if i not in removed]
+    if near_threshold is not None and remaining:
+        near = find_near_duplicates(np.stack([points[i][1] for i in remaining]), near_threshold)
+        report.near_duplicates = len(near)
+        removed.update(remaining[j] for j in near)
+    kept = [p for i, p in enumerate(points) if i not in removed]
+    report.points_after = len(kept)
+
+    referenced = {(payload.get("metadata") or {}).get("parent_id") for _, _, payload in kept}
+    kept_parents = [p for pid, p in (parents or {}).items() if pid in referenced]
+    report.parents_removed = len(parents or {}) - len(kept_parents)
+    if dry_run:
+        report.bytes_after = report.bytes_before
+        return report
+
+    if removed:
+        if meta.storage == STORAGE_SHARDED:
+            storage.delete([points[i][0] for i in removed])
+            storage.storage.compact()
+        else:
+            # Deleted points stay in a local Qdrant file; a fresh collection holds only the kept ones
+            _rewrite_qdrant(manager, storage, kb_path, meta.dimension, kept)
+    for path in stale:
+        os.remove(path)
+    if parents is not None and report.parents_removed:
+        save_parents(kb_path, kept_parents)
+
+    files = manager._list_kb_files(kb_path)
+    meta.files = [os.path.basename(p) for p in files]
+    meta.file_info = {name: info for name, info in meta.file_info.items() if name in meta.files}
+    meta.content_hash = compute_content_hash(files)
+    meta.chunk_count = report.points_after
+    # A new build time changes kb_version, so caches of answers from the old index are invalidated
+    meta.build_time = now_iso()
+    meta.save(kb_path)
+    manager.invalidate_kb_cache()
+    if manager.current_kb_name == kb_name:
+        manager.load_knowledge_base(kb_name)
+    report.bytes_after = _dir_bytes(kb_path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact a knowledge base: remove duplicates and orphans")
+    parser.add_argument("--kb", required=True, help="knowledge base name")
+    parser.add_argument("--base-path", default="local_data")
+    parser.add_argument("--near", type=float, nargs="?", const=NEAR_DUP_SIMILARITY, default=None,
+                        help=f"also remove near duplicates at this cosine similarity (default {NEAR_DUP_SIMILARITY})")
+    parser.add_argument("--dry-run", action="store_true", help="report without modifying the KB")
+    args = parser.parse_args()
+
+    from src.core.rag import RAGManager
+
+    report = compact_knowledge_base(RAGManager(base_path=args.base_path), args.kb,
+                                    near_threshold=args.near, dry_run=args.dry_run)
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
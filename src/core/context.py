@@ -0,0 +1,158 @@
+import random
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Default prompt budget for the background information block
+DEFAULT_TOKEN_BUDGET = 1500
+
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+# Universal hashing (a * h + b) mod p over 32-bit shingle hashes; products fit in uint64
+_PRIME = (1 << 31) - 1
+_rng = random.Random(20240601)
+_PERM_A = np.array([_rng.randrange(1, _PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+_PERM_B = np.array([_rng.randrange(0, _PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+# Longest overlap checked when stitching two adjacent chunks together
+MAX_STITCH_OVERLAP = 200
+
+# Adjacent chunks are not merged into passages longer than this
+MAX_MERGED_TOKENS = 800
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per four other characters."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Character shingles of the text with whitespace removed."""
+    chars = "".join(text.split())
+    if len(chars) <= size:
+        return {chars} if chars else set()
+    return {chars[i:i + size] for i in range(len(chars) - size + 1)}
+
+
+def minhash(shingle_set: set) -> np.ndarray:
+    """MinHash signature of a shingle set; matching slots estimate the Jaccard similarity."""
+    if not shingle_set:
+        return np.zeros(NUM_PERMUTATIONS, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+def estimate_jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.mean(sig_a == sig_b))
+
+
+def _relevance(chunk: Dict[str, Any]) -> float:
+    return float(chunk.get('rerank_score', chunk.get('similarity', 0.0)))
+
+
+def _stitch(first: str, second: str) -> str:
+    """Join two consecutive chunks, dropping text repeated at the boundary."""
+    limit = min(len(first), len(second), MAX_STITCH_OVERLAP)
+    for size in range(limit, 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def _merge_adjacent(chunks: List[Dict[str, Any]], max_tokens: int = MAX_MERGED_TOKENS) -> Tuple[List[Dict[str, Any]], int]:
+    """Merge chunks that are consecutive pieces of the same source document."""
+    merged = 0
+    result: List[Dict[str, Any]] = []
+    by_position: Dict[Tuple[Any, int], Dict[str, Any]] = {}
+    for chunk in sorted(chunks, key=lambda c: (str(c.get('source', '')), c.get('chunk_index') or 0)):
+        source, index = chunk.get('source'), chunk.get('chunk_index')
+        previous = by_position.get((source, index - 1)) if source is not None and index is not None else None
+        stitched = _stitch(previous['text'], chunk['text']) if previous is not None else None
+        if stitched is not None and estimate_tokens(stitched) <= max_tokens:
+            previous['text'] = stitched
+            previous['similarity'] = max(float(previous.get('similarity', 0.0)), float(chunk.get('similarity', 0.0)))
+            if 'rerank_score' in chunk or 'rerank_score' in previous:
+                previous['rerank_score'] = max(_relevance(previous), _relevance(chunk))
+            previous['chunk_span'] = [previous['chunk_span'][0], index]
+            by_position[(source, index)] = previous
+            merged += 1
+            continue
+        chunk = dict(chunk)
+        if index is not None:
+            chunk['chunk_span'] = [index, index]
+            by_position[(source, index)] = chunk
+        result.append(chunk)
+    return result, merged
+
+
+def pack_context(results: List[Dict[str, Any]], token_budget: Optional[int] = DEFAULT_TOKEN_BUDGET,
+                 dedup_threshold: float = 0.8) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Prepare retrieved chunks for prompt assembly.
+
+    1. drop exact, contained and near-duplicate chunks (MinHash over character shingles)
+    2. merge consecutive chunks of the same source into one passage
+    3. order by relevance and trim to the token budget
+
+    Returns the packed chunks and statistics about what was removed.
+    """
+    stats = {
+        'input_chunks': len(results),
+        'duplicates_removed': 0,
+        'merged': 0,
+        'dropped_for_budget': 0,
+        'truncated': 0,
+        'tokens_before': sum(estimate_tokens(r.get('text', '')) for r in results),
+        'tokens_after': 0,
+        'token_budget': token_budget,
+    }
+
+    # 1. De-duplicate, most relevant first so the best copy survives
+    kept: List[Dict[str, Any]] = []
+    signatures: List[np.ndarray] = []
+    for chunk in sorted(results, key=_relevance, reverse=True):
+        text = chunk.get('text', '').strip()
+        if not text:
+            continue
+        signature = minhash(shingles(text))
+        duplicate = any(
+            text in other['text'] or estimate_jaccard(signature, other_sig) >= dedup_threshold
+            for other, other_sig in zip(kept, signatures)
+        )
+        if duplicate:
+            stats['duplicates_removed'] += 1
+            continue
+        kept.append(dict(chunk, text=text))
+        signatures.append(signature)
+
+    # 2. Merge neighbours from the same source
+    kept, stats['merged'] = _merge_adjacent(kept)
+
+    # 3. Order by relevance and fit into the budget
+    kept.sort(key=_relevance, reverse=True)
+    packed: List[Dict[str, Any]] = []
+    used = 0
+    for chunk in kept:
+        tokens = estimate_tokens(chunk['text'])
+        if token_budget is None or used + tokens <= token_budget:
+            packed.append(chunk)
+            used += tokens
+            continue
+        remaining = token_budget - used
+        # Only truncate when a meaningful part of the chunk still fits
+        if remaining >= min(tokens // 4, 100) and remaining > 20:
+            cut = len(chunk['text']) * remaining // tokens
+            packed.append(dict(chunk, text=chunk['text'][:cut] + "…", truncated=True))
+            used += estimate_tokens(packed[-1]['text'])
+            stats['truncated'] += 1
+        else:
+            stats['dropped_for_budget'] += 1
+
+    stats['output_chunks'] = len(packed)
+    stats['tokens_after'] = used
+    return packed, stats
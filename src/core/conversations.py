@@ -0,0 +1,341 @@
+"""
+Disk-backed conversation store (SQLite in WAL mode).
+
+Messages are stored as compact rows (role, content, a few small flags); the large
+parts of a message (RAG context, tool calls) go into a content-addressed blob
+table, so identical payloads are stored once. Display strings are derived from
+those fields and not stored; they are rebuilt when a loaded message is shown. A session
+keeps only a Conversation handle with the last few messages in memory, and a
+conversation can be resumed by its ID after a restart.
+Conversations belong to an owner (the browser that created them, see
+src.utils.state.session_owner); listing and resuming are limited to the owner.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+from src.utils.chat_display import DISPLAY_KEY
+
+DEFAULT_DB_PATH = os.getenv("MEDRAG_CONVERSATION_DB", os.path.join("local_data", "conversations.db"))
+# Messages a Conversation keeps in memory (enough for the latest page of the chat)
+DEFAULT_WINDOW = int(os.getenv("MEDRAG_CONVERSATION_WINDOW", "20"))
+
+# Message keys stored in the blob table rather than in the message row
+PAYLOAD_KEYS = ("rag_context", "rag_stats", "tool_calls")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    extra TEXT,
+    payload_hash TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS messages_payload ON messages (payload_hash);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+@dataclass(slots=True)
+class MessageRecord:
+    """One stored message row; the payload is referenced by hash."""
+    seq: int
+    role: str
+    content: str
+    extra: Optional[Dict[str, Any]] = None
+    payload_hash: Optional[str] = None
+
+
+@dataclass(slots=True)
+class ConversationInfo:
+    id: str
+    kind: str
+    title: str
+    created_at: float
+    updated_at: float
+    message_count: int
+    owner: str = ""
+
+
+def _to_jsonable(value: Any) -> Any:
+    # camel ToolCallingRecord and other pydantic models
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if hasattr(value, "dict") and not isinstance(value, dict):
+        return value.dict()
+    return str(value)
+
+
+def split_message(message: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Split a chat message dict into its row fields and its payload (None when empty); the display payload is dropped."""
+    extra = {k: v for k, v in message.items()
+             if k not in ("role", "content", DISPLAY_KEY) and k not in PAYLOAD_KEYS}
+    payload = {k: message[k] for k in PAYLOAD_KEYS if message.get(k)}
+    return extra, payload or None
+
+
+class ConversationStore:
+    """
+    SQLite store for QA and simulation conversations. One connection is shared
+    by the threads of this process under a lock; WAL mode lets readers in other
+    processes (e.g. a second app instance) run alongside the writer.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, window: int = DEFAULT_WINDOW):
+        self.path = path
+        self.window = window
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")}
+        if "owner" not in columns:
+            # Databases from before owners; their conversations belong to nobody
+            self._conn.execute("ALTER TABLE conversations ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS conversations_owner_kind_updated "
+                           "ON conversations (owner, kind, updated_at)")
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- conversations ---
+
+    def create(self, kind: str, title: str = "", owner: str = "") -> "Conversation":
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO conversations (id, kind, owner, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (conversation_id, kind, owner, title, now, now),
+            )
+        return Conversation(self, conversation_id, kind, 0, [])
+
+    def open(self, conversation_id: str, owner: Optional[str] = None) -> Optional["Conversation"]:
+        """
+        Resume a stored conversation; its last `window` messages are loaded into memory.
+        With `owner`, a conversation of another owner is treated as missing.
+        """
+        info = self.info(conversation_id)
+        if info is None or (owner is not None and info.owner != owner):
+            return None
+        start = max(0, info.message_count - self.window)
+        recent = self.load(conversation_id, start, info.message_count)
+        return Conversation(self, conversation_id, info.kind, info.message_count, recent)
+
+    def info(self, conversation_id: str) -> Optional[ConversationInfo]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, title, created_at, updated_at, message_count, owner FROM conversations WHERE id = ?",
+                (conversation_id,),
+            ).fetchone()
+        return ConversationInfo(*row) if row else None
+
+    def list(self, kind: Optional[str] = None, limit: int = 20,
+             owner: Optional[str] = None) -> List[ConversationInfo]:
+        """Most recently updated conversations with at least one message (of `owner` only, if given)."""
+        query = ("SELECT id, kind, title, created_at, updated_at, message_count, owner FROM conversations "
+                 "WHERE message_count > 0")
+        params: List[Any] = []
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        query += " ORDER BY updated_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [ConversationInfo(*row) for row in rows]
+
+    def delete(self, conversation_id: str):
+        """Delete a conversation and the payload blobs no other message references."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                hashes = [row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT payload_hash FROM messages WHERE conversation_id = ? AND payload_hash IS NOT NULL",
+                    (conversation_id,),
+                )]
+                self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+                for payload_hash in hashes:
+                    self._conn.execute(
+                        "DELETE FROM blobs WHERE hash = ? AND NOT EXISTS "
+                        "(SELECT 1 FROM messages WHERE payload_hash = ?)",
+                        (payload_hash, payload_hash),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # --- messages ---
+
+    def _put_blob(self, payload: Dict[str, Any]) -> str:
+        data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=_to_jsonable).encode("utf-8")
+        payload_hash = hashlib.sha256(data).hexdigest()
+        self._conn.execute(
+            "INSERT OR IGNORE INTO blobs (hash, data, size) VALUES (?, ?, ?)",
+            (payload_hash, zlib.compress(data), len(data)),
+        )
+        return payload_hash
+
+    def append(self, conversation_id: str, message: Dict[str, Any]) -> MessageRecord:
+        """Store one message at the end of the conversation and return its row."""
+        extra, payload = split_message(message)
+        now = time.time()
+        content = str(message.get("content") or "")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq, title = self._conn.execute(
+                    "SELECT message_count, title FROM conversations WHERE id = ?", (conversation_id,)
+                ).fetchone()
+                payload_hash = self._put_blob(payload) if payload else None
+                self._conn.execute(
+                    "INSERT INTO messages (conversation_id, seq, role, content, extra, payload_hash, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (conversation_id, seq, message["role"], content,
+                     json.dumps(extra, ensure_ascii=False, default=str) if extra else None, payload_hash, now),
+                )
+                if not title and message["role"] == "user":
+                    title = content.split("\n")[0][:40]
+                self._conn.execute(
+                    "UPDATE conversations SET message_count = ?, updated_at = ?, title = ? WHERE id = ?",
+                    (seq + 1, now, title, conversation_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return MessageRecord(seq, message["role"], content, extra or None, payload_hash)
+
+    def records(self, conversation_id: str, start: int, end: int) -> List[MessageRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content, extra, payload_hash FROM messages "
+                "WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (conversation_id, start, end),
+            ).fetchall()
+        return [MessageRecord(seq, role, content, json.loads(extra) if extra else None, payload_hash)
+                for seq, role, content, extra, payload_hash in rows]
+
+    def payload(self, payload_hash: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM blobs WHERE hash = ?", (payload_hash,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else {}
+
+    def load(self, conversation_id: str, start: int, end: int) -> List[Dict[str, Any]]:
+        """Messages [start, end) as chat message dicts, payloads included."""
+        messages = []
+        for record in self.records(conversation_id, start, end):
+            message: Dict[str, Any] = {"role": record.role, "content": record.content}
+            if record.extra:
+                message.update(record.extra)
+            if record.payload_hash:
+                message.update(self.payload(record.payload_hash))
+            messages.append(message)
+        return messages
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            conversations, = self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()
+            messages, = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()
+            blobs, blob_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {"conversations": conversations, "messages": messages, "blobs": blobs, "blob_bytes": blob_bytes}
+
+
+class Conversation:
+    """
+    List-like handle to a stored conversation, used in place of the message lists
+    in session state: append/extend write through to the store, len() and indexing
+    cover the whole conversation, and only the last `store.window` messages are
+    held in memory (older ones are read back from SQLite when indexed).
+    """
+
+    def __init__(self, store: ConversationStore, conversation_id: str, kind: str, count: int,
+                 recent: List[Dict[str, Any]]):
+        self.store = store
+        self.id = conversation_id
+        self.kind = kind
+        self._count = count
+        self._window: Deque[Dict[str, Any]] = deque(recent, maxlen=store.window)
+
+    def append(self, message: Dict[str, Any]):
+        self.store.append(self.id, message)
+        self._window.append(message)
+        self._count += 1
+
+    def extend(self, messages: List[Dict[str, Any]]):
+        for message in messages:
+            self.append(message)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if stop <= start:
+                return []
+            window_start = self._count - len(self._window)
+            if start >= window_start:
+                return list(self._window)[start - window_start:stop - window_start]
+            return self.store.load(self.id, start, stop)
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("conversation index out of range")
+        return self[index:index + 1][0]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # Page through the store so iterating a long conversation stays bounded in memory
+        for start in range(0, self._count, self.store.window):
+            yield from self[start:start + self.store.window]
+
+    def __repr__(self) -> str:
+        return f"Conversation(id={self.id!r}, kind={self.kind!r}, messages={self._count})"
+
+
+_shared_store: Optional[ConversationStore] = None
+_shared_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Process-wide store at MEDRAG_CONVERSATION_DB, shared by all sessions."""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = ConversationStore()
+        return _shared_store
@@ -0,0 +1,225 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from camel.embeddings import OpenAICompatibleEmbedding
+from camel.embeddings.base import BaseEmbedding
+
+from src.utils.coalesce import MicroBatcher, SingleFlight
+from src.utils.resilience import ResilientCaller, get_caller
+from src.utils.telemetry import telemetry
+
+# Concurrent single-text embedding requests are merged into one provider call
+EMBED_MAX_BATCH = int(os.getenv("MEDRAG_EMBED_MAX_BATCH", "10"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("MEDRAG_EMBED_BATCH_WAIT_MS", "5"))
+
+
+class HashingEmbedding(BaseEmbedding[str]):
+    """
+    Deterministic offline embedding: signed feature hashing of character
+    1-3-grams, L2-normalized. No network and no model files, so tests, load
+    tests and offline demos can build and query real knowledge bases.
+    Cosine similarity reflects lexical overlap, which works reasonably for Chinese.
+    """
+
+    def __init__(self, model_type: str = "local-hashing", output_dim: int = 512, ngram_range: Tuple[int, int] = (1, 3)):
+        self.model_type = model_type
+        self.output_dim = output_dim
+        self.ngram_range = ngram_range
+
+    def _embed(self, text: str) -> List[float]:
+        chars = "".join(text.lower().split())
+        codes = np.frombuffer(chars.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        low, high = self.ngram_range
+        parts = []
+        for n in range(low, high + 1):
+            count = len(codes) - n + 1
+            if count <= 0:
+                continue
+            # Polynomial hash of each n-gram, then a murmur3 finalizer (uint64 arithmetic wraps)
+            h = np.full(count, n, dtype=np.uint64)
+            for j in range(n):
+                h = h * np.uint64(1000003) + codes[j:j + count]
+            h ^= h >> np.uint64(33)
+            h *= np.uint64(0xFF51AFD7ED558CCD)
+            h ^= h >> np.uint64(33)
+            parts.append(h)
+        if not parts:
+            return [0.0] * self.output_dim
+        hashes = np.concatenate(parts)
+        signs = np.where(hashes >> np.uint64(63), 1.0, -1.0)
+        vector = np.bincount((hashes % np.uint64(self.output_dim)).astype(np.int64), weights=signs,
+                             minlength=self.output_dim).astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_list(self, objs: List[str], **kwargs: Any) -> List[List[float]]:
+        return [self._embed(obj) for obj in objs]
+
+    def get_output_dim(self) -> int:
+        return self.output_dim
+
+
+class InstrumentedEmbedding(BaseEmbedding[str]):
+    """Wraps an embedding model and records a span for every provider call."""
+
+    def __init__(self, model: BaseEmbedding):
+        self.model = model
+
+    def embed_list(self, objs: List[str], **kwargs: Any) -> List[List[float]]:
+        with telemetry.span("rag.embedding", num_texts=len(objs)):
+            return self.model.embed_list(objs, **kwargs)
+
+    def get_output_dim(self) -> int:
+        return self.model.get_output_dim()
+
+    def __getattr__(self, name: str) -> Any:
+        # Expose attributes of the wrapped model (model_type, output_dim, ...)
+        return getattr(self.__dict__["model"], name)
+
+
+class ResilientEmbedding(BaseEmbedding[str]):
+    """Runs provider calls under a ResilientCaller: deadline, hedging, retry budget and circuit breaker."""
+
+    def __init__(self, model: BaseEmbedding, caller: ResilientCaller):
+        self.model = model
+        self.caller = caller
+
+    def embed_list(self, objs: List[str], **kwargs: Any) -> List[List[float]]:
+        return self.caller.call(lambda: self.model.embed_list(objs, **kwargs))
+
+    def get_output_dim(self) -> int:
+        return self.model.get_output_dim()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__dict__["model"], name)
+
+
+class CachedEmbedding(BaseEmbedding[str]):
+    """
+    LRU cache of query embeddings in front of an embedding model.
+    Only calls with at most `max_batch` texts are cached, so ingestion batches
+    go straight to the model and do not flush the cached questions.
+    """
+
+    def __init__(self, model: BaseEmbedding, max_entries: int = 1024, max_batch: int = 1):
+        self.model = model
+        self.max_entries = max_entries
+        self.max_batch = max_batch
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_list(self, objs: List[str], **kwargs: Any) -> List[List[float]]:
+        if kwargs or len(objs) > self.max_batch:
+            return self.model.embed_list(objs, **kwargs)
+
+        with self._lock:
+            cached = [self._cache.get(text) for text in objs]
+            for text, vector in zip(objs, cached):
+                if vector is not None:
+                    self._cache.move_to_end(text)
+        for vector in cached:
+            telemetry.record_cache("embedding", vector is not None)
+
+        missing = [text for text, vector in zip(objs, cached) if vector is None]
+        if missing:
+            fresh = dict(zip(missing, self.model.embed_list(missing)))
+            with self._lock:
+                for text, vector in fresh.items():
+                    self._cache[text] = np.asarray(vector, dtype=np.float32)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            cached = [fresh[text] if vector is None else vector for text, vector in zip(objs, cached)]
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in cached]
+
+    def warm(self, texts: List[str]):
+        """Embed the uncached texts in one provider call, e.g. before a batch of queries."""
+        with self._lock:
+            missing = list(dict.fromkeys(t for t in texts if t not in self._cache))
+        if not missing:
+            return
+        vectors = self.model.embed_list(missing)
+        with self._lock:
+            for text, vector in zip(missing, vectors):
+                self._cache[text] = np.asarray(vector, dtype=np.float32)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def get_output_dim(self) -> int:
+        return self.model.get_output_dim()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__dict__["model"], name)
+
+
+class CoalescingEmbedding(BaseEmbedding[str]):
+    """
+    Single-flight and micro-batching in front of an embedding model.
+    Concurrent requests for the same text share one in-flight call; different
+    texts requested within a few milliseconds are sent as one batch.
+    Multi-text calls (ingestion) go straight to the model.
+    """
+
+    def __init__(self, model: BaseEmbedding, max_batch: int = EMBED_MAX_BATCH,
+                 max_wait: float = EMBED_BATCH_WAIT_MS / 1000):
+        self.model = model
+        self._flight = SingleFlight("embedding")
+        self._batcher = MicroBatcher("embedding", self.model.embed_list, max_batch=max_batch, max_wait=max_wait)
+
+    def embed_list(self, objs: List[str], **kwargs: Any) -> List[List[float]]:
+        if kwargs or len(objs) != 1:
+            return self.model.embed_list(objs, **kwargs)
+        text = objs[0]
+        return [self._flight.do(text, lambda: self._batcher.submit(text))]
+
+    def get_output_dim(self) -> int:
+        return self.model.get_output_dim()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__dict__["model"], name)
+
+
+_shared_models: Dict[Tuple[str, str, str], BaseEmbedding] = {}
+_shared_providers: Dict[Tuple[str, str, str], Any] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_embedding_model(model_type: str, api_key: str, url: str, output_dim: Optional[int] = None) -> BaseEmbedding:
+    """
+    Process-wide embedding model per configuration, shared by all sessions so
+    that query caching, request coalescing and the HTTP connection pool work
+    across users: CachedEmbedding -> CoalescingEmbedding -> ResilientEmbedding -> InstrumentedEmbedding -> provider.
+    A known output_dim (KB metadata, connection check) is recorded on the provider,
+    so get_output_dim() does not send a probe request.
+    """
+    key = (model_type, api_key, url)
+    with _shared_lock:
+        model = _shared_models.get(key)
+        if model is None:
+            caller = get_caller("embedding", url)
+            provider = OpenAICompatibleEmbedding(model_type=model_type, api_key=api_key, url=url, output_dim=output_dim)
+            # Deadlines and retries are handled by the ResilientCaller, not the client's own retry loop
+            provider._client = provider._client.with_options(timeout=caller.policy.deadline_s, max_retries=0)
+            _shared_providers[key] = provider
+            model = _shared_models[key] = CachedEmbedding(CoalescingEmbedding(ResilientEmbedding(
+                InstrumentedEmbedding(provider), caller
+            )))
+        elif output_dim and _shared_providers[key].output_dim is None:
+            _shared_providers[key].output_dim = output_dim
+        return model
+
+
+def probe_embedding_model(model_type: str, api_key: str, url: str) -> int:
+    """
+    Send one uncached embedding request through the shared model's client (and its
+    ResilientCaller) and return the embedding dimension; warms the connection pool.
+    """
+    shared = shared_embedding_model(model_type, api_key, url)
+    # Below the cache and the coalescer, so every probe reaches the provider
+    resilient = shared.model.model
+    return len(resilient.embed_list(["ping"])[0])
@@ -0,0 +1,310 @@
+import json
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.lazy import lazy_import
+
+VectorRecord = lazy_import("camel.storages", "VectorRecord")
+
+# Parent sections are stored next to the index; only the child chunks are embedded
+PARENTS_FILE = "parents.json"
+
+CHILD_CHARS = 300
+PARENT_MAX_CHARS = 1500
+# Child hits fetched per requested parent, since several children usually share a parent
+CHILDREN_PER_PARENT = 3
+
+# Longer lines are paragraphs, even if they start like a heading
+MAX_HEADING_CHARS = 40
+
+_NUM = "一二三四五六七八九十百零〇"
+# 童 and — are frequent OCR errors for 章 and 一 in the textbook scan
+CHAPTER_RE = re.compile(rf"^第[{_NUM}\d]+[章童]")
+SECTION_RE = re.compile(rf"^第[{_NUM}\d]+节")
+SUBSECTION_RE = re.compile(rf"(?:[{_NUM}]+|—)、")
+MARKDOWN_RE = re.compile(r"^(#{1,6})\s+(.+)$")
+_SENTENCE_RE = re.compile(r"[^。！？；!?;\n]*[。！？；!?;]|[^。！？；!?;\n]+")
+
+SECTION_SEPARATOR = " > "
+
+
+@dataclass
+class ParentChunk:
+    """A section of a document: the unit returned to the prompt."""
+    parent_id: str
+    source: str
+    ordinal: int
+    path: List[str]
+    text: str
+
+    @property
+    def section(self) -> str:
+        return SECTION_SEPARATOR.join(p for p in self.path if p)
+
+
+@dataclass
+class ChildChunk:
+    """A small piece of a parent section: the unit that is embedded and matched."""
+    text: str
+    parent_id: str
+    ordinal: int
+
+
+def section_prefixes(section: str) -> List[str]:
+    """Cumulative prefixes of a section path, so an exact match on a chapter selects all of its sections."""
+    parts = [p for p in section.split(SECTION_SEPARATOR) if p] if section else []
+    return [SECTION_SEPARATOR.join(parts[:i + 1]) for i in range(len(parts))]
+
+
+def _sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_RE.findall(text) if s.strip()]
+
+
+def _pack(pieces: List[str], max_chars: int, sep: str) -> List[str]:
+    """Greedily join pieces up to max_chars; pieces longer than that are cut."""
+    groups: List[str] = []
+    current = ""
+    for piece in pieces:
+        while len(piece) > max_chars:
+            if current:
+                groups.append(current)
+                current = ""
+            groups.append(piece[:max_chars])
+            piece = piece[max_chars:]
+        if current and len(current) + len(sep) + len(piece) > max_chars:
+            groups.append(current)
+            current = ""
+        current = f"{current}{sep}{piece}" if current else piece
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _clean_title(title: str) -> str:
+    return title.replace("童", "章").replace("—、", "一、")
+
+
+def _parse_heading(line: str) -> Optional[Tuple[int, str, str]]:
+    """
+    Classify a short line as (level, title, subsection title) or None.
+    Level 1 is a chapter, 2 a section, 3 a subsection.
+    """
+    md = MARKDOWN_RE.match(line)
+    if md:
+        return min(len(md.group(1)), 3), md.group(2).strip(), ""
+    if len(line) > MAX_HEADING_CHARS:
+        return None
+    if CHAPTER_RE.match(line):
+        return 1, _clean_title(line), ""
+    if SECTION_RE.match(line):
+        # "第三节药物的体内过程—、吸收": the first subsection title is on the same line
+        sub = SUBSECTION_RE.search(line, 3)
+        if sub:
+            return 2, line[:sub.start()], _clean_title(line[sub.start():])
+        return 2, line, ""
+    if SUBSECTION_RE.match(line):
+        return 3, _clean_title(line), ""
+    return None
+
+
+def parse_outline(text: str, source: str, max_chars: int = PARENT_MAX_CHARS) -> List[ParentChunk]:
+    """
+    Split a document into parent sections along its headings.
+
+    Markdown headings set chapters explicitly. In plain text the chapter title
+    is a running page header ("第二章临床药动学") that repeats inside the chapter
+    rather than opening it, so those lines are dropped from the text, chapters
+    are delimited by the section numbering restarting at 第一节, and each
+    chapter is named after its most frequent running header.
+    Sections longer than max_chars are split at paragraph boundaries.
+    """
+    chapter_idx = 0
+    seen_section = False
+    explicit_names: Dict[int, str] = {}
+    header_counts: Dict[int, Counter] = {}
+    section, subsection = "", ""
+    paragraphs: List[str] = []
+    blocks: List[Tuple[int, str, str, List[str]]] = []
+
+    def flush():
+        if paragraphs:
+            blocks.append((chapter_idx, section, subsection, list(paragraphs)))
+            paragraphs.clear()
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        heading = _parse_heading(line)
+        if heading is None:
+            paragraphs.append(line)
+            continue
+        level, title, sub_title = heading
+        if level == 1:
+            if line.startswith("#"):
+                flush()
+                if seen_section or chapter_idx in explicit_names:
+                    chapter_idx += 1
+                explicit_names[chapter_idx] = title
+                seen_section = False
+                section, subsection = "", ""
+            else:
+                header_counts.setdefault(chapter_idx, Counter())[title] += 1
+            continue
+        flush()
+        if level == 2:
+            if seen_section and re.match(r"^第[一1]节", title):
+                chapter_idx += 1
+            seen_section = True
+            section, subsection = title, sub_title
+        else:
+            subsection = title
+
+    flush()
+
+    def chapter_name(idx: int) -> str:
+        if idx in explicit_names:
+            return explicit_names[idx]
+        counts = header_counts.get(idx)
+        return counts.most_common(1)[0][0] if counts else ""
+
+    parents: List[ParentChunk] = []
+    for idx, sec, sub, block_paragraphs in blocks:
+        pieces: List[str] = []
+        for paragraph in block_paragraphs:
+            pieces.extend(_pack(_sentences(paragraph), max_chars, "") if len(paragraph) > max_chars else [paragraph])
+        for part in _pack(pieces, max_chars, "\n"):
+            ordinal = len(parents)
+            parents.append(ParentChunk(
+                parent_id=f"{source}#{ordinal}",
+                source=source,
+                ordinal=ordinal,
+                path=[chapter_name(idx), sec, sub],
+                text=part,
+            ))
+    return parents
+
+
+def split_children(parent: ParentChunk, max_chars: int = CHILD_CHARS, start: int = 0) -> List[ChildChunk]:
+    """Sentence-aligned child chunks of a parent, numbered from `start`."""
+    return [
+        ChildChunk(text=text, parent_id=parent.parent_id, ordinal=start + i)
+        for i, text in enumerate(_pack(_sentences(parent.text), max_chars, ""))
+    ]
+
+
+def outline_document(text: str, source: str, start: int = 0) -> Tuple[List[ParentChunk], List[ChildChunk]]:
+    """Parent sections of one document's text and their child chunks, numbered from `start`."""
+    parents = parse_outline(text, source)
+    children: List[ChildChunk] = []
+    for parent in parents:
+        children.extend(split_children(parent, start=start + len(children)))
+    return parents, children
+
+
+def build_hierarchy(file_paths: List[str]) -> Tuple[List[ParentChunk], List[ChildChunk]]:
+    """Parse text/markdown files into parent sections and their child chunks."""
+    parents: List[ParentChunk] = []
+    children: List[ChildChunk] = []
+    for file_path in file_paths:
+        with open(file_path, encoding="utf-8", errors="ignore") as f:
+            file_parents, file_children = outline_document(f.read(), os.path.basename(file_path))
+        parents.extend(file_parents)
+        children.extend(file_children)
+    return parents, children
+
+
+def index_document(embedding_model: Any, storage: Any, path: str, text: str,
+                   embed_batch: int = 10, dedup: Any = None) -> List[ParentChunk]:
+    """
+    Embed the child chunks of one document whose text is already extracted (see
+    parsing.parse_documents) into storage and return its parents. Children are
+    embedded together with their section path so short chunks keep their topic;
+    the payload keeps the plain child text and the parent id. Children rejected
+    by `dedup` (a compaction.IngestDeduplicator) are not embedded.
+    """
+    parents, children = outline_document(text, os.path.basename(path))
+    if dedup is not None:
+        children = [c for c in children if dedup.claim(c.text)]
+    _index_children(embedding_model, storage, parents, children, {os.path.basename(path): path}, embed_batch)
+    return parents
+
+
+def _index_children(embedding_model: Any, storage: Any, parents: List[ParentChunk], children: List[ChildChunk],
+                    paths: Dict[str, str], embed_batch: int):
+    by_id = {p.parent_id: p for p in parents}
+    for start in range(0, len(children), embed_batch):
+        batch = children[start:start + embed_batch]
+        batch_parents = [by_id[c.parent_id] for c in batch]
+        vectors = embedding_model.embed_list(
+            [f"{p.section}\n{c.text}" if p.section else c.text for c, p in zip(batch, batch_parents)]
+        )
+        storage.add([
+            VectorRecord(vector=vector, payload={
+                "content path": paths.get(parent.source, parent.source),
+                "metadata": {
+                    "filename": parent.source,
+                    "piece_num": child.ordinal,
+                    "parent_id": parent.parent_id,
+                    "section": parent.section,
+                },
+                "extra_info": {},
+                "text": child.text,
+            })
+            for vector, child, parent in zip(vectors, batch, batch_parents)
+        ])
+
+
+def save_parents(kb_path: str, parents: List[ParentChunk]):
+    path = os.path.join(kb_path, PARENTS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([asdict(p) for p in parents], f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_parents(kb_path: str) -> Optional[Dict[str, ParentChunk]]:
+    """Parent sections of a hierarchical KB by id, or None for a flat KB."""
+    path = os.path.join(kb_path, PARENTS_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {p["parent_id"]: ParentChunk(**p) for p in json.load(f)}
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        print(f"Failed to read {path}: {e}")
+        return None
+
+
+def expand_to_parents(results: List[Dict[str, Any]], parents: Dict[str, ParentChunk],
+                      top_k: int) -> List[Dict[str, Any]]:
+    """
+    Replace matched child chunks by their parent sections, one entry per parent.
+    A parent keeps the score of its best child; results without a known parent
+    are passed through unchanged.
+    """
+    def relevance(res: Dict[str, Any]) -> float:
+        return float(res.get('rerank_score', res.get('similarity', 0.0)))
+
+    expanded: Dict[Any, Dict[str, Any]] = {}
+    for res in sorted(results, key=relevance, reverse=True):
+        parent = parents.get(res.get('parent_id'))
+        if parent is None:
+            expanded[id(res)] = res
+            continue
+        if parent.parent_id in expanded:
+            expanded[parent.parent_id]['matched_children'] += 1
+            continue
+        expanded[parent.parent_id] = {
+            **res,
+            'text': parent.text,
+            'source': parent.source,
+            'chunk_index': parent.ordinal,
+            'section': parent.section,
+            'matched_text': res.get('text', ''),
+            'matched_children': 1,
+        }
+    return list(expanded.values())[:top_k]
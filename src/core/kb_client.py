@@ -0,0 +1,223 @@
+import base64
+import http.client
+import json
+import queue
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from src.core.kb_meta import KnowledgeBaseMeta
+from src.core.rag import RAGManager, CHUNKING_FLAT
+from src.core.rerank import BaseReranker, DEFAULT_OVERFETCH, MAX_CANDIDATES, rerank_results
+from src.utils.resilience import ProviderUnavailable
+from src.utils.telemetry import telemetry
+
+
+class KBServiceUnavailable(ProviderUnavailable):
+    """The knowledge-base service could not be reached or returned an error."""
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections to one host, reused across threads."""
+
+    def __init__(self, base_url: str, timeout: float = 30.0, size: int = 8):
+        parsed = urlparse(base_url)
+        if parsed.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported KB service URL: {base_url}")
+        self._connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.prefix = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=size)
+
+    def _connection(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None):
+        """Returns (status, body bytes). A reused connection closed by the server is retried once."""
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        while True:
+            conn, reused = self._connection()
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return response.status, data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class RemoteRAGManager(RAGManager):
+    """
+    RAGManager backed by the knowledge-base service (src.core.kb_service).
+    Same interface, so the UI, tools and agents use it unchanged. Temporary
+    in-memory retrievers for the simulation stay local.
+    """
+
+    def __init__(self, base_url: str, tenant: str = "", timeout: float = 30.0, pool_size: int = 8):
+        self.base_url = base_url
+        self.tenant = tenant
+        self.base_path = None
+        self.documents = []
+        self.vector_store_status = "Not Initialized"
+        self.retriever = None
+        self.storage = None
+        self.current_kb_name = None
+        self.current_kb_meta: Optional[KnowledgeBaseMeta] = None
+        self.parents = None
+        self._kb_list_cache = None
+        self._query_embedding = None
+        self._pool = ConnectionPool(base_url, timeout=timeout, size=pool_size)
+
+    def _call(self, action: str, **payload: Any) -> Dict[str, Any]:
+        body = json.dumps({"tenant": self.tenant, **payload}, ensure_ascii=False).encode("utf-8")
+        try:
+            status, data = self._pool.request("POST", f"/v1/{action}", body)
+        except (http.client.HTTPException, OSError) as e:
+            raise KBServiceUnavailable(f"KB service {self.base_url} unreachable: {e}") from e
+        try:
+            result = json.loads(data or b"{}")
+        except ValueError:
+            result = {"error": data[:200].decode("utf-8", "replace")}
+        if status != 200:
+            raise KBServiceUnavailable(result.get("error") or f"HTTP {status}")
+        return result
+
+    def _set_kb(self, state: Dict[str, Any]):
+        meta = state.get("meta")
+        self.current_kb_meta = KnowledgeBaseMeta(**meta) if meta else None
+        self.current_kb_name = state.get("kb")
+        self.documents = list(self.current_kb_meta.files) if self.current_kb_meta else []
+        self.vector_store_status = state.get("status", self.vector_store_status)
+
+    def list_knowledge_bases(self) -> List[str]:
+        try:
+            return self._call("list_kbs")["kbs"]
+        except KBServiceUnavailable as e:
+            print(f"List knowledge bases failed: {e}")
+            return []
+
+    def invalidate_kb_cache(self):
+        pass
+
+    def get_kb_meta(self, kb_name: str) -> Optional[KnowledgeBaseMeta]:
+        try:
+            meta = self._call("kb_meta", kb=kb_name)["meta"]
+        except KBServiceUnavailable as e:
+            print(f"Read KB meta failed: {e}")
+            return None
+        return KnowledgeBaseMeta(**meta) if meta else None
+
+    def load_knowledge_base(self, kb_name: str) -> bool:
+        try:
+            self._set_kb(self._call("load", kb=kb_name))
+            return True
+        except KBServiceUnavailable as e:
+            self.vector_store_status = f"❌ 加载失败: {str(e)}"
+            return False
+
+    def process_files(self, kb_name: str, uploaded_files: List[Any], chunking: str = CHUNKING_FLAT,
+                      storage: Optional[str] = None, coarse_dim: Optional[int] = None) -> str:
+        if not uploaded_files or not kb_name:
+            return "❌ 请提供知识库名称和文件"
+        files = [
+            {"name": f.name, "content_b64": base64.b64encode(bytes(f.getbuffer())).decode("ascii")}
+            for f in uploaded_files
+        ]
+        try:
+            with telemetry.span("kb_client.ingest", kb=kb_name, num_files=len(files)):
+                state = self._call("ingest", kb=kb_name, files=files, chunking=chunking, storage=storage,
+                                   coarse_dim=coarse_dim)
+        except KBServiceUnavailable as e:
+            print(f"❌ 处理失败: {str(e)}")
+            return "处理失败"
+        if state.get("kb") == kb_name:
+            self._set_kb(state)
+        return state.get("message", "处理失败")
+
+    def compact_knowledge_base(self, kb_name: str, **options: Any):
+        from src.core.compaction import CompactionReport
+
+        report = CompactionReport(**self._call("compact", kb=kb_name, **options)["report"])
+        if self.current_kb_name == kb_name and not report.dry_run:
+            self.load_knowledge_base(kb_name)
+        return report
+
+    def list_filter_options(self) -> Dict[str, List[str]]:
+        if not self.current_kb_name:
+            return {"source": [], "section": []}
+        try:
+            return self._call("filter_options", kb=self.current_kb_name)
+        except KBServiceUnavailable as e:
+            print(f"Read filter options failed: {e}")
+            return {"source": [], "section": []}
+
+    def embed_query(self, query: str) -> List[float]:
+        return self._call("embed", kb=self.current_kb_name, texts=[query])["vectors"][0]
+
+    def retrieve_batch(self, queries: List[str], threshold: float, top_k: int,
+                       reranker: Optional[BaseReranker] = None, overfetch: int = DEFAULT_OVERFETCH,
+                       filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        The lexical reranker runs in the service. Other rerankers (the LLM one needs
+        the session's model config) rerank the overfetched candidates locally.
+        Raises KBServiceUnavailable (a ProviderUnavailable) like RAGManager.retrieve does.
+        """
+        if not self.current_kb_name:
+            return [[] for _ in queries]
+        remote_rerank = reranker is not None and reranker.name == "lexical"
+        fetch_k = top_k
+        if reranker is not None and not remote_rerank:
+            fetch_k = min(max(top_k * overfetch, top_k), MAX_CANDIDATES)
+        with telemetry.span("rag.retrieve", kb=self.current_kb_name, top_k=top_k, threshold=threshold,
+                            remote=True, num_queries=len(queries)) as span:
+            try:
+                batches = self._call(
+                    "retrieve",
+                    kb=self.current_kb_name,
+                    queries=queries,
+                    threshold=threshold,
+                    top_k=fetch_k,
+                    rerank="lexical" if remote_rerank else None,
+                    overfetch=overfetch,
+                    filters=filters or None,
+                )["results"]
+            except KBServiceUnavailable as e:
+                span.status = "degraded"
+                span.error = str(e)
+                raise
+        if reranker is not None and not remote_rerank:
+            batches = [rerank_results(q, results, reranker, top_k) for q, results in zip(queries, batches)]
+        return batches
+
+    def retrieve(self, query: str, threshold: float, top_k: int,
+                 reranker: Optional[BaseReranker] = None, overfetch: int = DEFAULT_OVERFETCH,
+                 filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self.retrieve_batch([query], threshold, top_k, reranker, overfetch, filters)[0]
+
+    def health(self) -> Dict[str, Any]:
+        status, data = self._pool.request("GET", "/v1/health")
+        return json.loads(data) if status == 200 else {"status": f"HTTP {status}"}
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Written next to the Qdrant files (Qdrant itself owns `meta.json`)
+KB_META_FILE = "kb_meta.json"
+META_VERSION = 1
+
+
+@dataclass
+class KnowledgeBaseMeta:
+    """Build information stored with each knowledge base so it can be opened without network calls."""
+    name: str
+    embedding_model: str
+    dimension: int
+    chunk_count: int = 0
+    build_time: str = ""
+    content_hash: str = ""
+    files: List[str] = field(default_factory=list)
+    # "flat" (camel default chunking) or "hierarchical" (parent sections + child chunks)
+    chunking: str = "flat"
+    # Chunks carry the top-level source/section/ordinal/ingest-time payload used by filters
+    payload_indexed: bool = False
+    # Per source file: parse metadata (format, chars, pages/headings/...) from the parsing stage
+    file_info: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # "qdrant" (local collection loaded into memory) or "sharded" (memory-mapped shard files)
+    storage: str = "qdrant"
+    # Length of the truncated vectors searched first (two-stage search), None for full-dimension search
+    coarse_dim: Optional[int] = None
+    version: int = META_VERSION
+
+    @property
+    def kb_version(self) -> str:
+        """Identifier that changes whenever the indexed content changes."""
+        return f"{self.content_hash[:16]}@{self.build_time}"
+
+    def save(self, kb_path: str):
+        """Write the metadata atomically so a crash never leaves a half-written file."""
+        path = os.path.join(kb_path, KB_META_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, kb_path: str) -> Optional["KnowledgeBaseMeta"]:
+        """Read the metadata file of a knowledge base, or None if missing or unreadable."""
+        path = os.path.join(kb_path, KB_META_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            known = {k: v for k, v in data.items() if k in cls.__dataclass_fields__}
+            return cls(**known)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Failed to read {path}: {e}")
+            return None
+
+
+def compute_content_hash(file_paths: List[str]) -> str:
+    """SHA-256 over the names and bytes of the given files, independent of their order."""
+    digest = hashlib.sha256()
+    for file_path in sorted(file_paths, key=os.path.basename):
+        digest.update(os.path.basename(file_path).encode("utf-8"))
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def now_iso() -> str:
+    return datetime.now().isoformat(timespec="seconds")
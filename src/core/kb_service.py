@@ -0,0 +1,286 @@
+"""
+Knowledge-base service: RAGManager ingestion and retrieval behind a local HTTP API,
+so all UI workers on a node share one warm index per knowledge base.
+
+    python -m src.core.kb_service --port 8765 --base-path local_data
+
+The UI uses it when MEDRAG_KB_SERVICE_URL is set (see src.core.kb_client).
+Each tenant's knowledge bases live in their own directory under base_path:
+default/ for the default tenant ("") and tenants/<tenant>/ for named tenants.
+Embedding credentials come from OPENAI_API_KEY / OPENAI_BASE_URL.
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import threading
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.rag import RAGManager
+from src.core.rerank import get_reranker
+from src.utils.coalesce import SingleFlight
+from src.utils.resilience import ProviderUnavailable
+from src.utils.telemetry import telemetry
+
+API_PREFIX = "/v1/"
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# Tenant and KB names become directory names
+_NAME_RE = re.compile(r"[\w\-]+")
+DEFAULT_TENANT_DIR = "default"
+TENANTS_DIR = "tenants"
+
+
+class KBServiceError(Exception):
+    """Request error reported to the client with an HTTP status."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class _Upload:
+    """Minimal stand-in for a Streamlit UploadedFile."""
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self._data = data
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self._data)
+
+
+def _check_name(name: Any, what: str, allow_empty: bool = False) -> str:
+    if name in (None, "") and allow_empty:
+        return ""
+    if not isinstance(name, str) or not _NAME_RE.fullmatch(name):
+        raise KBServiceError(f"invalid {what}: {name!r}")
+    return name
+
+
+class KBService:
+    """
+    Keeps one RAGManager per (tenant, knowledge base), loaded on first use.
+    Tenant "" uses base_path/default; other tenants use base_path/tenants/<tenant>,
+    so no tenant's directory is inside another's.
+    """
+
+    def __init__(self, base_path: str = "local_data"):
+        self.base_path = base_path
+        self._managers: Dict[Tuple[str, str], RAGManager] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._retrievals = SingleFlight("kb_service.retrieve")
+
+    def _tenant_path(self, tenant: str) -> str:
+        if not tenant:
+            return os.path.join(self.base_path, DEFAULT_TENANT_DIR)
+        return os.path.join(self.base_path, TENANTS_DIR, tenant)
+
+    def _kb_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _manager(self, tenant: str, kb: str, load: bool = True) -> RAGManager:
+        """Served manager of a KB; kb="" with load=False is the tenant's manager without a KB."""
+        key = (tenant, kb)
+        manager = self._managers.get(key)
+        if manager is not None:
+            return manager
+        with self._kb_lock(key):
+            manager = self._managers.get(key)
+            if manager is None:
+                manager = RAGManager(base_path=self._tenant_path(tenant))
+                if load and not manager.load_knowledge_base(kb):
+                    raise KBServiceError(f"knowledge base not found or not loadable: {kb}", status=404)
+                self._managers[key] = manager
+        return manager
+
+    @staticmethod
+    def _kb_state(manager: RAGManager) -> Dict[str, Any]:
+        return {
+            "kb": manager.current_kb_name,
+            "status": manager.vector_store_status,
+            "meta": asdict(manager.current_kb_meta) if manager.current_kb_meta else None,
+        }
+
+    # --- API actions: request dict -> JSON-serializable response ---
+
+    def health(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {"status": "ok", "loaded": [f"{t}/{k}" if t else k for t, k in self._managers if k]}
+
+    def list_kbs(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        tenant = _check_name(request.get("tenant"), "tenant", allow_empty=True)
+        if not os.path.isdir(self._tenant_path(tenant)):
+            return {"kbs": []}
+        return {"kbs": RAGManager(base_path=self._tenant_path(tenant)).list_knowledge_bases()}
+
+    def kb_meta(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        tenant = _check_name(request.get("tenant"), "tenant", allow_empty=True)
+        kb = _check_name(request.get("kb"), "kb")
+        meta = RAGManager(base_path=self._tenant_path(tenant)).get_kb_meta(kb)
+        return {"meta": asdict(meta) if meta else None}
+
+    def load(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        tenant = _check_name(request.get("tenant"), "tenant", allow_empty=True)
+        kb = _check_name(request.get("kb"), "kb")
+        return self._kb_state(self._manager(tenant, kb))
+
+    def ingest(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        tenant = _check_name(request.get("tenant"), "tenant", allow_empty=True)
+        kb = _check_name(request.get("kb"), "kb")
+        uploads = []
+        for item in request.get("files") or []:
+            name = os.path.basename(str(item.get("name", "")))
+            if not name or name.startswith("."):
+                raise KBServiceError(f"invalid file name: {item.get('name')!r}")
+            uploads.append(_Upload(name, base64.b64decode(item.get("content_b64", ""))))
+        key = (tenant, kb)
+        with self._kb_lock(key):
+            manager = RAGManager(base_path=self._tenant_path(tenant))
+            message = manager.process_files(kb, uploads, chunking=request.get("chunking", "flat"),
+                                            storage=request.get("storage"), coarse_dim=request.get("coarse_dim"))
+            if manager.current_kb_name == kb:
+                # Replace the served index only after a successful build
+                self._managers[key] = manager
+        return {"message": message, **self._kb_state(manager)}
+
+    def compact(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        tenant = _check_name(request.get("tenant"), "tenant", allow_empty=True)
+        kb = _check_name(request.get("kb"), "kb")
+        key = (tenant, kb)
+        # Near duplicates are not exact copies; they are removed only when the client asks
+        options = {"dry_run": bool(request.get("dry_run")), "near_threshold": request.get("near_threshold")}
+        with self._kb_lock(key):
+            # The served manager reuses its open index and is reloaded afterwards
+            manager = self._managers.get(key) or RAGManager(base_path=self._tenant_path(tenant))
+            try:
+                report = manager.compact_knowledge_base(kb, **options)
+            except ValueError as e:
+                raise KBServiceError(str(e), status=404)
+        return {"report": asdict(report)}
+
+    def retrieve(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Batched: one result list per query. Identical concurrent requests share one search."""
+        tenant = _check_name(request.get("tenant"), "tenant", allow_empty=True)
+        kb = _check_name(request.get("kb"), "kb")
+        queries = request.get("queries")
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise KBServiceError("queries must be a list of strings")
+        manager = self._manager(tenant, kb)
+        flight_key = json.dumps({k: request.get(k) for k in sorted(request)}, sort_keys=True, ensure_ascii=False)
+
+        def run() -> List[List[Dict[str, Any]]]:
+            return manager.retrieve_batch(
+                queries,
+                float(request.get("threshold", 0.5)),
+                int(request.get("top_k", 3)),
+                reranker=get_reranker(request.get("rerank")) if request.get("rerank") == "lexical" else None,
+                overfetch=int(request.get("overfetch", 3)),
+                filters=request.get("filters") or None,
+            )
+
+        return {"results": self._retrievals.do(flight_key, run)}
+
+    def filter_options(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        tenant = _check_name(request.get("tenant"), "tenant", allow_empty=True)
+        kb = _check_name(request.get("kb"), "kb")
+        return self._manager(tenant, kb).list_filter_options()
+
+    def embed(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Query embeddings with the model of the given KB (or the default model without one)."""
+        tenant = _check_name(request.get("tenant"), "tenant", allow_empty=True)
+        kb = request.get("kb")
+        texts = request.get("texts") or []
+        manager = self._manager(tenant, _check_name(kb, "kb")) if kb else self._manager(tenant, "", load=False)
+        return {"vectors": [manager.embed_query(text) for text in texts]}
+
+    ACTIONS = ("health", "list_kbs", "kb_meta", "load", "ingest", "compact", "retrieve", "filter_options", "embed")
+
+    def handle(self, action: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        if action not in self.ACTIONS:
+            raise KBServiceError(f"unknown action: {action}", status=404)
+        with telemetry.span(f"kb_service.{action}"):
+            return getattr(self, action)(request)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients can reuse pooled connections
+    protocol_version = "HTTP/1.1"
+    service: KBService = None
+
+    def _send(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, request: Dict[str, Any]):
+        if not self.path.startswith(API_PREFIX):
+            self._send(404, {"error": f"unknown path: {self.path}"})
+            return
+        try:
+            self._send(200, self.service.handle(self.path[len(API_PREFIX):], request))
+        except KBServiceError as e:
+            self._send(e.status, {"error": str(e)})
+        except ProviderUnavailable as e:
+            # Embedding provider down or too slow; clients fall back to answering without RAG
+            self._send(503, {"error": f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        self._dispatch({})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": "request body too large"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, {"error": "request body is not valid JSON"})
+            return
+        self._dispatch(request if isinstance(request, dict) else {})
+
+    def log_message(self, format: str, *args: Any):
+        # Requests are traced as spans; keep stderr quiet
+        pass
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8765, base_path: str = "local_data",
+                  service: Optional[KBService] = None) -> ThreadingHTTPServer:
+    """Build the HTTP server (port 0 picks a free port); call serve_forever() to run it."""
+    handler = type("KBServiceHandler", (_Handler,), {"service": service or KBService(base_path)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledge-base service for the medical RAG app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--base-path", default="local_data")
+    args = parser.parse_args()
+
+    os.makedirs(args.base_path, exist_ok=True)
+    server = create_server(args.host, args.port, args.base_path)
+    print(f"KB service listening on http://{args.host}:{server.server_address[1]} (data: {args.base_path})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,26 @@
-from dataclasses import dataclass
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional, Tuple
+
+from src.utils.lazy import lazy_import
+from src.utils.resilience import describe_provider_error, get_caller
+from src.utils.telemetry import telemetry
+
+ModelFactory = lazy_import("camel.models", "ModelFactory")
+ModelPlatformType = lazy_import("camel.types", "ModelPlatformType")
+EstimatingTokenCounter = lazy_import("src.core.token_counter", "EstimatingTokenCounter")
+ResilientModelManager = lazy_import("src.core.resilient_model", "ResilientModelManager")
+get_replay_store = lazy_import("src.core.replay", "get_replay_store")
+
+# Background connection checks (see ModelManager.watch)
+HEALTH_CHECK_INTERVAL_S = float(os.getenv("MEDRAG_HEALTH_CHECK_INTERVAL_S", "60"))
+# Configurations not shown in any session for this long are no longer checked
+HEALTH_WATCH_EXPIRY_S = 600.0
+
+# "estimate" counts tokens without tiktoken (which downloads its encodings on first use)
+TOKEN_COUNTER_ENV = "MEDRAG_TOKEN_COUNTER"
 
 @dataclass
 class ModelConfig:
@@ -7,22 +29,196 @@ class ModelConfig:
     api_key: str
     model_name: str
     temperature: float
+    # Cap on completion tokens; None leaves it to the provider
+    max_tokens: Optional[int] = None
+
+    def with_fallback(self, base: "ModelConfig") -> "ModelConfig":
+        """Copy with an empty base_url, api_key or model_name taken from `base` (e.g. the doctor's config)."""
+        return replace(
+            self,
+            base_url=self.base_url or base.base_url,
+            api_key=self.api_key or base.api_key,
+            model_name=self.model_name or base.model_name,
+        )
+
+_shared_backends: Dict[Tuple, Any] = {}
+_shared_backends_lock = threading.Lock()
+
+
+def shared_model_backend(model_config: ModelConfig, model_config_dict: Optional[Dict[str, Any]] = None):
+    """
+    Process-wide camel model backend per configuration. Agents, rerankers and the
+    connection check share its OpenAI client, so they also share one warm HTTP
+    connection pool per endpoint.
+    """
+    config_dict = {"temperature": model_config.temperature}
+    if model_config.max_tokens:
+        config_dict["max_tokens"] = model_config.max_tokens
+    config_dict.update(model_config_dict or {})
+    token_counter_mode = os.getenv(TOKEN_COUNTER_ENV)
+    key = (model_config.base_url, model_config.api_key, model_config.model_name,
+           tuple(sorted(config_dict.items())), token_counter_mode)
+    with _shared_backends_lock:
+        backend = _shared_backends.get(key)
+        if backend is None:
+            caller = get_caller("llm", model_config.base_url)
+            backend = _shared_backends[key] = ModelFactory.create(
+                model_platform=ModelPlatformType.OPENAI, # Assuming OpenAI compatible
+                model_type=model_config.model_name or "qwen-plus", # Default fallback
+                url=model_config.base_url,
+                api_key=model_config.api_key,
+                model_config_dict=config_dict,
+                token_counter=EstimatingTokenCounter() if token_counter_mode == "estimate" else None,
+                # Retries and deadlines are handled by the caller; the client timeout is only a backstop
+                timeout=caller.policy.deadline_s,
+                max_retries=0,
+            )
+            # camel's base backend resets max_retries to 3 before the clients are built
+            backend._client = backend._client.with_options(max_retries=0)
+            backend._async_client = backend._async_client.with_options(max_retries=0)
+        return backend
+
+
+def create_camel_model(model_config: ModelConfig, model_config_dict: Optional[Dict[str, Any]] = None):
+    """
+    Create a camel model for an OpenAI compatible endpoint. Calls run under the
+    endpoint's shared ResilientCaller (deadline, hedging, retry budget, circuit breaker),
+    behind the record/replay store when MEDRAG_LLM_REPLAY is set (see src.core.replay).
+    """
+    backend = shared_model_backend(model_config, model_config_dict)
+    return ResilientModelManager(backend, get_caller("llm", model_config.base_url), get_replay_store())
+
+
+@dataclass
+class ConnectionHealth:
+    """Result of one connection check."""
+    ok: bool
+    checked_at: float
+    chat_ms: Optional[float] = None
+    embedding_ms: Optional[float] = None
+    embedding_dim: Optional[int] = None
+    error: str = ""
+
 
 class ModelManager:
-    """Manages model connections and configurations."""
-    
-    def __init__(self):
-        pass
+    """
+    Validates model connections with real requests: a one-token chat completion
+    and one embedding call, both through the shared clients that later requests
+    use, so a successful check also leaves their connection pools warm.
+    The last result per configuration is kept for the sidebar; watched
+    configurations are re-checked in the background every interval_s.
+    """
 
-    def validate_connection(self, config: ModelConfig) -> bool:
+    def __init__(self, embedding_model_type: Optional[str] = None, interval_s: float = HEALTH_CHECK_INTERVAL_S):
+        self.embedding_model_type = embedding_model_type
+        self.interval_s = interval_s
+        self._results: Dict[Tuple[str, str, str], ConnectionHealth] = {}
+        # key -> (config, last time a session asked for it)
+        self._watched: Dict[Tuple[str, str, str], Tuple[ModelConfig, float]] = {}
+        self._checking: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _key(config: ModelConfig) -> Tuple[str, str, str]:
+        return (config.base_url, config.api_key, config.model_name)
+
+    def last_result(self, config: ModelConfig) -> Optional[ConnectionHealth]:
+        with self._lock:
+            return self._results.get(self._key(config))
+
+    def check(self, config: ModelConfig) -> ConnectionHealth:
+        """Run the check and record its result; never raises."""
+        health = ConnectionHealth(ok=False, checked_at=time.time())
+        if not config.api_key or not config.base_url:
+            health.error = "未填写 Base URL 或 API Key"
+        else:
+            try:
+                with telemetry.span("model.health_check", model=config.model_name):
+                    health.chat_ms = self._check_chat(config)
+                    health.embedding_ms, health.embedding_dim = self._check_embedding(config)
+                health.ok = True
+            except Exception as e:
+                health.error = describe_provider_error(e)
+        with self._lock:
+            self._results[self._key(config)] = health
+        return health
+
+    def _check_chat(self, config: ModelConfig) -> float:
+        backend = shared_model_backend(config)
+        caller = get_caller("llm", config.base_url)
+        start = time.perf_counter()
+        caller.call(lambda: backend._client.chat.completions.create(
+            model=config.model_name or "qwen-plus",
+            messages=[{"role": "user", "content": "ping"}],
+            max_tokens=1,
+        ))
+        return (time.perf_counter() - start) * 1000
+
+    def _check_embedding(self, config: ModelConfig) -> Tuple[float, int]:
+        from src.core.embeddings import probe_embedding_model
+        from src.core.rag import EMBEDDING_MODEL_TYPE
+
+        start = time.perf_counter()
+        dimension = probe_embedding_model(self.embedding_model_type or EMBEDDING_MODEL_TYPE,
+                                          config.api_key, config.base_url)
+        return (time.perf_counter() - start) * 1000, dimension
+
+    def _check_in_background(self, config: ModelConfig):
+        key = self._key(config)
+        with self._lock:
+            if key in self._checking:
+                return
+            self._checking.add(key)
+
+        def run():
+            try:
+                self.check(config)
+            finally:
+                with self._lock:
+                    self._checking.discard(key)
+
+        threading.Thread(target=run, name="medrag-health-check", daemon=True).start()
+
+    def watch(self, config: ModelConfig) -> Optional[ConnectionHealth]:
         """
-        Validates the connection to the model API.
-        This is a stub implementation.
+        Keep `config` checked in the background and return its last result.
+        A configuration without a result (e.g. right after it was changed) is
+        checked immediately, so the first question finds warm connections.
         """
-        # TODO: Implement actual validation logic using camel-ai or openai client
-        if not config.api_key:
-            return False
-        return True
+        config = replace(config)
+        key = self._key(config)
+        with self._lock:
+            self._watched[key] = (config, time.monotonic())
+            result = self._results.get(key)
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._monitor_loop, name="medrag-health-monitor", daemon=True)
+                self._monitor.start()
+        if result is None and config.api_key and config.base_url:
+            self._check_in_background(config)
+        return result
 
+    def _monitor_loop(self):
+        while not self._stop.wait(self.interval_s):
+            now = time.monotonic()
+            with self._lock:
+                for key, (_, seen) in list(self._watched.items()):
+                    if now - seen > HEALTH_WATCH_EXPIRY_S:
+                        del self._watched[key]
+                configs = [config for config, _ in self._watched.values()]
+            for config in configs:
+                if config.api_key and config.base_url:
+                    self._check_in_background(config)
+
+    def stop(self):
+        """Stop the background checks."""
+        self._stop.set()
+
+    def validate_connection(self, config: ModelConfig) -> bool:
+        """Validates the connection to the model API (see check)."""
+        return self.check(config).ok
 
 
+# Shared by all sessions: one background monitor and one result per configuration
+model_manager = ModelManager()
@@ -0,0 +1,271 @@
+"""
+Parsing stage of knowledge-base ingestion.
+
+PDF and DOCX parsing is CPU-bound and holds the GIL, so those files are parsed
+in a process pool (one file per task) and yielded as they finish, letting the
+caller embed each document while the others are still being parsed. Text and
+Markdown files are read in the calling process. Every file has a timeout, and
+a file that times out or crashes its worker only fails itself.
+
+Settings (environment):
+    MEDRAG_PARSE_WORKERS    worker processes (default: CPU count)
+    MEDRAG_PARSE_TIMEOUT_S  per-file parse timeout (default 120)
+"""
+import os
+import re
+import sys
+import time
+import types
+import unicodedata
+import zipfile
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+from xml.etree import ElementTree
+
+TEXT_FORMATS = {".txt", ".md", ".markdown"}
+POOL_FORMATS = {".pdf", ".docx"}
+SUPPORTED_FORMATS = TEXT_FORMATS | POOL_FORMATS
+
+PARSE_WORKERS = int(os.getenv("MEDRAG_PARSE_WORKERS", "0")) or (os.cpu_count() or 1)
+PARSE_TIMEOUT_S = float(os.getenv("MEDRAG_PARSE_TIMEOUT_S", "120"))
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# Word heading style ids: "Heading1" (English), "1" (Chinese "标题 1"), "Title"
+_HEADING_STYLE_RE = re.compile(r"^(?:heading\s*|标题\s*)?([1-6])$", re.IGNORECASE)
+_CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f­]")
+_HYPHEN_BREAK_RE = re.compile(r"([A-Za-z])-\n([a-z])")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+@dataclass
+class ParsedDocument:
+    """Normalized text of one file plus structural metadata, or the error that stopped parsing it."""
+    path: str
+    source: str
+    text: str = ""
+    # format, chars and, depending on the format, pages / paragraphs / headings / tables
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    elapsed_s: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC, LF line ends, no control characters, no hyphenated line breaks, at most one blank line."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    text = _CONTROL_RE.sub("", text)
+    text = _HYPHEN_BREAK_RE.sub(r"\1\2", text)
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def _parse_text(path: str) -> Tuple[str, Dict[str, Any]]:
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return f.read(), {}
+
+
+def _parse_pdf(path: str) -> Tuple[str, Dict[str, Any]]:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("解析 PDF 需要安装 pypdf (pip install pypdf)")
+    reader = PdfReader(path)
+    pages = [page.extract_text() or "" for page in reader.pages]
+    if not any(p.strip() for p in pages):
+        raise ValueError("PDF 中没有可提取的文字（可能是扫描件）")
+    return "\n\n".join(pages), {"pages": len(pages)}
+
+
+def _docx_paragraph(p: ElementTree.Element) -> Tuple[str, int]:
+    """Text of a Word paragraph and its heading level (0 for body text)."""
+    parts = []
+    for node in p.iter():
+        if node.tag == f"{_W}t" and node.text:
+            parts.append(node.text)
+        elif node.tag == f"{_W}tab":
+            parts.append("\t")
+        elif node.tag in (f"{_W}br", f"{_W}cr"):
+            parts.append("\n")
+    level = 0
+    style = p.find(f"{_W}pPr/{_W}pStyle")
+    if style is not None:
+        style_id = style.get(f"{_W}val", "")
+        if style_id.lower() == "title":
+            level = 1
+        else:
+            match = _HEADING_STYLE_RE.match(style_id)
+            level = int(match.group(1)) if match else 0
+    return "".join(parts), level
+
+
+def _parse_docx(path: str) -> Tuple[str, Dict[str, Any]]:
+    """Paragraphs and tables of the document body; headings become Markdown headings."""
+    with zipfile.ZipFile(path) as archive:
+        root = ElementTree.fromstring(archive.read("word/document.xml"))
+    body = root.find(f"{_W}body")
+    lines: List[str] = []
+    headings = tables = paragraphs = 0
+    for block in (body if body is not None else []):
+        if block.tag == f"{_W}p":
+            text, level = _docx_paragraph(block)
+            if not text.strip():
+                continue
+            paragraphs += 1
+            if level:
+                headings += 1
+                lines.append(f"{'#' * level} {text.strip()}")
+            else:
+                lines.append(text)
+        elif block.tag == f"{_W}tbl":
+            tables += 1
+            for row in block.iter(f"{_W}tr"):
+                cells = [" ".join(_docx_paragraph(p)[0] for p in cell.iter(f"{_W}p")).strip()
+                         for cell in row.iter(f"{_W}tc")]
+                lines.append(" | ".join(cells))
+    return "\n\n".join(lines), {"paragraphs": paragraphs, "headings": headings, "tables": tables}
+
+
+_PARSERS = {".txt": _parse_text, ".md": _parse_text, ".markdown": _parse_text, ".pdf": _parse_pdf,
+            ".docx": _parse_docx}
+
+
+def parse_file(path: str) -> ParsedDocument:
+    """Parse one file; errors are returned in the document, not raised (runs in pool workers)."""
+    start = time.perf_counter()
+    source = os.path.basename(path)
+    fmt = os.path.splitext(path)[1].lower()
+    document = ParsedDocument(path=path, source=source, metadata={"format": fmt.lstrip(".")})
+    try:
+        parser = _PARSERS.get(fmt)
+        if parser is None:
+            raise ValueError(f"不支持的文件格式: {fmt or source}")
+        text, metadata = parser(path)
+        document.text = normalize_text(text)
+        document.metadata.update(metadata, chars=len(document.text))
+        if not document.text:
+            raise ValueError("文件中没有文字内容")
+    except Exception as e:
+        document.text = ""
+        document.error = str(e) or type(e).__name__
+    document.elapsed_s = time.perf_counter() - start
+    return document
+
+
+_BARE_MAIN = types.ModuleType("__main__")
+
+
+@contextmanager
+def _bare_main():
+    """
+    Spawned workers re-run the parent's __main__ file, which under Streamlit is
+    the app script. Hide it while workers are started.
+    """
+    main = sys.modules.get("__main__")
+    sys.modules["__main__"] = _BARE_MAIN
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Pool with all its workers already started. A spawn pool starts a worker in
+    submit() when none is idle, so one no-op task per worker starts them all here,
+    and __main__ is swapped only for that moment rather than around every submit.
+    """
+    # spawn: forking the multi-threaded Streamlit server process is unsafe
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+    with _bare_main():
+        for _ in range(workers):
+            pool.submit(os.getpid)
+    return pool
+
+
+def _kill_pool(pool: ProcessPoolExecutor):
+    """Stop a pool whose workers may be stuck; a running task cannot be cancelled otherwise."""
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _failed(path: str, error: str, started: float) -> ParsedDocument:
+    return ParsedDocument(path=path, source=os.path.basename(path),
+                          metadata={"format": os.path.splitext(path)[1].lower().lstrip(".")},
+                          error=error, elapsed_s=time.monotonic() - started)
+
+
+def parse_documents(paths: List[str], max_workers: int = PARSE_WORKERS,
+                    timeout_s: float = PARSE_TIMEOUT_S) -> Iterator[ParsedDocument]:
+    """
+    Parse files and yield each document as soon as it is ready (not in input order).
+
+    PDF/DOCX files go to the process pool; text files are parsed here while the
+    workers run. At most `max_workers` files are in flight, so a file's timeout
+    starts when it is submitted. A timeout or a crashed worker replaces the pool
+    and resubmits the other files in flight; files in flight during a crash are
+    retried alone, so only the file that crashes again fails.
+    """
+    queue: Deque[str] = deque(p for p in paths if os.path.splitext(p)[1].lower() in POOL_FORMATS)
+    local: Deque[str] = deque(p for p in paths if os.path.splitext(p)[1].lower() not in POOL_FORMATS)
+    workers = max(1, min(max_workers, len(queue)))
+    in_flight: Dict[Future, Tuple[str, float]] = {}
+    suspects: Set[str] = set()
+    pool = _new_pool(workers) if queue else None
+    try:
+        while queue or in_flight or local:
+            while queue and len(in_flight) < workers:
+                if queue[0] in suspects and in_flight:
+                    break
+                path = queue.popleft()
+                in_flight[pool.submit(parse_file, path)] = (path, time.monotonic())
+                if path in suspects:
+                    break
+            if local:
+                yield parse_file(local.popleft())
+                if not in_flight:
+                    continue
+                wait_s = 0.0
+            else:
+                next_deadline = min(started for _, started in in_flight.values()) + timeout_s
+                wait_s = max(0.0, next_deadline - time.monotonic())
+
+            done, _ = wait(list(in_flight), timeout=wait_s, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                path, started = in_flight.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    if path in suspects:
+                        yield _failed(path, "解析进程异常退出", started)
+                    else:
+                        suspects.add(path)
+                        queue.appendleft(path)
+                except Exception as e:
+                    yield _failed(path, str(e) or type(e).__name__, started)
+
+            now = time.monotonic()
+            timed_out = [f for f, (_, started) in in_flight.items() if now - started >= timeout_s]
+            for future in timed_out:
+                path, started = in_flight.pop(future)
+                yield _failed(path, f"解析超时（超过 {timeout_s:g} 秒）", started)
+            if timed_out or broken:
+                for path, _ in in_flight.values():
+                    queue.appendleft(path)
+                in_flight.clear()
+                _kill_pool(pool)
+                # The last file needs no new pool
+                pool = _new_pool(workers) if queue else None
+    finally:
+        if pool is not None:
+            _kill_pool(pool)
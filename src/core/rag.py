@@ -2,9 +2,41 @@ import os
 from typing import List, Optional, Dict, Any
 import streamlit as st
 
-from camel.embeddings import OpenAICompatibleEmbedding
-from camel.storages import QdrantStorage
-from camel.retrievers import VectorRetriever
+from src.core.hierarchy import (
+    ParentChunk, PARENTS_FILE, CHILDREN_PER_PARENT, index_document, save_parents, load_parents, expand_to_parents,
+    section_prefixes
+)
+from src.core.kb_meta import KnowledgeBaseMeta, KB_META_FILE, compute_content_hash, now_iso
+from src.core.parsing import TEXT_FORMATS, parse_documents
+from src.core.rerank import BaseReranker, DEFAULT_OVERFETCH, MAX_CANDIDATES, rerank_results
+from src.utils.lazy import lazy_import
+from src.utils.profiling import profiler
+from src.utils.resilience import ProviderUnavailable
+from src.utils.telemetry import telemetry
+
+# camel / Qdrant / unstructured are heavy to import; they load on first use of RAG
+OpenAICompatibleEmbedding = lazy_import("camel.embeddings", "OpenAICompatibleEmbedding")
+QdrantStorage = lazy_import("camel.storages", "QdrantStorage")
+VectorRetriever = lazy_import("camel.retrievers", "VectorRetriever")
+VectorDBQuery = lazy_import("camel.storages", "VectorDBQuery")
+shared_embedding_model = lazy_import("src.core.embeddings", "shared_embedding_model")
+InstrumentedStorage = lazy_import("src.core.storage", "InstrumentedStorage")
+get_sharded_storage = lazy_import("src.core.sharded_storage", "get_sharded_storage")
+IngestDeduplicator = lazy_import("src.core.compaction", "IngestDeduplicator")
+
+EMBEDDING_MODEL_TYPE = "text-embedding-v4"
+
+# Files inside a KB directory that belong to Qdrant or to the KB metadata, not to the user
+KB_INTERNAL_FILES = {KB_META_FILE, PARENTS_FILE, "meta.json", ".lock"}
+
+CHUNKING_FLAT = "flat"
+CHUNKING_HIERARCHICAL = "hierarchical"
+
+# Vector storage of a KB: a local Qdrant collection (loaded into memory when opened),
+# or memory-mapped shard files for KBs larger than memory (see sharded_storage)
+STORAGE_QDRANT = "qdrant"
+STORAGE_SHARDED = "sharded"
+KB_STORAGE = os.getenv("MEDRAG_KB_STORAGE", STORAGE_QDRANT)
 
 
 def build_retriever_from_files(
@@ -76,10 +108,44 @@ def get_retrieval_results(
     return retriever.query(query=query, top_k=top_k, similarity_threshold=threshold)
 
 
+def get_filtered_retrieval_results(
+    retriever: VectorRetriever,
+    query: str,
+    filters: Dict[str, Any],
+    threshold: float = 0.5,
+    top_k: int = 3
+) -> List[Dict[str, Any]]:
+    """
+    Like get_retrieval_results, restricted to chunks whose payload fields equal
+    the given values, e.g. {"source": "a.txt", "section": "第二章临床药动学"}.
+    The filter is applied inside the vector search, so only matching chunks are scored.
+    """
+    if not retriever:
+        return []
+    retriever.storage.load()
+    query_vector = retriever.embedding_model.embed(obj=query)
+    results = retriever.storage.query(
+        query=VectorDBQuery(query_vector=query_vector, top_k=top_k),
+        filter_conditions=filters
+    )
+    return [
+        {
+            'similarity score': str(res.similarity),
+            'content path': res.record.payload.get('content path', ''),
+            'metadata': res.record.payload.get('metadata', {}),
+            'extra_info': res.record.payload.get('extra_info', {}),
+            'text': res.record.payload.get('text', ''),
+        }
+        for res in results
+        if res.similarity >= threshold and res.record.payload is not None
+    ]
+
+
 def format_retrieval_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Process and format the raw results from the retriever.
     Removes invalid entries and formats similarity scores.
+    Keeps the source file and chunk position so neighbouring chunks can be merged later.
     """
     valid_results = []
     for res in results:
@@ -90,14 +156,37 @@ def format_retrieval_results(results: List[Dict[str, Any]]) -> List[Dict[str, An
         similarity_raw = res.get('similarity score', 0.0)
         similarity = float(similarity_raw) if similarity_raw is not None else 0.0
         
-        valid_results.append({
+        item = {
             'text': text,
             'similarity': similarity
-        })
+        }
+        metadata = res.get('metadata') or {}
+        source = metadata.get('filename') or res.get('content path')
+        if source:
+            item['source'] = source
+        if metadata.get('piece_num') is not None:
+            item['chunk_index'] = metadata['piece_num']
+        # Child chunks of a hierarchical KB point to their parent section
+        if metadata.get('parent_id'):
+            item['parent_id'] = metadata['parent_id']
+            item['section'] = metadata.get('section', '')
+        valid_results.append(item)
         
     return valid_results
 
 
+def create_rag_manager(base_path: str = "local_data") -> "RAGManager":
+    """
+    RAGManager for a Streamlit session. With MEDRAG_KB_SERVICE_URL set, ingestion
+    and retrieval go to a shared knowledge-base service (src.core.kb_service).
+    """
+    service_url = os.getenv("MEDRAG_KB_SERVICE_URL")
+    if service_url:
+        from src.core.kb_client import RemoteRAGManager
+        return RemoteRAGManager(service_url, tenant=os.getenv("MEDRAG_KB_TENANT", ""))
+    return RAGManager(base_path)
+
+
 class RAGManager:
     """Manages document ingestion and retrieval for RAG using Camel AI."""
     
@@ -111,9 +200,20 @@ class RAGManager:
         self.retriever = None
         self.storage = None
         self.current_kb_name = None
+        self.current_kb_meta: Optional[KnowledgeBaseMeta] = None
+        # Parent sections by id when the loaded KB uses hierarchical chunking
+        self.parents: Optional[Dict[str, ParentChunk]] = None
+        # (mtime of base_path, names) so reruns do not rescan the directory
+        self._kb_list_cache = None
+        # (api_key, base_url), embedding model for questions asked while no knowledge base is loaded
+        self._query_embedding = None
 
-    def _get_embedding_model(self):
-        """Helper to create embedding model based on session config."""
+    def _get_embedding_model(self, model_type: str = EMBEDDING_MODEL_TYPE, output_dim: Optional[int] = None):
+        """
+        Helper to create embedding model based on session config.
+        Passing a known output_dim avoids the probe request in get_output_dim().
+        Models are shared per configuration across sessions (see shared_embedding_model).
+        """
         # Check if config exists in session state, otherwise use defaults or fail gracefully
         if hasattr(st.session_state, 'model_config'):
             api_key = st.session_state.model_config.api_key
@@ -123,40 +223,139 @@ class RAGManager:
             api_key = os.getenv("OPENAI_API_KEY", "")
             base_url = os.getenv("OPENAI_BASE_URL", "")
 
-        return OpenAICompatibleEmbedding(
-            model_type="text-embedding-v4",
+        return shared_embedding_model(
+            model_type=model_type,
             api_key=api_key,
-            url=base_url
+            url=base_url,
+            output_dim=output_dim
         )
 
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Embed a question with the model of the loaded knowledge base (or the default
+        model). Repeated questions are served from the query embedding cache, so the
+        retrieval that follows does not embed the same text again.
+        """
+        if self.retriever is not None:
+            return self.retriever.embedding_model.embed(query)
+        config = getattr(st.session_state, 'model_config', None)
+        config_key = (getattr(config, 'api_key', None), getattr(config, 'base_url', None))
+        if self._query_embedding is None or self._query_embedding[0] != config_key:
+            self._query_embedding = (config_key, self._get_embedding_model())
+        return self._query_embedding[1].embed(query)
+
+    @property
+    def embedding_model_name(self) -> str:
+        """Model used by embed_query; cached answers are only comparable within one model."""
+        if self.current_kb_meta is not None:
+            return self.current_kb_meta.embedding_model
+        return EMBEDDING_MODEL_TYPE
+
     def list_knowledge_bases(self) -> List[str]:
-        """List available knowledge bases (subdirectories in local_data)."""
-        if not os.path.exists(self.base_path):
+        """
+        List available knowledge bases (subdirectories in local_data).
+        The listing is cached until the directory's mtime changes.
+        """
+        try:
+            mtime = os.stat(self.base_path).st_mtime_ns
+        except OSError:
             return []
-        return [d for d in os.listdir(self.base_path) 
-                if os.path.isdir(os.path.join(self.base_path, d))]
+        if self._kb_list_cache is None or self._kb_list_cache[0] != mtime:
+            names = sorted(d for d in os.listdir(self.base_path)
+                           if os.path.isdir(os.path.join(self.base_path, d)))
+            self._kb_list_cache = (mtime, names)
+        return list(self._kb_list_cache[1])
+
+    def invalidate_kb_cache(self):
+        """Force the next list_knowledge_bases call to rescan the directory."""
+        self._kb_list_cache = None
+
+    def get_kb_meta(self, kb_name: str) -> Optional[KnowledgeBaseMeta]:
+        """Read the metadata file of a knowledge base without opening it."""
+        return KnowledgeBaseMeta.load(os.path.join(self.base_path, kb_name))
+
+    def _list_kb_files(self, kb_path: str) -> List[str]:
+        """Uploaded source files stored in a KB directory."""
+        return sorted(os.path.join(kb_path, f) for f in os.listdir(kb_path)
+                      if f not in KB_INTERNAL_FILES and not f.endswith(".tmp")
+                      and os.path.isfile(os.path.join(kb_path, f)))
+
+    def _write_kb_meta(self, kb_name: str, kb_path: str, embedding_model, dimension: int,
+                       chunking: str = CHUNKING_FLAT, payload_indexed: bool = False,
+                       file_info: Optional[Dict[str, Dict[str, Any]]] = None,
+                       storage: str = STORAGE_QDRANT, coarse_dim: Optional[int] = None) -> KnowledgeBaseMeta:
+        """Record the build information of a knowledge base next to its index."""
+        file_paths = self._list_kb_files(kb_path)
+        previous = KnowledgeBaseMeta.load(kb_path)
+        file_info = {**(previous.file_info if previous else {}), **(file_info or {})}
+        meta = KnowledgeBaseMeta(
+            name=kb_name,
+            embedding_model=getattr(embedding_model, "model_type", EMBEDDING_MODEL_TYPE),
+            dimension=dimension,
+            chunk_count=self.storage.status().vector_count if self.storage else 0,
+            build_time=now_iso(),
+            content_hash=compute_content_hash(file_paths),
+            files=[os.path.basename(p) for p in file_paths],
+            chunking=chunking,
+            payload_indexed=payload_indexed,
+            file_info={os.path.basename(p): file_info[os.path.basename(p)]
+                       for p in file_paths if os.path.basename(p) in file_info},
+            storage=storage,
+            coarse_dim=coarse_dim,
+        )
+        meta.save(kb_path)
+        return meta
+
+    def _open_storage(self, kb_path: str, dimension: int, storage: str, coarse_dim: Optional[int] = None):
+        """The vector storage of a KB directory, wrapped for telemetry and payload indexing."""
+        if storage == STORAGE_SHARDED:
+            return InstrumentedStorage(get_sharded_storage(kb_path, dimension, coarse_dim))
+        if storage != STORAGE_QDRANT:
+            raise ValueError(f"unknown KB storage {storage!r}")
+        collection_dir = os.path.join(kb_path, "collection")
+        if not os.path.isdir(collection_dir) and os.path.isdir(collection_dir + ".new"):
+            # A compaction stopped while swapping in its rewritten collection, which is complete
+            os.replace(collection_dir + ".new", collection_dir)
+        return InstrumentedStorage(QdrantStorage(
+            vector_dim=dimension,
+            collection_name="expert_qa_kb",
+            path=kb_path
+        ))
 
     def load_knowledge_base(self, kb_name: str) -> bool:
-        """Load an existing knowledge base from disk."""
+        """
+        Load an existing knowledge base from disk.
+        The embedding model and dimension come from the KB metadata file, so no
+        network request is made; KBs built before the metadata existed are probed once.
+        """
         kb_path = os.path.join(self.base_path, kb_name)
         if not os.path.exists(kb_path):
             return False
             
         try:
-            embedding_model = self._get_embedding_model()
+            meta = KnowledgeBaseMeta.load(kb_path)
+            if meta:
+                embedding_model = self._get_embedding_model(meta.embedding_model, meta.dimension)
+            else:
+                embedding_model = self._get_embedding_model()
+            dimension = embedding_model.get_output_dim()
             
             # Use local path for persistence
-            self.storage = QdrantStorage(
-                vector_dim=embedding_model.get_output_dim(),
-                collection_name="expert_qa_kb",
-                path=kb_path
-            )
+            self.storage = self._open_storage(kb_path, dimension, meta.storage if meta else STORAGE_QDRANT,
+                                              meta.coarse_dim if meta else None)
             
             self.retriever = VectorRetriever(
                 embedding_model=embedding_model, 
                 storage=self.storage
             )
             
+            self.parents = load_parents(kb_path)
+            if meta is None:
+                chunking = CHUNKING_HIERARCHICAL if self.parents is not None else CHUNKING_FLAT
+                meta = self._write_kb_meta(kb_name, kb_path, embedding_model, dimension, chunking)
+            
+            self.documents = list(meta.files)
+            self.current_kb_meta = meta
             self.current_kb_name = kb_name
             self.vector_store_status = f"✅ 已加载知识库: {kb_name}"
             return True
@@ -164,10 +363,20 @@ class RAGManager:
             self.vector_store_status = f"❌ 加载失败: {str(e)}"
             return False
 
-    def process_files(self, kb_name: str, uploaded_files: List[Any]) -> str:
+    @profiler.profiled("process_files")
+    def process_files(self, kb_name: str, uploaded_files: List[Any], chunking: str = CHUNKING_FLAT,
+                      storage: Optional[str] = None, coarse_dim: Optional[int] = None) -> str:
         """
         Process uploaded files, save them to local folder, and update vector store.
-        DELEGATES core logic to build_retriever_from_files.
+        TXT/MD files are indexed by build_retriever_from_files; PDF/DOCX text comes
+        from the parsing process pool. A file that fails to parse is removed and
+        reported in the status, the others are still indexed.
+        With chunking="hierarchical", only small child chunks are embedded and the
+        parent sections they belong to are stored next to the index.
+        `storage` (STORAGE_QDRANT / STORAGE_SHARDED) defaults to the KB's current
+        storage, or MEDRAG_KB_STORAGE for a new KB. `coarse_dim` enables two-stage
+        search on truncated vectors; it implies sharded storage and is fixed when
+        the KB is created.
         """
         if not uploaded_files or not kb_name:
             return "❌ 请提供知识库名称和文件"
@@ -180,12 +389,19 @@ class RAGManager:
         try:
             # 1. Initialize Components
             embedding_model = self._get_embedding_model()
+            dimension = embedding_model.get_output_dim()
             
-            self.storage = QdrantStorage(
-                vector_dim=embedding_model.get_output_dim(),
-                collection_name="expert_qa_kb",
-                path=kb_path
-            )
+            previous = KnowledgeBaseMeta.load(kb_path)
+            if previous and coarse_dim and coarse_dim != previous.coarse_dim:
+                return f"❌ 知识库 {kb_name} 已建立，无法更改粗排维度"
+            coarse_dim = coarse_dim or (previous.coarse_dim if previous else None)
+            storage = STORAGE_SHARDED if coarse_dim else storage or (previous.storage if previous else KB_STORAGE)
+            self.storage = self._open_storage(kb_path, dimension, storage, coarse_dim)
+            self.storage.create_payload_indexes()
+            # Chunks already in the KB, or repeated within this upload, are neither embedded nor stored
+            dedup = IngestDeduplicator.for_storage(self.storage)
+            dedup_embedding = dedup.embedding(embedding_model)
+            self.storage.dedup = dedup
             
             # 2. Save files locally first (System responsibility)
             file_paths = []
@@ -198,39 +414,158 @@ class RAGManager:
                 file_paths.append(file_path)
                 file_names.append(uploaded_file.name)
             
-            # 3. Build Retriever (STUDENT EXERCISE DELEGATION)
-            self.retriever = build_retriever_from_files(
-                embedding_model=embedding_model,
-                storage=self.storage,
-                file_paths=file_paths
+            # 3. Parse (PDF/DOCX in a process pool) and index each document as soon as it is parsed
+            file_info: Dict[str, Dict[str, Any]] = {}
+            failed: List[str] = []
+            with telemetry.span("rag.build", kb=kb_name, num_files=len(file_paths), chunking=chunking):
+                # Re-uploads replace the sections of a file (same parent ids) and keep the others
+                parents = (load_parents(kb_path) or {}) if chunking == CHUNKING_HIERARCHICAL else {}
+                parsed_retriever = VectorRetriever(embedding_model=dedup_embedding, storage=self.storage)
+                text_indexed = False
+                for document in parse_documents(file_paths):
+                    if not document.ok:
+                        failed.append(f"{document.source}: {document.error}")
+                        os.remove(document.path)
+                        continue
+                    file_info[document.source] = document.metadata
+                    if chunking == CHUNKING_HIERARCHICAL:
+                        parents.update((p.parent_id, p) for p in index_document(
+                            embedding_model, self.storage, document.path, document.text, dedup=dedup))
+                    elif os.path.splitext(document.path)[1].lower() in TEXT_FORMATS:
+                        # STUDENT EXERCISE DELEGATION
+                        self.retriever = build_retriever_from_files(
+                            embedding_model=dedup_embedding,
+                            storage=self.storage,
+                            file_paths=[document.path]
+                        )
+                        text_indexed = True
+                    else:
+                        parsed_retriever.process(document.text, metadata_filename=document.source, embed_batch=10)
+                self.storage.dedup = None
+                # Queries must not go through the deduplicating wrapper
+                for retriever in (self.retriever, parsed_retriever):
+                    if getattr(retriever, "embedding_model", None) is dedup_embedding:
+                        retriever.embedding_model = embedding_model
+                if not file_info:
+                    self.vector_store_status = "❌ 文件解析失败: " + "；".join(failed)
+                    return self.vector_store_status
+
+                if chunking == CHUNKING_HIERARCHICAL:
+                    save_parents(kb_path, list(parents.values()))
+                    self.parents = parents
+                    self.retriever = parsed_retriever
+                else:
+                    if not text_indexed:
+                        self.retriever = parsed_retriever
+                    self.parents = None
+                    # A flat rebuild must not be opened as hierarchical later
+                    if os.path.exists(os.path.join(kb_path, PARENTS_FILE)):
+                        os.remove(os.path.join(kb_path, PARENTS_FILE))
+            
+            # 4. Record build information so the KB can later be opened offline
+            self.current_kb_meta = self._write_kb_meta(
+                kb_name, kb_path, embedding_model, dimension, chunking, payload_indexed=True, file_info=file_info,
+                storage=storage, coarse_dim=coarse_dim
             )
+            self.invalidate_kb_cache()
             
-            self.documents = file_names
+            self.documents = list(self.current_kb_meta.files)
             self.current_kb_name = kb_name
-            self.vector_store_status = f"✅ 已创建并索引知识库: {kb_name} ({len(file_names)} 文件)"
+            total = len(self.current_kb_meta.files)
+            added = f"共 {total} 文件，新增 {len(file_info)} 文件" if total != len(file_info) else f"{total} 文件"
+            self.vector_store_status = f"✅ 已创建并索引知识库: {kb_name} ({added})"
+            if dedup.skipped:
+                self.vector_store_status += f"（跳过 {dedup.skipped} 个重复片段）"
+            if failed:
+                self.vector_store_status += f"；⚠️ {len(failed)} 个文件解析失败: " + "；".join(failed)
             return self.vector_store_status
 
         except Exception as e:
             print(f"❌ 处理失败: {str(e)}")
             return "处理失败"
+        finally:
+            if self.storage is not None:
+                self.storage.dedup = None
 
-    def retrieve(self, query: str, threshold: float, top_k: int) -> List[Dict[str, Any]]:
+    def compact_knowledge_base(self, kb_name: str, **options: Any):
+        """
+        Remove duplicate and orphaned chunks of a KB and rewrite its index.
+        Options and the returned CompactionReport: see compaction.compact_knowledge_base.
+        """
+        from src.core.compaction import compact_knowledge_base
+        return compact_knowledge_base(self, kb_name, **options)
+
+    def list_filter_options(self) -> Dict[str, List[str]]:
+        """Values offered by the retrieval filter of the loaded KB: source files and chapters/sections."""
+        if not self.current_kb_meta or not self.current_kb_meta.payload_indexed:
+            return {"source": [], "section": []}
+        sections = []
+        for parent in (self.parents or {}).values():
+            # Chapters and sections; subsections would make the list unwieldy
+            for prefix in section_prefixes(parent.section)[:2]:
+                if prefix not in sections:
+                    sections.append(prefix)
+        return {"source": list(self.current_kb_meta.files), "section": sections}
+
+    def retrieve(self, query: str, threshold: float, top_k: int,
+                 reranker: Optional[BaseReranker] = None, overfetch: int = DEFAULT_OVERFETCH,
+                 filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Retrieve relevant document context based on query.
         DELEGATES core logic to get_retrieval_results.
+        With a reranker, overfetch * top_k candidates are fetched, rescored and
+        cut adaptively, so top_k becomes an upper bound rather than a fixed count.
+        In a hierarchical KB, top_k counts parent sections: child hits are
+        fetched, then replaced by their de-duplicated parents.
+        `filters` restricts the search to matching payload fields (see list_filter_options).
+        Raises ProviderUnavailable when the embedding provider is unhealthy or too slow;
+        other errors are returned as a single "检索失败" result.
         """
-        try:
-            # Student returns raw results
-            raw_results = get_retrieval_results(self.retriever, query, threshold, top_k)
-            # System formats them
-            return format_retrieval_results(raw_results)
-        except Exception as e:
-            print(f"Retrieval error: {e}")
-            error_message = f"检索失败: {str(e)}"
-            return [{
-                'text': error_message,
-                'similarity': 0.0
-            }]
+        with telemetry.span("rag.retrieve", kb=self.current_kb_name, top_k=top_k, threshold=threshold,
+                            filtered=bool(filters)) as span:
+            try:
+                hierarchical = self.parents is not None
+                keep_k = min(top_k * CHILDREN_PER_PARENT, MAX_CANDIDATES) if hierarchical else top_k
+                fetch_k = min(max(keep_k * overfetch, keep_k), MAX_CANDIDATES) if reranker else keep_k
+                # Student returns raw results
+                if filters:
+                    raw_results = get_filtered_retrieval_results(self.retriever, query, filters, threshold, fetch_k)
+                else:
+                    raw_results = get_retrieval_results(self.retriever, query, threshold, fetch_k)
+                # System formats them
+                results = format_retrieval_results(raw_results)
+                if reranker:
+                    results = rerank_results(query, results, reranker, keep_k)
+                if hierarchical:
+                    results = expand_to_parents(results, self.parents, top_k)
+                span.set(num_results=len(results))
+                return results
+            except ProviderUnavailable:
+                # The caller decides how to degrade (e.g. answer without RAG)
+                span.status = "degraded"
+                raise
+            except Exception as e:
+                span.status = "error"
+                span.error = str(e)
+                print(f"Retrieval error: {e}")
+                error_message = f"检索失败: {str(e)}"
+                return [{
+                    'text': error_message,
+                    'similarity': 0.0
+                }]
+
+    def retrieve_batch(self, queries: List[str], threshold: float, top_k: int,
+                       reranker: Optional[BaseReranker] = None, overfetch: int = DEFAULT_OVERFETCH,
+                       filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Retrieve for several queries; their embeddings are requested in one provider call."""
+        embedding_model = getattr(self.retriever, "embedding_model", None)
+        if hasattr(embedding_model, "warm"):
+            try:
+                embedding_model.warm(queries)
+            except Exception as e:
+                # Each query then embeds (and reports the error) on its own
+                print(f"Batch embedding failed: {e}")
+        return [self.retrieve(q, threshold, top_k, reranker, overfetch, filters) for q in queries]
 
     def create_temporary_retriever(self, text_content: str) -> Optional[VectorRetriever]:
         """
@@ -243,11 +578,11 @@ class RAGManager:
         try:
             embedding_model = self._get_embedding_model()
             
-            storage = QdrantStorage(
+            storage = InstrumentedStorage(QdrantStorage(
                 vector_dim=embedding_model.get_output_dim(),
                 collection_name="temp_sim_kb",
                 path=":memory:"
-            )
+            ))
             
             retriever = VectorRetriever(
                 embedding_model=embedding_model,
@@ -0,0 +1,138 @@
+"""
+Record/replay of chat completions, for reproducible simulation and QA runs.
+
+Responses are stored in SQLite under an exact-match key: a hash of the model
+(name, endpoint, config) plus the full message list, tools and response format.
+Modes (MEDRAG_LLM_REPLAY):
+    off             every request goes to the provider (default)
+    record          every request goes to the provider; responses are stored
+    replay          responses come from the store only; a missing one raises ReplayMiss
+    record-missing  stored responses are replayed; missing ones are requested and stored
+When comparing two variants (e.g. retrieval settings) over the same cases, the
+turns that did not change replay instantly and only diverging turns hit the provider.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.utils.telemetry import telemetry
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+RECORD_MISSING = "record-missing"
+REPLAY_MODES = (OFF, RECORD, REPLAY, RECORD_MISSING)
+
+REPLAY_MODE_ENV = "MEDRAG_LLM_REPLAY"
+REPLAY_PATH_ENV = "MEDRAG_LLM_REPLAY_PATH"
+DEFAULT_REPLAY_PATH = os.path.join("local_data", "llm_replay.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    replays INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+
+class ReplayMiss(LookupError):
+    """Replay mode found no recorded response for a request."""
+
+
+def request_key(backend: Any, messages: List[Dict[str, Any]], response_format: Optional[Any] = None,
+                tools: Optional[List[Dict[str, Any]]] = None) -> str:
+    """Exact-match key of a chat completion request to `backend` (a camel model backend)."""
+    payload = {
+        "model": str(getattr(backend, "model_type", "")),
+        "url": getattr(backend, "_url", None),
+        "config": getattr(backend, "model_config_dict", None),
+        "messages": messages,
+        "tools": tools,
+        "response_format": getattr(response_format, "__name__", response_format),
+    }
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ReplayStore:
+    """Recorded chat completions in SQLite (WAL), shared by the threads of a process."""
+
+    def __init__(self, path: str = DEFAULT_REPLAY_PATH, mode: str = RECORD_MISSING):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"unknown replay mode {mode!r}, expected one of {REPLAY_MODES}")
+        self.path = path
+        self.mode = mode
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._conn.execute("UPDATE responses SET replays = replays + 1 WHERE key = ?", (key,))
+        return row[0] if row else None
+
+    def put(self, key: str, model: str, response_json: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at) VALUES (?, ?, ?, ?)",
+                (key, model, response_json, time.time()),
+            )
+
+    def run(self, backend: Any, messages: List[Dict[str, Any]], response_format: Optional[Any],
+            tools: Optional[List[Dict[str, Any]]], call: Callable[[], Any]) -> Any:
+        """Serve the request from the store or `call` it, according to the mode."""
+        from openai.types.chat import ChatCompletion
+
+        if self.mode == OFF:
+            return call()
+        key = request_key(backend, messages, response_format, tools)
+        if self.mode in (REPLAY, RECORD_MISSING):
+            recorded = self.get(key)
+            telemetry.record_cache("llm_replay", recorded is not None)
+            if recorded is not None:
+                return ChatCompletion.model_validate_json(recorded)
+            if self.mode == REPLAY:
+                raise ReplayMiss(f"no recorded response for request {key[:12]} ({len(messages)} messages)")
+
+        response = call()
+        # Streams and parsed (structured output) responses are passed through unrecorded
+        if type(response) is ChatCompletion:
+            self.put(key, str(getattr(backend, "model_type", "")), response.model_dump_json())
+        return response
+
+
+_stores: Dict[Tuple[str, str], ReplayStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_replay_store() -> Optional[ReplayStore]:
+    """Process-wide store for the mode and path in the environment; None when replay is off."""
+    mode = os.getenv(REPLAY_MODE_ENV, OFF)
+    if mode == OFF:
+        return None
+    path = os.getenv(REPLAY_PATH_ENV, DEFAULT_REPLAY_PATH)
+    with _stores_lock:
+        store = _stores.get((mode, path))
+        if store is None:
+            store = _stores[(mode, path)] = ReplayStore(path, mode)
+        return store
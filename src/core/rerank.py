@@ -0,0 +1,183 @@
+import json
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from src.core.models import create_camel_model
+from src.utils.lazy import lazy_import
+from src.utils.telemetry import telemetry, record_llm_response
+
+ChatAgent = lazy_import("camel.agents", "ChatAgent")
+BaseMessage = lazy_import("camel.messages", "BaseMessage")
+
+# Candidates fetched per requested result when reranking is on, and a hard cap
+DEFAULT_OVERFETCH = 3
+MAX_CANDIDATES = 30
+
+# Characters of each candidate shown to the LLM reranker
+LLM_SNIPPET_CHARS = 300
+
+
+def _char_ngrams(text: str, n: int = 2) -> List[str]:
+    """Character n-grams of the non-space characters; works for Chinese without a tokenizer."""
+    chars = [c for c in text.lower() if not c.isspace()]
+    if len(chars) < n:
+        return ["".join(chars)] if chars else []
+    return ["".join(chars[i:i + n]) for i in range(len(chars) - n + 1)]
+
+
+class BaseReranker:
+    """Scores retrieved candidates against the query. Higher is better, range 0..1."""
+    name = "base"
+
+    def score(self, query: str, candidates: List[Dict[str, Any]]) -> List[float]:
+        raise NotImplementedError
+
+
+class LexicalReranker(BaseReranker):
+    """
+    Local, dependency-free reranker: BM25 over character bigrams of the
+    candidates, blended with the vector similarity.
+    """
+    name = "lexical"
+
+    def __init__(self, similarity_weight: float = 0.5, k1: float = 1.2, b: float = 0.75):
+        self.similarity_weight = similarity_weight
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query: str, candidates: List[Dict[str, Any]]) -> List[float]:
+        if not candidates:
+            return []
+        query_terms = set(_char_ngrams(query))
+        docs = [Counter(_char_ngrams(c.get('text', ''))) for c in candidates]
+        avg_len = sum(sum(d.values()) for d in docs) / len(docs) or 1.0
+        doc_freq = Counter(term for d in docs for term in d if term in query_terms)
+
+        bm25 = []
+        for d in docs:
+            length = sum(d.values())
+            total = 0.0
+            for term in query_terms:
+                tf = d.get(term, 0)
+                if not tf:
+                    continue
+                idf = math.log(1 + (len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                total += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_len))
+            bm25.append(total)
+
+        top = max(bm25) or 1.0
+        w = self.similarity_weight
+        return [w * float(c.get('similarity', 0.0)) + (1 - w) * (s / top) for c, s in zip(candidates, bm25)]
+
+
+class LLMReranker(BaseReranker):
+    """Scores all candidates with one batched chat completion (0-10 per candidate)."""
+    name = "llm"
+
+    def __init__(self, model_config: Any):
+        self.model_config = model_config
+
+    def _build_prompt(self, query: str, candidates: List[Dict[str, Any]]) -> str:
+        lines = [
+            "请判断下面每个候选片段对回答问题的帮助程度，按 0-10 的整数打分（10 表示直接回答了问题）。",
+            f"只输出一个 JSON 数组，按顺序给出 {len(candidates)} 个分数，例如 [7, 2, 9]。",
+            "",
+            f"问题：{query}",
+            "",
+        ]
+        for idx, candidate in enumerate(candidates, start=1):
+            snippet = candidate.get('text', '')[:LLM_SNIPPET_CHARS].replace("\n", " ")
+            lines.append(f"[{idx}] {snippet}")
+        return "\n".join(lines)
+
+    def _step(self, prompt: str) -> Any:
+        sys_msg = BaseMessage.make_assistant_message(role_name="Reranker", content="你是检索结果相关性评估助手。")
+        agent = ChatAgent(system_message=sys_msg, model=create_camel_model(self.model_config, {"temperature": 0.0}))
+        with telemetry.span("llm.step", purpose="rerank") as span:
+            response = agent.step(BaseMessage.make_user_message(role_name="User", content=prompt))
+            record_llm_response(span, response)
+        return response
+
+    @staticmethod
+    def parse_scores(content: str, expected: int) -> Optional[List[float]]:
+        """Extract the JSON score array from the model reply; None if it does not fit."""
+        match = re.search(r"\[[^\[\]]*\]", content or "")
+        if not match:
+            return None
+        try:
+            scores = [float(x) for x in json.loads(match.group(0))]
+        except (ValueError, TypeError):
+            return None
+        if len(scores) != expected:
+            return None
+        return [min(max(s, 0.0), 10.0) / 10.0 for s in scores]
+
+    def score(self, query: str, candidates: List[Dict[str, Any]]) -> List[float]:
+        if not candidates:
+            return []
+        try:
+            response = self._step(self._build_prompt(query, candidates))
+            content = response.msg.content if response and getattr(response, "msg", None) else ""
+            scores = self.parse_scores(content, len(candidates))
+        except Exception as e:
+            print(f"LLM rerank failed: {e}")
+            scores = None
+        if scores is None:
+            # Fall back to the vector ranking rather than dropping the context
+            return [float(c.get('similarity', 0.0)) for c in candidates]
+        return scores
+
+
+def get_reranker(kind: Optional[str], model_config: Any = None) -> Optional[BaseReranker]:
+    """Build a reranker by name: None, "lexical" or "llm"."""
+    if kind == "lexical":
+        return LexicalReranker()
+    if kind == "llm":
+        return LLMReranker(model_config)
+    return None
+
+
+def adaptive_cutoff(scores: List[float], max_keep: int, min_keep: int = 1,
+                    relative_floor: float = 0.6, min_gap: float = 0.15) -> int:
+    """
+    Number of leading items to keep from scores sorted in descending order.
+    Keeps items scoring at least `relative_floor` of the best one and cuts at the
+    steepest drop if that drop exceeds `min_gap` of the best score.
+    """
+    if not scores:
+        return 0
+    max_keep = max(min(max_keep, len(scores)), 1)
+    top = scores[0]
+    if top <= 0:
+        return min(max(min_keep, 1), max_keep)
+
+    keep = 1
+    while keep < max_keep and scores[keep] >= top * relative_floor:
+        keep += 1
+
+    drops = [(scores[i - 1] - scores[i], i) for i in range(1, keep)]
+    if drops:
+        largest_drop, position = max(drops)
+        if largest_drop >= top * min_gap:
+            keep = position
+
+    return min(max(keep, min_keep), max_keep)
+
+
+def rerank_results(query: str, results: List[Dict[str, Any]], reranker: BaseReranker,
+                   top_k: int, min_keep: int = 1) -> List[Dict[str, Any]]:
+    """Score the candidates, sort them and cut the list where the scores drop off."""
+    if not results:
+        return []
+    with telemetry.span("rag.rerank", reranker=reranker.name, candidates=len(results)) as span:
+        scores = reranker.score(query, results)
+        ranked = sorted(
+            ({**res, 'rerank_score': float(score)} for res, score in zip(results, scores)),
+            key=lambda r: r['rerank_score'],
+            reverse=True,
+        )
+        keep = adaptive_cutoff([r['rerank_score'] for r in ranked], max_keep=top_k, min_keep=min_keep)
+        span.set(kept=keep)
+        return ranked[:keep]
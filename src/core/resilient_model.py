@@ -0,0 +1,29 @@
+from typing import Any, Dict, List, Optional
+
+from camel.models import ModelManager
+
+from src.core.replay import ReplayStore
+from src.utils.resilience import ResilientCaller
+
+
+class ResilientModelManager(ModelManager):
+    """
+    camel ModelManager whose synchronous calls go through a ResilientCaller
+    (deadline, hedging, retry budget, circuit breaker). ChatAgent accepts a
+    ModelManager as its model, so agents use it unchanged.
+    With a ReplayStore, recorded responses are served before the caller is involved.
+    """
+
+    def __init__(self, model: Any, caller: ResilientCaller, replay: Optional[ReplayStore] = None):
+        super().__init__(model)
+        self.caller = caller
+        self.replay = replay
+
+    def run(self, messages: List[Dict[str, Any]], response_format: Optional[Any] = None,
+            tools: Optional[List[Dict[str, Any]]] = None) -> Any:
+        def call():
+            return self.caller.call(lambda: ModelManager.run(self, messages, response_format, tools))
+
+        if self.replay is None:
+            return call()
+        return self.replay.run(self.current_model, messages, response_format, tools, call)
@@ -0,0 +1,434 @@
+"""
+On-disk vector storage for knowledge bases larger than memory.
+
+Vectors are L2-normalized float32 rows appended to size-bounded shard files
+(shard-00000.f32, ...) and read through np.memmap, so opening a knowledge base
+reads only a small SQLite index and pages are faulted in by the searches that
+touch them. Payloads and the filterable payload fields (storage.PAYLOAD_FIELDS)
+live in that SQLite index. A query scans every shard in parallel, in blocks of
+SCAN_BLOCK_ROWS so memory stays bounded, and merges the per-shard top-k by
+cosine similarity. Deleted rows are tombstoned until compact() rewrites the shards.
+
+Two-stage search: with `coarse_dim`, every shard also keeps the first
+coarse_dim components of each vector (renormalized; Matryoshka-trained models
+such as text-embedding-v4 keep most of their quality at short prefixes). The
+first pass scans only those short vectors; the best RESCORE_FACTOR * top_k
+rows of each shard are then rescored with their full vectors.
+
+Settings (environment):
+    MEDRAG_SHARD_MAX_MB     maximum size of one shard file (default 256)
+    MEDRAG_SHARD_WORKERS    threads scanning shards in parallel (default 4)
+    MEDRAG_RESCORE_FACTOR   first-pass candidates per shard, as a multiple of top_k (default 10)
+"""
+import heapq
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from camel.storages import BaseVectorStorage, VectorDBQuery, VectorDBQueryResult, VectorRecord
+from camel.storages.vectordb_storages import VectorDBStatus
+
+from src.utils.telemetry import telemetry
+
+SHARDS_DIR = "shards"
+INDEX_FILE = "index.db"
+
+SHARD_MAX_MB = float(os.getenv("MEDRAG_SHARD_MAX_MB", "256"))
+SHARD_WORKERS = int(os.getenv("MEDRAG_SHARD_WORKERS", "4"))
+RESCORE_FACTOR = int(os.getenv("MEDRAG_RESCORE_FACTOR", "10"))
+# Rows scored per matrix product; bounds the memory of one shard scan
+SCAN_BLOCK_ROWS = 65536
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    shard INTEGER PRIMARY KEY,
+    rows INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    shard INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    payload TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS records_position ON records (shard, row);
+CREATE TABLE IF NOT EXISTS fields (
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    row INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fields_lookup ON fields (name, value, shard, row);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _scan_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="shard-scan")
+        return _executor
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _field_values(value: Any) -> List[str]:
+    """Indexed representations of a payload field; list fields (section prefixes) match any element."""
+    values = value if isinstance(value, list) else [value]
+    return [json.dumps(v, ensure_ascii=False) for v in values]
+
+
+class ShardedStorage(BaseVectorStorage):
+    """
+    Memory-mapped, sharded vector storage (cosine similarity) in `path`/shards.
+    `coarse_dim` enables two-stage search; it is fixed when the first vectors are
+    added and read from the index when an existing storage is opened.
+    """
+
+    def __init__(self, vector_dim: int, path: str, shard_max_vectors: Optional[int] = None,
+                 indexed_fields: Optional[List[str]] = None, coarse_dim: Optional[int] = None,
+                 rescore_factor: int = RESCORE_FACTOR, shards_dir: str = SHARDS_DIR):
+        from src.core.storage import PAYLOAD_FIELDS
+
+        self.vector_dim = vector_dim
+        # Absolute, so compact() can stage and swap sibling directories wherever the process runs
+        self.path = os.path.abspath(os.path.join(path, shards_dir))
+        retired = self.path + ".old"
+        if not os.path.isdir(self.path) and os.path.isdir(retired):
+            # A compaction stopped between its two renames; the retired copy is complete
+            os.replace(retired, self.path)
+        self.shard_max_vectors = shard_max_vectors or max(1, int(SHARD_MAX_MB * 2 ** 20) // (4 * vector_dim))
+        self.indexed_fields = list(indexed_fields if indexed_fields is not None else PAYLOAD_FIELDS)
+        os.makedirs(self.path, exist_ok=True)
+        self._conn = self._connect()
+        self._lock = threading.Lock()
+        self.coarse_dim = self._init_coarse_dim(coarse_dim)
+        self.rescore_factor = rescore_factor
+        # (shard, coarse) -> (rows, memmap); remapped when the shard grows
+        self._maps: Dict[Tuple[int, bool], Tuple[int, np.memmap]] = {}
+        # shard -> (deleted count, row numbers of deleted records)
+        self._tombstones: Dict[int, Tuple[int, np.ndarray]] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(os.path.join(self.path, INDEX_FILE), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _init_coarse_dim(self, coarse_dim: Optional[int]) -> Optional[int]:
+        stored = self._conn.execute("SELECT value FROM settings WHERE key = 'coarse_dim'").fetchone()
+        if stored:
+            return int(stored[0]) or None
+        if coarse_dim and not 0 < coarse_dim < self.vector_dim:
+            raise ValueError(f"coarse_dim must be between 1 and {self.vector_dim - 1}, got {coarse_dim}")
+        if coarse_dim and self._conn.execute("SELECT COUNT(*) FROM shards").fetchone()[0]:
+            raise ValueError("coarse vectors can only be enabled on an empty index")
+        self._conn.execute("INSERT INTO settings (key, value) VALUES ('coarse_dim', ?)", (str(coarse_dim or 0),))
+        return coarse_dim or None
+
+    def shard_file(self, shard: int, coarse: bool = False) -> str:
+        suffix = f".c{self.coarse_dim}" if coarse else ""
+        return os.path.join(self.path, f"shard-{shard:05d}{suffix}.f32")
+
+    def _shards(self) -> List[Tuple[int, int, int]]:
+        """(shard, rows, deleted) for every shard; a tiny table read per query so instances stay in sync."""
+        with self._lock:
+            return self._conn.execute("SELECT shard, rows, deleted FROM shards ORDER BY shard").fetchall()
+
+    def _matrix(self, shard: int, rows: int, coarse: bool = False) -> np.memmap:
+        cached = self._maps.get((shard, coarse))
+        if cached is None or cached[0] != rows:
+            dim = self.coarse_dim if coarse else self.vector_dim
+            matrix = np.memmap(self.shard_file(shard, coarse), dtype=np.float32, mode="r", shape=(rows, dim))
+            cached = self._maps[(shard, coarse)] = (rows, matrix)
+        return cached[1]
+
+    def _deleted_rows(self, shard: int, deleted: int) -> np.ndarray:
+        cached = self._tombstones.get(shard)
+        if cached is None or cached[0] != deleted:
+            with self._lock:
+                rows = self._conn.execute("SELECT row FROM records WHERE shard = ? AND deleted = 1",
+                                          (shard,)).fetchall()
+            cached = self._tombstones[shard] = (deleted, np.array([r for (r,) in rows], dtype=np.int64))
+        return cached[1]
+
+    def add(self, records: List[VectorRecord], **kwargs: Any) -> None:
+        if records:
+            self.add_arrays(np.asarray([r.vector for r in records], dtype=np.float32),
+                            [r.payload for r in records], [r.id for r in records])
+
+    def add_arrays(self, vectors: np.ndarray, payloads: List[Optional[Dict[str, Any]]],
+                   ids: Optional[List[str]] = None) -> None:
+        """add() for a (n, vector_dim) array, without building a VectorRecord per row."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(payloads), self.vector_dim)
+        ids = [str(i) if i else str(uuid.uuid4()) for i in (ids or [None] * len(payloads))]
+        with self._lock:
+            last = self._conn.execute("SELECT shard, rows FROM shards ORDER BY shard DESC LIMIT 1").fetchone()
+            shard, rows = last if last else (0, 0)
+            start = 0
+            self._conn.execute("BEGIN")
+            try:
+                while start < len(payloads):
+                    if rows >= self.shard_max_vectors:
+                        shard, rows = shard + 1, 0
+                    end = start + min(len(payloads) - start, self.shard_max_vectors - rows)
+                    self._append(shard, rows, vectors[start:end], payloads[start:end], ids[start:end])
+                    rows += end - start
+                    start = end
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _append(self, shard: int, rows: int, vectors: np.ndarray, payloads: List[Optional[Dict[str, Any]]],
+                ids: List[str]):
+        """Write rows `rows`.. of a shard; called inside the add transaction."""
+        files = [(self.shard_file(shard), _normalize(vectors))]
+        if self.coarse_dim:
+            files.append((self.shard_file(shard, coarse=True), _normalize(vectors[:, :self.coarse_dim])))
+        for path, data in files:
+            with open(path, "ab") as f:
+                # Drop rows written by an add that crashed before its transaction committed
+                f.truncate(rows * data.shape[1] * 4)
+                f.write(np.ascontiguousarray(data).tobytes())
+        entries, fields = [], []
+        for row, (record_id, payload) in enumerate(zip(ids, payloads), start=rows):
+            payload = payload or {}
+            entries.append((record_id, shard, row, json.dumps(payload, ensure_ascii=False, default=str)))
+            for name in self.indexed_fields:
+                if payload.get(name) is not None:
+                    fields.extend((name, value, shard, row) for value in _field_values(payload[name]))
+        self._conn.executemany("INSERT INTO records (id, shard, row, payload) VALUES (?, ?, ?, ?)", entries)
+        self._conn.executemany("INSERT INTO fields (name, value, shard, row) VALUES (?, ?, ?, ?)", fields)
+        self._conn.execute(
+            "INSERT INTO shards (shard, rows) VALUES (?, ?) ON CONFLICT (shard) DO UPDATE SET rows = excluded.rows",
+            (shard, rows + len(payloads)),
+        )
+
+    def delete(self, ids: List[str], **kwargs: Any) -> None:
+        """Tombstone records; their rows stay in the shard files until compaction."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for record_id in ids:
+                row = self._conn.execute("SELECT shard FROM records WHERE id = ? AND deleted = 0",
+                                         (str(record_id),)).fetchone()
+                if row:
+                    self._conn.execute("UPDATE records SET deleted = 1 WHERE id = ?", (str(record_id),))
+                    self._conn.execute("UPDATE shards SET deleted = deleted + 1 WHERE shard = ?", row)
+            self._conn.execute("COMMIT")
+
+    def status(self) -> VectorDBStatus:
+        live = sum(rows - deleted for _, rows, deleted in self._shards())
+        return VectorDBStatus(vector_dim=self.vector_dim, vector_count=live)
+
+    def _filter_rows(self, shard: int, filter_conditions: Dict[str, Any]) -> np.ndarray:
+        """Rows of a shard whose indexed fields equal all the given values."""
+        matched: Optional[set] = None
+        for name, value in filter_conditions.items():
+            if name not in self.indexed_fields:
+                raise ValueError(f"payload field {name!r} is not indexed; filterable: {self.indexed_fields}")
+            with self._lock:
+                rows = self._conn.execute("SELECT row FROM fields WHERE name = ? AND value = ? AND shard = ?",
+                                          (name, _field_values(value)[0], shard)).fetchall()
+            found = {r for (r,) in rows}
+            matched = found if matched is None else matched & found
+            if not matched:
+                break
+        return np.array(sorted(matched or ()), dtype=np.int64)
+
+    @staticmethod
+    def _top(matrix: np.memmap, query: np.ndarray, k: int, rows: int, candidates: Optional[np.ndarray],
+             excluded: Optional[np.ndarray]) -> List[Tuple[float, int]]:
+        """Best k (score, row) of a matrix, over `candidates` or over all rows not `excluded`."""
+        if candidates is not None:
+            blocks = [candidates[i:i + SCAN_BLOCK_ROWS] for i in range(0, len(candidates), SCAN_BLOCK_ROWS)]
+        else:
+            blocks = [np.arange(i, min(i + SCAN_BLOCK_ROWS, rows)) for i in range(0, rows, SCAN_BLOCK_ROWS)]
+
+        best: List[Tuple[float, int]] = []
+        for row_ids in blocks:
+            if candidates is not None:
+                scores = matrix[row_ids] @ query
+            else:
+                scores = np.asarray(matrix[row_ids[0]:row_ids[-1] + 1]) @ query
+                if excluded is not None:
+                    scores[np.isin(row_ids, excluded)] = -np.inf
+            n = min(k, len(scores))
+            if not n:
+                continue
+            top = np.argpartition(-scores, n - 1)[:n]
+            best = heapq.nlargest(k, best + [(float(scores[i]), int(row_ids[i])) for i in top if scores[i] != -np.inf])
+        return best
+
+    def _scan(self, shard: int, rows: int, deleted: int, query: np.ndarray, coarse_query: Optional[np.ndarray],
+              top_k: int, filter_conditions: Optional[Dict[str, Any]]) -> List[Tuple[float, int, int]]:
+        """Top-k (score, shard, row) of one shard, by exact cosine similarity."""
+        excluded = self._deleted_rows(shard, deleted) if deleted else None
+        candidates = None
+        if filter_conditions:
+            candidates = self._filter_rows(shard, filter_conditions)
+            if excluded is not None:
+                candidates = np.setdiff1d(candidates, excluded, assume_unique=True)
+        matrix = self._matrix(shard, rows)
+        if coarse_query is None:
+            return [(score, shard, row) for score, row in self._top(matrix, query, top_k, rows, candidates, excluded)]
+
+        first_pass = self._top(self._matrix(shard, rows, coarse=True), coarse_query, top_k * self.rescore_factor,
+                               rows, candidates, excluded)
+        if not first_pass:
+            return []
+        # Sorted rows read the full-vector file front to back
+        row_ids = np.array(sorted(row for _, row in first_pass), dtype=np.int64)
+        scores = matrix[row_ids] @ query
+        return heapq.nlargest(top_k, ((float(score), shard, int(row)) for score, row in zip(scores, row_ids)))
+
+    def query(self, query: VectorDBQuery, filter_conditions: Optional[Dict[str, Any]] = None,
+              **kwargs: Any) -> List[VectorDBQueryResult]:
+        vector = np.asarray(query.query_vector, dtype=np.float32)
+        coarse_vector = _normalize(vector[:self.coarse_dim]) if self.coarse_dim else None
+        vector = _normalize(vector)
+        shards = [(s, rows, deleted) for s, rows, deleted in self._shards() if rows > deleted]
+        telemetry.incr("storage.shards_scanned", len(shards))
+        args = (vector, coarse_vector, query.top_k, filter_conditions)
+        if len(shards) == 1:
+            per_shard = [self._scan(*shards[0], *args)]
+        else:
+            futures = [_scan_executor().submit(self._scan, *shard, *args) for shard in shards]
+            per_shard = [f.result() for f in futures]
+        best = heapq.nlargest(query.top_k, (hit for hits in per_shard for hit in hits))
+        rows = {s: r for s, r, _ in shards}
+        return [self._result(score, shard, row, rows[shard]) for score, shard, row in best]
+
+    def _result(self, score: float, shard: int, row: int, rows: int) -> VectorDBQueryResult:
+        with self._lock:
+            record_id, payload = self._conn.execute(
+                "SELECT id, payload FROM records WHERE shard = ? AND row = ?", (shard, row)).fetchone()
+        return VectorDBQueryResult.create(similarity=score, vector=self._matrix(shard, rows)[row].tolist(),
+                                          id=record_id, payload=json.loads(payload) if payload else None)
+
+    def iter_records(self, with_vectors: bool = True,
+                     batch_size: int = 1024) -> Iterator[Tuple[str, Optional[np.ndarray], Dict[str, Any]]]:
+        """Live records in storage order as (id, normalized vector or None, payload)."""
+        for shard, rows, _ in self._shards():
+            last = -1
+            while True:
+                with self._lock:
+                    batch = self._conn.execute(
+                        "SELECT row, id, payload FROM records WHERE shard = ? AND row > ? AND deleted = 0 "
+                        "ORDER BY row LIMIT ?", (shard, last, batch_size)).fetchall()
+                if not batch:
+                    break
+                last = batch[-1][0]
+                vectors = self._matrix(shard, rows)[[row for row, _, _ in batch]] if with_vectors else None
+                for i, (_, record_id, payload) in enumerate(batch):
+                    yield record_id, (vectors[i] if with_vectors else None), json.loads(payload) if payload else {}
+
+    def compact(self) -> int:
+        """Rewrite the shards without deleted rows; returns the bytes reclaimed."""
+        before = self.disk_bytes()
+        staging = self.path + ".compact"
+        retired = self.path + ".old"
+        shutil.rmtree(staging, ignore_errors=True)
+        target = ShardedStorage(self.vector_dim, os.path.dirname(self.path), self.shard_max_vectors,
+                                self.indexed_fields, self.coarse_dim, self.rescore_factor,
+                                shards_dir=os.path.basename(staging))
+        try:
+            ids, payloads, vectors = [], [], []
+            for record_id, vector, payload in self.iter_records():
+                ids.append(record_id)
+                payloads.append(payload)
+                vectors.append(vector)
+                if len(ids) >= SCAN_BLOCK_ROWS:
+                    target.add_arrays(np.stack(vectors), payloads, ids)
+                    ids, payloads, vectors = [], [], []
+            if ids:
+                target.add_arrays(np.stack(vectors), payloads, ids)
+            copied, expected = target.status().vector_count, self.status().vector_count
+            if copied != expected:
+                raise RuntimeError(f"compaction copied {copied} of {expected} records")
+        except BaseException:
+            target.close()
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        target.close()
+
+        with self._lock:
+            self._maps.clear()
+            self._tombstones.clear()
+            self._conn.close()
+            try:
+                os.replace(self.path, retired)
+                try:
+                    os.replace(staging, self.path)
+                except OSError:
+                    os.replace(retired, self.path)
+                    raise
+            finally:
+                self._conn = self._connect()
+                shutil.rmtree(staging, ignore_errors=True)
+        # Searches still holding maps of the old files keep reading them until they finish
+        shutil.rmtree(retired, ignore_errors=True)
+        return before - self.disk_bytes()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._maps.clear()
+            self._tombstones.clear()
+            self._conn.executescript("DELETE FROM records; DELETE FROM fields; DELETE FROM shards;")
+            for name in os.listdir(self.path):
+                if name.endswith(".f32"):
+                    os.remove(os.path.join(self.path, name))
+
+    def load(self) -> None:
+        # Nothing to load: shards are mapped on first search
+        pass
+
+    def close(self):
+        with self._lock:
+            self._maps.clear()
+            self._conn.close()
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def disk_bytes(self) -> int:
+        """Bytes used by the shard files and the index."""
+        return sum(os.path.getsize(os.path.join(self.path, f)) for f in os.listdir(self.path))
+
+    def vector_bytes(self, coarse: bool = False) -> int:
+        """Bytes of the full (or coarse) vector files: what one unfiltered first pass reads."""
+        return sum(os.path.getsize(self.shard_file(shard, coarse)) for shard, _, _ in self._shards()
+                   if os.path.exists(self.shard_file(shard, coarse)))
+
+
+_storages: Dict[Tuple[str, int], ShardedStorage] = {}
+_storages_lock = threading.Lock()
+
+
+def get_sharded_storage(path: str, vector_dim: int, coarse_dim: Optional[int] = None) -> ShardedStorage:
+    """Process-wide storage of a KB directory, shared by the sessions that open it."""
+    key = (os.path.abspath(path), vector_dim)
+    with _storages_lock:
+        storage = _storages.get(key)
+        if storage is None:
+            storage = _storages[key] = ShardedStorage(vector_dim, path, coarse_dim=coarse_dim)
+        return storage
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import warnings
+import weakref
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from camel.storages import BaseVectorStorage, VectorDBQuery, VectorDBQueryResult, VectorRecord
+from camel.storages.vectordb_storages import VectorDBStatus
+
+from src.core.hierarchy import section_prefixes
+from src.utils.coalesce import SingleFlight
+from src.utils.telemetry import telemetry
+
+
+# Top-level payload fields written for every chunk and indexed for filtering -> Qdrant schema
+PAYLOAD_FIELDS = {
+    "source": "keyword",
+    "section": "keyword",
+    "chunk_ordinal": "integer",
+    "ingested_at": "float",
+}
+
+
+
+# Identical concurrent searches on the same collection share one execution
+_search_flight = SingleFlight("vector_search")
+
+# Local (in-process) Qdrant clients are not safe for concurrent use: calls on one
+# client are serialized, and the time spent waiting is recorded as lock contention
+_local_client_locks: "weakref.WeakKeyDictionary[Any, threading.Lock]" = weakref.WeakKeyDictionary()
+_local_client_locks_guard = threading.Lock()
+
+
+def _local_client_lock(storage: BaseVectorStorage) -> Optional[threading.Lock]:
+    client = getattr(storage, "_client", None)
+    if type(getattr(client, "_client", None)).__name__ != "QdrantLocal":
+        return None
+    with _local_client_locks_guard:
+        lock = _local_client_locks.get(client)
+        if lock is None:
+            lock = _local_client_locks[client] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def _client_access(storage: BaseVectorStorage) -> Iterator[None]:
+    """
+    Holds the storage's local-client lock (if any). Counters: storage.lock_acquisitions,
+    storage.lock_contended (had to wait) and storage.lock_wait_ms, also set on the current span.
+    """
+    lock = _local_client_lock(storage)
+    if lock is None:
+        yield
+        return
+    contended = not lock.acquire(blocking=False)
+    if contended:
+        start = time.perf_counter()
+        lock.acquire()
+        wait_ms = (time.perf_counter() - start) * 1000
+        telemetry.incr("storage.lock_contended")
+        telemetry.incr("storage.lock_wait_ms", wait_ms)
+    telemetry.incr("storage.lock_acquisitions")
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def add_structured_fields(payload: Dict[str, Any], ingested_at: float) -> Dict[str, Any]:
+    """
+    Copy the filterable facts of a chunk out of camel's nested metadata into
+    top-level payload fields (see PAYLOAD_FIELDS). Existing values are kept.
+    """
+    metadata = payload.get("metadata") or {}
+    payload.setdefault("source", metadata.get("filename") or os.path.basename(payload.get("content path", "")))
+    payload.setdefault("section", section_prefixes(metadata.get("section", "")))
+    payload.setdefault("chunk_ordinal", int(metadata.get("piece_num") or 0))
+    payload.setdefault("ingested_at", ingested_at)
+    return payload
+
+
+class InstrumentedStorage(BaseVectorStorage):
+    """
+    Wraps a vector storage and records spans for writes and searches.
+    Records written through it get the structured payload fields used by filtered retrieval.
+    """
+
+    def __init__(self, storage: BaseVectorStorage):
+        self.storage = storage
+        # Set during ingestion (compaction.IngestDeduplicator): records of skipped duplicate chunks are dropped
+        self.dedup = None
+
+    def add(self, records: List[VectorRecord], **kwargs: Any) -> None:
+        if self.dedup is not None:
+            records = [r for r in records if not self.dedup.is_placeholder(r.vector)]
+            if not records:
+                return
+        ingested_at = time.time()
+        for record in records:
+            if record.payload is not None:
+                add_structured_fields(record.payload, ingested_at)
+        with telemetry.span("rag.vector_add", num_records=len(records)), _client_access(self.storage):
+            self.storage.add(records, **kwargs)
+
+    def create_payload_indexes(self) -> None:
+        """Create payload indexes for PAYLOAD_FIELDS (no-op in local mode, used by a Qdrant server)."""
+        if self.client is None:
+            # Storages without a Qdrant client index PAYLOAD_FIELDS themselves
+            return
+        with warnings.catch_warnings(), _client_access(self.storage):
+            warnings.filterwarnings("ignore", message="Payload indexes have no effect")
+            for field_name, schema in PAYLOAD_FIELDS.items():
+                self.client.create_payload_index(
+                    collection_name=self.collection_name, field_name=field_name, field_schema=schema
+                )
+
+    def delete(self, ids: List[str], **kwargs: Any) -> None:
+        with _client_access(self.storage):
+            self.storage.delete(ids, **kwargs)
+
+    def status(self) -> VectorDBStatus:
+        with _client_access(self.storage):
+            return self.storage.status()
+
+    def _search_key(self, query: VectorDBQuery, kwargs: Dict[str, Any]) -> tuple:
+        vector = hashlib.sha1(np.asarray(query.query_vector, dtype=np.float32).tobytes()).hexdigest()
+        options = json.dumps(kwargs, sort_keys=True, default=str, ensure_ascii=False)
+        # Sessions opening the same KB path share one client (camel keeps one per path)
+        client = getattr(self.storage, "_client", self.storage)
+        return id(client), getattr(self.storage, "collection_name", None), query.top_k, vector, options
+
+    def query(self, query: VectorDBQuery, **kwargs: Any) -> List[VectorDBQueryResult]:
+        with telemetry.span("rag.vector_search", top_k=query.top_k,
+                            filtered=bool(kwargs.get("filter_conditions"))) as span:
+            def search() -> List[VectorDBQueryResult]:
+                with _client_access(self.storage):
+                    return self.storage.query(query, **kwargs)
+
+            results = _search_flight.do(self._search_key(query, kwargs), search)
+            span.set(num_results=len(results))
+            return results
+
+    def clear(self) -> None:
+        with _client_access(self.storage):
+            self.storage.clear()
+
+    def iter_points(self, with_vectors: bool = True,
+                    batch_size: int = 256) -> Iterator[Tuple[str, Optional[np.ndarray], Dict[str, Any]]]:
+        """Every stored point as (id, vector or None, payload)."""
+        if hasattr(self.storage, "iter_records"):
+            yield from self.storage.iter_records(with_vectors, batch_size)
+            return
+        offset = None
+        while True:
+            with _client_access(self.storage):
+                points, offset = self.client.scroll(
+                    collection_name=self.collection_name, limit=batch_size, offset=offset,
+                    with_payload=True, with_vectors=with_vectors,
+                )
+            for point in points:
+                vector = np.asarray(point.vector, dtype=np.float32) if with_vectors else None
+                yield str(point.id), vector, point.payload or {}
+            if offset is None:
+                return
+
+    def load(self) -> None:
+        self.storage.load()
+
+    @property
+    def client(self) -> Any:
+        return self.storage.client
+
+    def __getattr__(self, name: str) -> Any:
+        # Expose attributes of the wrapped storage (collection_name, vector_dim, ...)
+        return getattr(self.__dict__["storage"], name)
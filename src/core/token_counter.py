@@ -0,0 +1,31 @@
+from typing import Any, Dict, List
+
+from camel.utils import BaseTokenCounter
+
+from src.core.context import estimate_tokens
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class EstimatingTokenCounter(BaseTokenCounter):
+    """
+    Token counter based on estimate_tokens. Unlike camel's default OpenAITokenCounter
+    it needs no tiktoken encoding download, so agents work on machines without network.
+    encode/decode are per character.
+    """
+
+    def count_tokens_from_messages(self, messages: List[Dict[str, Any]]) -> int:
+        total = 0
+        for message in messages:
+            content = message.get("content") or ""
+            if not isinstance(content, str):
+                content = str(content)
+            total += estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        return total
+
+    def encode(self, text: str) -> List[int]:
+        return [ord(char) for char in text]
+
+    def decode(self, token_ids: List[int]) -> str:
+        return "".join(chr(token_id) for token_id in token_ids)
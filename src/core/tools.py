@@ -1,4 +1,13 @@
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+
+from src.utils.lazy import lazy_import
+
+VectorDBQuery = lazy_import("camel.storages", "VectorDBQuery")
+
+# Upper bound on concurrent vector searches issued by a single tool call
+MAX_PARALLEL_QUERIES = 8
+
 
 def search_medical_records(query: str, retriever: Any, top_k: int = 3, similarity_threshold: float = 0.5) -> str:
     """
@@ -53,3 +62,72 @@ def search_medical_records(query: str, retriever: Any, top_k: int = 3, similarit
         
     except Exception as e:
         return f"查询出错: {str(e)}"
+
+
+def search_medical_records_multi(queries: List[str], retriever: Any, top_k: int = 3, similarity_threshold: float = 0.5) -> str:
+    """
+    Search the patient's medical records for several questions at once.
+
+    All queries are embedded in a single batch call and the vector searches run
+    in parallel, so one tool call replaces several sequential round trips.
+    Chunks already returned for an earlier query are not repeated.
+    It reads `retriever.storage` directly and skips `retriever.query`, so
+    anything a retriever adds in query() does not apply here.
+
+    Args:
+        queries: The list of questions or keywords to search for.
+        retriever: The initialized vector retriever object to use for searching.
+        top_k: The number of top results to retrieve for each query.
+        similarity_threshold: The threshold for filtering irrelevant results.
+
+    Returns:
+        str: The relevant information grouped by query.
+    """
+    # Drop empty and repeated queries while keeping the original order
+    unique_queries = []
+    for query in queries or []:
+        query = str(query).strip()
+        if query and query not in unique_queries:
+            unique_queries.append(query)
+
+    if not unique_queries:
+        return "未找到相关记录。"
+
+    try:
+        vectors = retriever.embedding_model.embed_list(objs=unique_queries)
+        retriever.storage.load()
+
+        def run_query(vector):
+            return retriever.storage.query(query=VectorDBQuery(query_vector=vector, top_k=top_k))
+
+        with ThreadPoolExecutor(max_workers=min(len(vectors), MAX_PARALLEL_QUERIES)) as executor:
+            all_results = list(executor.map(run_query, vectors))
+
+        seen_texts = set()
+        sections = []
+        for idx, (query, results) in enumerate(zip(unique_queries, all_results), start=1):
+            texts = []
+            repeated = 0
+            for result in results:
+                payload = result.record.payload or {}
+                text = payload.get('text', '')
+                if not text or result.similarity < similarity_threshold:
+                    continue
+                if text in seen_texts:
+                    repeated += 1
+                    continue
+                seen_texts.add(text)
+                texts.append(text)
+
+            if texts:
+                body = "\n\n".join(texts)
+            elif repeated:
+                body = "相关内容已在上方列出。"
+            else:
+                body = "未找到相关记录。"
+            sections.append(f"【查询 {idx}: {query}】\n{body}")
+
+        return "\n\n".join(sections)
+
+    except Exception as e:
+        return f"查询出错: {str(e)}"
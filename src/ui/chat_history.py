@@ -0,0 +1,70 @@
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import streamlit as st
+
+from src.core.conversations import get_conversation_store
+from src.utils.chat_display import history_window, message_display
+from src.utils.state import session_owner
+
+# Messages rendered on every rerun; older ones are shown one page at a time on request
+HISTORY_PAGE_SIZE = int(os.getenv("MEDRAG_HISTORY_PAGE_SIZE", "20"))
+
+
+def render_tool_calls(message: Dict[str, Any]):
+    """Render the pre-serialized tool calls of a message, if any."""
+    tool_calls = message_display(message)["tool_calls"]
+    if tool_calls:
+        with st.expander("🛠️ 工具调用详情"):
+            st.code("\n\n".join(tool_calls))
+
+
+def render_rag_context(message: Dict[str, Any]):
+    """Render the pre-built retrieved-snippet view of an assistant message."""
+    display = message_display(message)
+    with st.expander(display["rag_title"]):
+        if display["rag_stats"]:
+            st.caption(display["rag_stats"])
+        if not display["rag_html"]:
+            st.caption("没有找到符合阈值的相关文档。")
+        else:
+            st.markdown(display["rag_html"], unsafe_allow_html=True)
+
+
+def render_history(messages: List[Dict[str, Any]], render_message: Callable[[Dict[str, Any]], None], key: str,
+                   page_size: int = HISTORY_PAGE_SIZE):
+    """
+    Render the latest `page_size` messages. Older messages are not rendered unless
+    the user opens them, and then only one page, so a rerun costs the same however
+    long the conversation is.
+    """
+    _, _, recent_start, pages = history_window(len(messages), page_size)
+    if pages:
+        if st.toggle(f"🕘 显示更早的 {recent_start} 条消息", key=f"{key}_show_older"):
+            page = pages
+            if pages > 1:
+                page = st.number_input(f"页码（共 {pages} 页，1 为最早）", min_value=1, max_value=pages,
+                                       value=pages, step=1, key=f"{key}_older_page")
+            page_start, page_end, _, _ = history_window(len(messages), page_size, int(page))
+            for message in messages[page_start:page_end]:
+                render_message(message)
+            st.divider()
+    for message in messages[recent_start:]:
+        render_message(message)
+
+
+def render_conversation_picker(kind: str, key: str) -> Optional[str]:
+    """List this browser's stored conversations of `kind`; returns the ID the user chose to resume."""
+    conversations = get_conversation_store().list(kind, owner=session_owner())
+    if not conversations:
+        return None
+    with st.expander("🗂️ 历史会话", expanded=False):
+        labels = {
+            f"{c.title or '（无标题）'} · {c.message_count} 条 · {time.strftime('%m-%d %H:%M', time.localtime(c.updated_at))}": c.id
+            for c in conversations
+        }
+        choice = st.selectbox("选择会话", list(labels.keys()), key=f"{key}_choice")
+        if st.button("恢复此会话", key=f"{key}_resume"):
+            return labels[choice]
+    return None
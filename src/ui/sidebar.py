@@ -1,5 +1,11 @@
+import os
+import time
 import streamlit as st
-from src.core.models import ModelConfig
+from src.core.models import ModelConfig, HEALTH_CHECK_INTERVAL_S, model_manager
+from src.core.replay import get_replay_store
+from src.utils.resilience import provider_health
+from src.utils.profiling import profiler
+from src.utils.telemetry import telemetry, InMemoryExporter, PrometheusExporter
 
 def render_model_config_section():
     """Render the model connection settings in the sidebar."""
@@ -33,8 +39,149 @@ def render_model_config_section():
         value=st.session_state.model_config.temperature,
         step=0.1
     )
-    
+
+    render_patient_model_section()
+    render_connection_status()
+
     st.sidebar.markdown("---")
 
 
+def _format_health(label: str, health) -> str:
+    if health is None:
+        return f"⏳ {label}：正在检查连接…"
+    checked = time.strftime("%H:%M:%S", time.localtime(health.checked_at))
+    if not health.ok:
+        return f"🔴 {label}：连接失败（{health.error}） · {checked}"
+    return (f"🟢 {label}：对话 {health.chat_ms:.0f} ms · 向量 {health.embedding_ms:.0f} ms"
+            f"（{health.embedding_dim} 维） · {checked}")
+
+
+@st.fragment(run_every=HEALTH_CHECK_INTERVAL_S)
+def render_connection_status():
+    """
+    Show the last connection check of the configured models. Checks run in the
+    background (a changed config is checked at once, which also warms its connections).
+    """
+    configs = {"模型": st.session_state.model_config}
+    if st.session_state.use_patient_model:
+        patient = st.session_state.patient_model_config.with_fallback(st.session_state.model_config)
+        if patient.model_name != st.session_state.model_config.model_name or patient.base_url != st.session_state.model_config.base_url:
+            configs["病人模型"] = patient
+
+    for label, config in configs.items():
+        if not config.api_key:
+            st.caption(f"⚪ {label}：未填写 API Key")
+            continue
+        st.caption(_format_health(label, model_manager.watch(config)))
+
+    for name, state in provider_health().items():
+        if state != "closed":
+            st.caption(f"⚠️ {name}：{'熔断中，请求快速失败' if state == 'open' else '正在试探恢复'}")
+
+    if st.button("立即检查连接", key="check_connection"):
+        with st.spinner("正在检查连接..."):
+            for config in configs.values():
+                if config.api_key:
+                    model_manager.check(config)
+        st.rerun(scope="fragment")
+
+
+def render_patient_model_section():
+    """Render the optional separate model for the simulated patient."""
+    with st.sidebar.expander("🤒 病人模型 (模拟问诊)", expanded=False):
+        st.session_state.use_patient_model = st.checkbox(
+            "病人使用独立模型",
+            value=st.session_state.use_patient_model,
+            help="病人每轮只需 2–3 句口语回复，可用更小更快的模型；医生仍使用上方模型。"
+        )
+        if not st.session_state.use_patient_model:
+            st.caption("病人与医生共用上方模型。")
+            return
+
+        config = st.session_state.patient_model_config
+        config.model_name = st.text_input("病人 Model Name", value=config.model_name)
+        config.temperature = st.slider(
+            "病人 Temperature",
+            min_value=0.0,
+            max_value=2.0,
+            value=config.temperature,
+            step=0.1
+        )
+        config.max_tokens = int(st.number_input(
+            "病人 Max Tokens",
+            min_value=16,
+            max_value=4096,
+            value=config.max_tokens or 256,
+            step=16
+        ))
+        config.base_url = st.text_input("病人 Base URL", value=config.base_url, help="留空则与医生相同")
+        config.api_key = st.text_input("病人 API Key", value=config.api_key, type="password", help="留空则与医生相同")
+
+
+
+def render_debug_panel():
+    """Render recent telemetry spans and counters in the sidebar."""
+    with st.sidebar.expander("🩺 调试面板 (Telemetry)", expanded=False):
+        memory = telemetry.get_exporter(InMemoryExporter)
+        spans = memory.recent(limit=30) if memory else []
+        if not spans:
+            st.caption("暂无记录，发起一次问答或模拟后再查看。")
+        else:
+            st.dataframe(
+                [
+                    {
+                        "span": span.name,
+                        "ms": round(span.duration_ms, 1),
+                        "status": span.status,
+                        "tokens": span.attributes.get("total_tokens", ""),
+                        "request": span.request_id[:8],
+                    }
+                    for span in spans
+                ],
+                use_container_width=True,
+                hide_index=True,
+            )
+
+        replay = get_replay_store()
+        if replay is not None:
+            st.caption(f"LLM 录制/回放: {replay.mode} · 已录制 {len(replay)} 条 · {replay.path}")
+
+        hit_rates = telemetry.cache_hit_rates()
+        for cache_name, rate in hit_rates.items():
+            st.caption(f"缓存 {cache_name} 命中率: {rate:.0%}")
+
+        prometheus = telemetry.get_exporter(PrometheusExporter)
+        if prometheus:
+            st.download_button(
+                "下载 Prometheus 指标",
+                data=prometheus.render(),
+                file_name="medrag_metrics.prom",
+                mime="text/plain",
+            )
+
+def render_profiling_panel():
+    """Render the profiling toggle and the list of saved profiles in the sidebar."""
+    with st.sidebar.expander("🔬 性能剖析 (Profiling)", expanded=False):
+        session_enabled = st.checkbox(
+            "记录性能剖析",
+            value=profiler.enabled,
+            disabled=profiler.enabled,
+            key="profiling_enabled",
+            help=f"对本会话的每次问答、知识库构建和模拟单步保存 cProfile (.pstats) 与火焰图 (.collapsed) 文件，目录: {profiler.output_dir}"
+                 + ("（已由 MEDRAG_PROFILE 对所有会话开启）" if profiler.enabled else ""),
+        )
+        profiler.use_session_flag(session_enabled)
+
+        profiles = profiler.list_profiles()
+        if not profiles:
+            st.caption("暂无剖析记录。")
+            return
 
+        labels = {f"{p['name']} · {p['elapsed']} · {p['id'][:15]}": p for p in profiles}
+        selected = labels[st.selectbox("剖析记录", list(labels.keys()))]
+        st.code(profiler.summarize(selected["pstats_path"], limit=15))
+        with open(selected["pstats_path"], "rb") as f:
+            st.download_button("下载 .pstats", data=f.read(), file_name=os.path.basename(selected["pstats_path"]))
+        if os.path.exists(selected["collapsed_path"]):
+            with open(selected["collapsed_path"], "rb") as f:
+                st.download_button("下载火焰图 .collapsed", data=f.read(), file_name=os.path.basename(selected["collapsed_path"]))
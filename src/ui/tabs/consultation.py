@@ -1,6 +1,10 @@
 import streamlit as st
-import json
 from src.core.agents import SimulationStatus
+from src.ui.chat_history import render_conversation_picker, render_history, render_tool_calls
+from src.utils.state import open_session_conversation
+
+# Chat avatars per simulation role (system: tool outputs etc)
+ROLE_AVATARS = {"Doctor": "👨‍⚕️", "Patient": "🤒", "system": "🛠️"}
 
 # --- Patient Presets ---
 PATIENT_PRESETS = {
@@ -26,6 +30,14 @@ PATIENT_PRESETS = {
     }
 }
 
+def _render_sim_message(msg):
+    role = msg["role"]
+    with st.chat_message(role, avatar=ROLE_AVATARS.get(role, "❓")):
+        st.write(msg.get("content", ""))
+        # Tool call details were serialized when the message was created
+        render_tool_calls(msg)
+
+
 def render_consultation_tab():
     """Render the Consultation Simulation tab."""
     
@@ -112,9 +124,14 @@ def render_consultation_tab():
                     doctor_instruction=doctor_prompt +  f"你最多进行 {max_iterations} 次问诊，确诊后输出 <DIAGNOSIS_DONE>。", 
                     model_config=st.session_state.model_config,
                     rag_content=rag_text_input if use_rag else "", # Pass the text directly only if enabled
-                    max_steps=max_iterations
+                    max_steps=max_iterations,
+                    patient_model_config=st.session_state.patient_model_config if st.session_state.use_patient_model else None
                 )
             st.session_state.messages_sim = [] # Clear legacy history if any
+            history = st.session_state.agent_manager.chat_history
+            if hasattr(history, "id"):
+                # Stored conversation: keep its ID in the URL so a reload shows it again
+                st.query_params["sim"] = history.id
             
             # 2. Trigger initial message based on mode
             if "我来扮演医生" in mode:
@@ -131,38 +148,21 @@ def render_consultation_tab():
 
             st.rerun()
 
+    resume_id = render_conversation_picker("sim", key="sim_conversations")
+    if resume_id:
+        conversation = open_session_conversation("sim", resume_id, create=False)
+        if conversation is None:
+            st.error("无法恢复该会话")
+        else:
+            st.session_state.agent_manager.resume(conversation)
+            st.rerun()
+
     # --- Simulation Display ---
     st.markdown("### 💬 模拟对话")
     
     # Display History
     if st.session_state.agent_manager.status != SimulationStatus.IDLE:
-        for msg in st.session_state.agent_manager.chat_history:
-            role = msg["role"]
-            content = msg["content"]
-            
-            # Icon selection
-            if role == "Doctor":
-                avatar = "👨‍⚕️"
-            elif role == "Patient":
-                avatar = "🤒"
-            elif role == "system": # Tool outputs etc
-                avatar = "🛠️"
-            else:
-                avatar = "❓"
-
-            with st.chat_message(role, avatar=avatar):
-                st.write(content)
-                # If there are tool calls info in the message (custom field), display them
-                # ONLY if tool_calls list is present and NOT empty
-                if "tool_calls" in msg and msg["tool_calls"]:
-                    with st.expander("🛠️ 工具调用详情"):
-                        for tc in msg["tool_calls"]:
-                            data = tc.model_dump() if hasattr(tc, "model_dump") else tc.dict()
-                            st.code(
-                                "Tool: " + str(data.get("tool_name")) + "\n"
-                                "Args: " + json.dumps(data.get("args"), indent=2, ensure_ascii=False, default=str) + "\n"
-                                "Result: " + json.dumps(data.get("result"), indent=2, ensure_ascii=False, default=str)
-                            )
+        render_history(st.session_state.agent_manager.chat_history, _render_sim_message, key="sim_history")
 
     # Simulation Logic / Input
     if st.session_state.agent_manager.status == SimulationStatus.RUNNING:
@@ -201,20 +201,7 @@ def render_consultation_tab():
                         if not message:
                             break
                         
-                        role_name = message["role"]
-                        avatar = "👨‍⚕️" if role_name == "Doctor" else "🤒"
-                        
-                        with st.chat_message(role_name, avatar=avatar):
-                            st.write(message.get("content", ""))
-                            if message.get("tool_calls"):
-                                with st.expander("🛠️ 工具调用详情"):
-                                    for tc in message["tool_calls"]:
-                                        data = tc.model_dump() if hasattr(tc, "model_dump") else tc.dict()
-                                        st.code(
-                                            "Tool: " + str(data.get("tool_name")) + "\n"
-                                            "Args: " + json.dumps(data.get("args"), indent=2, ensure_ascii=False, default=str) + "\n"
-                                            "Result: " + json.dumps(data.get("result"), indent=2, ensure_ascii=False, default=str)
-                                        )
+                        _render_sim_message(message)
                         
                         # Check if we should stop
                         if st.session_state.agent_manager.status == SimulationStatus.COMPLETED:
@@ -227,19 +214,7 @@ def render_consultation_tab():
                      message = st.session_state.agent_manager.step_simulation()
                  
                  if message:
-                     role_name = message["role"]
-                     avatar = "👨‍⚕️" if role_name == "Doctor" else "🤒"
-                     with st.chat_message(role_name, avatar=avatar):
-                         st.write(message.get("content", ""))
-                         if message.get("tool_calls"):
-                             with st.expander("🛠️ 工具调用详情"):
-                                 for tc in message["tool_calls"]:
-                                     data = tc.model_dump() if hasattr(tc, "model_dump") else tc.dict()
-                                     st.code(
-                                         "Tool: " + str(data.get("tool_name")) + "\n"
-                                         "Args: " + json.dumps(data.get("args"), indent=2, ensure_ascii=False, default=str) + "\n"
-                                         "Result: " + json.dumps(data.get("result"), indent=2, ensure_ascii=False, default=str)
-                                     )
+                     _render_sim_message(message)
                      st.rerun()
                     
         elif "我来扮演医生" in mode:
@@ -1,5 +1,36 @@
+from typing import Any, Dict
+
 import streamlit as st
 
+from src.core.cache import semantic_cache, make_namespace, DEFAULT_SIMILARITY_THRESHOLD
+from src.core.context import pack_context, DEFAULT_TOKEN_BUDGET
+from src.core.models import create_camel_model
+from src.core.rerank import get_reranker
+from src.ui.chat_history import render_conversation_picker, render_history, render_rag_context
+from src.utils.chat_display import attach_display
+from src.utils.lazy import lazy_import
+from src.utils.profiling import profiler
+from src.utils.state import new_session_conversation, open_session_conversation
+from src.utils.resilience import ProviderUnavailable, describe_provider_error
+from src.utils.telemetry import telemetry, record_llm_response
+
+ChatAgent = lazy_import("camel.agents", "ChatAgent")
+BaseMessage = lazy_import("camel.messages", "BaseMessage")
+
+# Rerank options shown in the RAG settings -> reranker kind
+RERANK_OPTIONS = {"关闭": None, "本地词法重排": "lexical", "LLM 重排": "llm"}
+
+# Chunking options when building a KB -> RAGManager.process_files chunking
+CHUNKING_OPTIONS = {"默认分块": "flat", "层级分块 (章节 → 小片段)": "hierarchical"}
+
+# Vector storage options when building a KB -> RAGManager.process_files storage
+STORAGE_OPTIONS = {"内存索引": "qdrant", "磁盘分片 (超大知识库)": "sharded"}
+
+# First-pass vector length of two-stage search (sharded storage) -> process_files coarse_dim
+COARSE_DIM_OPTIONS = {"关闭 (全维检索)": None, "256 维": 256, "128 维": 128, "64 维": 64}
+
+RAG_DEGRADED_CAPTION = "⚠️ 检索服务暂时不可用，本次回答未使用知识库"
+
 def render_expert_qa_tab():
     """Render the Expert QA / Chat with Doctor tab."""    
     # --- Configuration Section ---
@@ -18,6 +49,20 @@ def render_expert_qa_tab():
                 height=150,
                 key="qa_sys_prompt_input"
             )
+
+            st.session_state.qa_cache_enabled = st.checkbox(
+                "⚡ 语义答案缓存", value=True, key="qa_cache_toggle",
+                help="与已回答问题足够相似时直接返回缓存答案，不再检索和调用大模型。知识库、人设、模型配置或检索设置变化后缓存自动失效。"
+            )
+            if st.session_state.qa_cache_enabled:
+                st.session_state.qa_cache_threshold = st.slider(
+                    "缓存命中相似度", 0.80, 1.00, DEFAULT_SIMILARITY_THRESHOLD, step=0.01, key="qa_cache_threshold_slider"
+                )
+                cache_col1, cache_col2 = st.columns([3, 1])
+                cache_col1.caption(f"缓存条目: {len(semantic_cache)}")
+                if cache_col2.button("清空", key="qa_cache_clear"):
+                    semantic_cache.clear()
+                    st.rerun()
         
         with col2:
             st.subheader("📚 RAG 知识库")
@@ -30,6 +75,10 @@ def render_expert_qa_tab():
             if kb_mode == "选择现有知识库":
                 if existing_kbs:
                     selected_kb = st.selectbox("选择知识库", existing_kbs, key="qa_kb_selector")
+                    kb_meta = st.session_state.rag_manager.get_kb_meta(selected_kb)
+                    if kb_meta:
+                        chunking_label = "层级分块" if kb_meta.chunking == "hierarchical" else "默认分块"
+                        st.caption(f"📄 {len(kb_meta.files)} 个文件 · {kb_meta.chunk_count} 个片段 · {chunking_label} · {kb_meta.embedding_model} ({kb_meta.dimension} 维{f'，粗排 {kb_meta.coarse_dim} 维' if kb_meta.coarse_dim else ''}) · 构建于 {kb_meta.build_time}")
                     if selected_kb != st.session_state.rag_manager.current_kb_name:
                          if st.button("📂 加载该知识库"):
                             with st.spinner(f"正在加载 {selected_kb}..."):
@@ -37,22 +86,70 @@ def render_expert_qa_tab():
                                     st.success(f"已加载: {selected_kb}")
                                 else:
                                     st.error("加载失败")
+                    if kb_meta:
+                        with st.expander("🧹 整理知识库"):
+                            from src.core.compaction import NEAR_DUP_SIMILARITY
+
+                            near = st.checkbox(
+                                f"同时删除近似重复片段 (相似度 ≥ {NEAR_DUP_SIMILARITY})", value=False, key="qa_kb_compact_near",
+                                help="仅差一个剂量或禁忌症的指南段落也可能达到该相似度，请先预览再确认。"
+                            )
+                            options = {"near_threshold": NEAR_DUP_SIMILARITY if near else None}
+                            preview_key = (selected_kb, near)
+                            if st.button("🔍 预览", key="qa_kb_compact_preview",
+                                         help="统计完全重复片段、孤立片段和重复上传的文件，不做任何修改。"):
+                                try:
+                                    report = st.session_state.rag_manager.compact_knowledge_base(
+                                        selected_kb, dry_run=True, **options)
+                                    st.session_state.qa_kb_compact_plan = (preview_key, report)
+                                except Exception as e:
+                                    st.error(f"预览失败: {e}")
+                            plan = st.session_state.get("qa_kb_compact_plan")
+                            if plan and plan[0] == preview_key:
+                                st.info(plan[1].summary())
+                                if st.button("✅ 确认整理", key="qa_kb_compact_confirm"):
+                                    st.session_state.qa_kb_compact_plan = None
+                                    with st.spinner(f"正在整理 {selected_kb}..."):
+                                        try:
+                                            report = st.session_state.rag_manager.compact_knowledge_base(
+                                                selected_kb, **options)
+                                            st.success(report.summary())
+                                        except Exception as e:
+                                            st.error(f"整理失败: {e}")
                 else:
                     st.info("暂无本地知识库，请先新建。")
             
             else: # Create New
                 new_kb_name = st.text_input("知识库名称 (英文/数字)", placeholder="e.g. pediatrics_v1")
                 uploaded_files = st.file_uploader(
-                    "上传参考文档 (TXT/MD)", 
+                    "上传参考文档 (TXT/MD/PDF/DOCX)", 
                     accept_multiple_files=True,
-                    type=["txt", "md"],
+                    type=["txt", "md", "pdf", "docx"],
                     key="qa_file_uploader"
                 )
+                chunking_label = st.radio(
+                    "分块方式", list(CHUNKING_OPTIONS.keys()), horizontal=True, key="qa_kb_chunking",
+                    help="层级分块按章节标题切分父段落，只对小片段建向量索引；检索命中小片段后返回去重的完整父段落。"
+                )
+                storage_label = st.radio(
+                    "存储方式", list(STORAGE_OPTIONS.keys()), horizontal=True, key="qa_kb_storage",
+                    help="磁盘分片把向量按大小分片保存在磁盘并内存映射，打开知识库几乎不占内存，适合大于内存的知识库；检索时并行扫描各分片。"
+                )
+                coarse_label = next(iter(COARSE_DIM_OPTIONS))
+                if STORAGE_OPTIONS[storage_label] == "sharded":
+                    coarse_label = st.selectbox(
+                        "两阶段检索 (粗排维度)", list(COARSE_DIM_OPTIONS.keys()), key="qa_kb_coarse_dim",
+                        help="先用截短的低维向量快速筛选候选，再用完整向量精确重排；扫描量与索引内存降为原来的几分之一，检索质量基本不变。"
+                    )
                 
                 if uploaded_files and new_kb_name:
                     if st.button("🚀 创建并处理"):
                         with st.spinner("正在处理文档并构建索引..."):
-                            status = st.session_state.rag_manager.process_files(new_kb_name, uploaded_files)
+                            status = st.session_state.rag_manager.process_files(
+                                new_kb_name, uploaded_files, chunking=CHUNKING_OPTIONS[chunking_label],
+                                storage=STORAGE_OPTIONS[storage_label],
+                                coarse_dim=COARSE_DIM_OPTIONS[coarse_label]
+                            )
                             st.success(status)
                             st.rerun() # Refresh to show in list
 
@@ -64,6 +161,30 @@ def render_expert_qa_tab():
             if enable_rag:
                 st.session_state.rag_threshold = st.slider("相似度阈值", 0.0, 1.0, 0.6, key="qa_rag_threshold")
                 st.session_state.rag_top_k = st.slider("检索 Top-K", 1, 10, 3, key="qa_rag_topk")
+                rerank_label = st.selectbox(
+                    "重排序 (Rerank)",
+                    list(RERANK_OPTIONS.keys()),
+                    key="qa_rag_rerank",
+                    help="开启后会先多取候选片段，重新打分后在分数明显下降处截断，Top-K 变为上限。"
+                )
+                st.session_state.rag_rerank = RERANK_OPTIONS[rerank_label]
+                st.session_state.rag_token_budget = st.slider(
+                    "上下文 Token 预算", 200, 4000, DEFAULT_TOKEN_BUDGET, step=100, key="qa_rag_token_budget",
+                    help="检索片段去重、合并相邻片段后按相关性装入提示词，超出预算的部分会被截断或丢弃。"
+                )
+
+                # Restrict retrieval to one document and/or chapter of the loaded KB
+                filter_options = st.session_state.rag_manager.list_filter_options()
+                rag_filters = {}
+                if len(filter_options["source"]) > 1:
+                    source = st.selectbox("限定文档", ["全部"] + filter_options["source"], key="qa_rag_filter_source")
+                    if source != "全部":
+                        rag_filters["source"] = source
+                if filter_options["section"]:
+                    section = st.selectbox("限定章节", ["全部"] + filter_options["section"], key="qa_rag_filter_section")
+                    if section != "全部":
+                        rag_filters["section"] = section
+                st.session_state.rag_filters = rag_filters
 
     st.markdown("---")
 
@@ -81,40 +202,16 @@ def render_expert_qa_tab():
                 st.session_state.current_input = "临床试验中必须遵循哪些核心伦理学原则？"
     else:
         if st.button("🔄 重置对话"):
-            st.session_state.messages_qa = []
+            st.session_state.messages_qa = new_session_conversation("qa")
             st.rerun()
 
-    # Chat History
-    for msg in st.session_state.messages_qa:
-        with st.chat_message(msg["role"]):
-            st.write(msg["content"])
-            
-            # Show RAG context if enabled (even if empty)
-            if msg["role"] == "assistant" and getattr(st.session_state, 'enable_rag', False):
-                rag_data = msg.get("rag_context", [])
-                
-                with st.expander(f"📚 参考了 {len(rag_data)} 个文档片段"):
-                    if not rag_data:
-                        st.caption("没有找到符合阈值的相关文档。")
-                    else:
-                        for idx, ctx in enumerate(rag_data):
-                            score = float(ctx.get('similarity', 0.0))
-                            text = ctx.get('text', '')
-                            # Show a snippet in the header
-                            summary = f"片段 {idx+1} (相似度: {score:.4f})"
-                            
-                            # Use HTML details for nested expander effect
-                            st.markdown(
-                                f"""
-                                <details>
-                                <summary>{summary}</summary>
-                                <div style='padding: 10px; border-left: 3px solid #ccc; background-color: #f9f9f9; margin-top: 5px;'>
-                                <pre style='white-space: pre-wrap; word-wrap: break-word;'>{text}</pre>
-                                </div>
-                                </details>
-                                """,
-                                unsafe_allow_html=True
-                            )
+    resume_id = render_conversation_picker("qa", key="qa_conversations")
+    if resume_id:
+        st.session_state.messages_qa = open_session_conversation("qa", resume_id)
+        st.rerun()
+
+    # Chat History (latest page; older turns on request)
+    render_history(st.session_state.messages_qa, _render_qa_message, key="qa_history")
 
     # Input Area
     if "current_input" in st.session_state and st.session_state.current_input:
@@ -128,21 +225,111 @@ def render_expert_qa_tab():
         handle_user_input(prompt)
         st.rerun()
 
-def handle_user_input(prompt: str):
-    """Process user input for QA tab."""
-    st.session_state.messages_qa.append({"role": "user", "content": prompt})
-    
-    with st.chat_message("user"):
-        st.write(prompt)
+def _render_qa_message(msg: Dict[str, Any]):
+    with st.chat_message(msg["role"]):
+        st.write(msg["content"])
+        if msg.get("cached"):
+            st.caption(f"⚡ 缓存回答 · 相似度 {msg.get('cache_similarity', 1.0):.3f} · 未调用大模型")
+        if msg.get("rag_degraded"):
+            st.caption(RAG_DEGRADED_CAPTION)
+
+        # Show RAG context if enabled (even if empty)
+        if msg["role"] == "assistant" and getattr(st.session_state, 'enable_rag', False):
+            render_rag_context(msg)
+
+
+def _answer_namespace(state) -> str:
+    """Everything besides the question that shapes the answer; cached answers only match within it."""
+    rag_manager = state.rag_manager
+    model_config = state.model_config
+    enable_rag = getattr(state, 'enable_rag', False)
+    kb_meta = rag_manager.current_kb_meta if enable_rag else None
+    return make_namespace(
+        embedding_model=rag_manager.embedding_model_name,
+        system_prompt=state.qa_system_prompt,
+        model=[model_config.base_url, model_config.model_name, model_config.temperature],
+        kb=rag_manager.current_kb_name if enable_rag else None,
+        kb_version=kb_meta.kb_version if kb_meta else None,
+        rag=[
+            getattr(state, 'rag_threshold', 0.7),
+            getattr(state, 'rag_top_k', 3),
+            getattr(state, 'rag_rerank', None),
+            getattr(state, 'rag_token_budget', DEFAULT_TOKEN_BUDGET),
+            getattr(state, 'rag_filters', None),
+        ] if enable_rag else None,
+    )
+
+
+def _lookup_cached_answer(prompt: str, state):
+    """
+    Returns (namespace, question vector, hit or None); vector is None when the cache is off or embedding failed.
+    ProviderUnavailable propagates: retrieval would need the same provider.
+    """
+    if not getattr(state, 'qa_cache_enabled', True):
+        return None, None, None
+    namespace = _answer_namespace(state)
+    try:
+        with telemetry.span("cache.answer_lookup"):
+            vector = state.rag_manager.embed_query(prompt)
+    except ProviderUnavailable:
+        raise
+    except Exception as e:
+        print(f"Answer cache lookup skipped: {e}")
+        return namespace, None, None
+    hit = semantic_cache.lookup(
+        namespace, vector, getattr(state, 'qa_cache_threshold', DEFAULT_SIMILARITY_THRESHOLD)
+    )
+    telemetry.record_cache("answer", hit is not None)
+    return namespace, vector, hit
+
+
+@telemetry.traced("qa.turn")
+def answer_question(prompt: str, state) -> Dict[str, Any]:
+    """
+    Answer one question with the settings in `state` (st.session_state or any object
+    with the same attributes) and return the assistant message. No UI calls, so the
+    load test can run it for many sessions at once.
+    """
+    # 0. Semantic answer cache: similar question already answered under the same settings
+    rag_degraded = False
+    try:
+        cache_namespace, question_vector, hit = _lookup_cached_answer(prompt, state)
+    except ProviderUnavailable as e:
+        # Embedding provider unhealthy: answer without cache and RAG rather than not at all
+        print(f"Answer cache and retrieval skipped: {e}")
+        cache_namespace, question_vector, hit = None, None, None
+        rag_degraded = bool(getattr(state, 'enable_rag', False))
+    if hit:
+        entry, similarity = hit
+        return attach_display({
+            "role": "assistant",
+            "content": entry.answer,
+            "rag_context": entry.rag_context,
+            "rag_stats": entry.rag_stats,
+            "cached": True,
+            "cache_similarity": similarity
+        })
 
     # 1. RAG Retrieval
     rag_context = []
-    if getattr(st.session_state, 'enable_rag', False):
-         rag_context = st.session_state.rag_manager.retrieve(
-             prompt, 
-             getattr(st.session_state, 'rag_threshold', 0.7), 
-             getattr(st.session_state, 'rag_top_k', 3)
-         )
+    rag_stats = None
+    if getattr(state, 'enable_rag', False) and not rag_degraded:
+        try:
+            rag_context = state.rag_manager.retrieve(
+                prompt, 
+                getattr(state, 'rag_threshold', 0.7), 
+                getattr(state, 'rag_top_k', 3),
+                reranker=get_reranker(getattr(state, 'rag_rerank', None), state.model_config),
+                filters=getattr(state, 'rag_filters', None)
+            )
+        except ProviderUnavailable as e:
+            print(f"Retrieval skipped: {e}")
+            rag_degraded = True
+        # Drop duplicates, merge neighbours and fit the prompt budget
+        rag_context, rag_stats = pack_context(
+            rag_context,
+            token_budget=getattr(state, 'rag_token_budget', DEFAULT_TOKEN_BUDGET)
+        )
     
     # 2. Build Prompt with Context
     full_prompt = prompt
@@ -151,45 +338,58 @@ def handle_user_input(prompt: str):
         context_str = "\n".join([item['text'] for item in rag_context])
         full_prompt = f"Background Information:\n{context_str}\n\nUser Question: {prompt}"
         
-    # 3. Call Camel Agent with Streaming
-    response_content = ""
-    with st.chat_message("assistant"):
-        with st.spinner("医生正在思考..."):
-            from camel.agents import ChatAgent
-            from camel.messages import BaseMessage
-            from camel.models import ModelFactory
-            from camel.types import ModelPlatformType
-            
-            # Helper to create model
-            model_config = st.session_state.model_config
-            model_instance = ModelFactory.create(
-                model_platform=ModelPlatformType.OPENAI,
-                model_type=model_config.model_name or "qwen-plus",
-                url=model_config.base_url,
-                api_key=model_config.api_key,
-                model_config_dict={"temperature": model_config.temperature}
-            )
-            
-            # System Message
-            sys_msg = BaseMessage.make_assistant_message(
-                role_name="Expert",
-                content=st.session_state.qa_system_prompt
-            )
-            
-            agent = ChatAgent(system_message=sys_msg, model=model_instance)
-            
-            user_msg = BaseMessage.make_user_message(role_name="User", content=full_prompt)
-            
-            try:
-                response = agent.step(user_msg)
-                response_content = response.msg.content if response and getattr(response, "msg", None) else ""
-            except Exception as exc:
-                response_content = f"模型响应失败：{exc}"
-            
-            st.write(response_content or "（未返回内容）")
+    # 3. Call Camel Agent
+    model_config = state.model_config
+    model_instance = create_camel_model(model_config)
+    
+    # System Message
+    sys_msg = BaseMessage.make_assistant_message(
+        role_name="Expert",
+        content=state.qa_system_prompt
+    )
+    
+    agent = ChatAgent(system_message=sys_msg, model=model_instance)
+    
+    user_msg = BaseMessage.make_user_message(role_name="User", content=full_prompt)
+    
+    try:
+        with telemetry.span("llm.step", model=model_config.model_name) as span:
+            response = agent.step(user_msg)
+            record_llm_response(span, response)
+        response_content = response.msg.content if response and getattr(response, "msg", None) else ""
+        # A degraded answer was made without the KB, so it must not serve later questions
+        if response_content and question_vector is not None and not rag_degraded:
+            semantic_cache.store(cache_namespace, prompt, question_vector, response_content, rag_context, rag_stats)
+    except Exception as exc:
+        response_content = f"模型响应失败：{describe_provider_error(exc)}"
 
-    st.session_state.messages_qa.append({
+    message = {
         "role": "assistant", 
         "content": response_content,
-        "rag_context": rag_context
-    })
+        "rag_context": rag_context,
+        "rag_stats": rag_stats
+    }
+    if rag_degraded:
+        message["rag_degraded"] = True
+    # Display strings are built once here, not on every rerun
+    return attach_display(message)
+
+
+@profiler.profiled("qa_turn")
+def handle_user_input(prompt: str):
+    """Process user input for QA tab."""
+    st.session_state.messages_qa.append({"role": "user", "content": prompt})
+    
+    with st.chat_message("user"):
+        st.write(prompt)
+
+    with st.chat_message("assistant"):
+        with st.spinner("医生正在思考..."):
+            message = answer_question(prompt, st.session_state)
+        st.write(message["content"] or "（未返回内容）")
+        if message.get("cached"):
+            st.caption(f"⚡ 缓存回答 · 相似度 {message['cache_similarity']:.3f} · 未调用大模型")
+        if message.get("rag_degraded"):
+            st.caption(RAG_DEGRADED_CAPTION)
+
+    st.session_state.messages_qa.append(message)
@@ -0,0 +1,91 @@
+"""
+Display payloads for chat messages. They are built once, when a message is
+created (or first shown after being loaded from the conversation store, which
+keeps only the source fields), and kept under message["display"], so a
+Streamlit rerun only emits ready strings instead of running json.dumps over
+every tool call and building HTML for every retrieved snippet of every past message.
+"""
+import html
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+DISPLAY_KEY = "display"
+
+
+def format_tool_call(tool_call: Any) -> str:
+    """Tool name, arguments and result of one tool call as a code block."""
+    if hasattr(tool_call, "model_dump"):
+        data = tool_call.model_dump()
+    elif hasattr(tool_call, "dict"):
+        data = tool_call.dict()
+    else:
+        data = dict(tool_call)
+    return (
+        "Tool: " + str(data.get("tool_name")) + "\n"
+        "Args: " + json.dumps(data.get("args"), indent=2, ensure_ascii=False, default=str) + "\n"
+        "Result: " + json.dumps(data.get("result"), indent=2, ensure_ascii=False, default=str)
+    )
+
+
+def format_rag_stats(rag_stats: Optional[Dict[str, int]]) -> Optional[str]:
+    if not rag_stats:
+        return None
+    return (
+        f"去重 {rag_stats['duplicates_removed']} · 合并 {rag_stats['merged']} · "
+        f"预算外 {rag_stats['dropped_for_budget'] + rag_stats['truncated']} · "
+        f"Tokens {rag_stats['tokens_before']} → {rag_stats['tokens_after']}"
+    )
+
+
+def format_rag_snippets(rag_context: List[Dict[str, Any]]) -> str:
+    """All retrieved snippets as collapsed HTML <details> blocks, for one st.markdown call."""
+    blocks = []
+    for idx, ctx in enumerate(rag_context):
+        summary = f"片段 {idx+1} (相似度: {float(ctx.get('similarity', 0.0)):.4f})"
+        if 'rerank_score' in ctx:
+            summary += f" · 重排分: {float(ctx['rerank_score']):.2f}"
+        if ctx.get('section'):
+            summary += f" · {ctx['section']}"
+        blocks.append(
+            f"<details><summary>{html.escape(summary)}</summary>"
+            "<div style='padding: 10px; border-left: 3px solid #ccc; background-color: #f9f9f9; margin-top: 5px;'>"
+            f"<pre style='white-space: pre-wrap; word-wrap: break-word;'>{html.escape(str(ctx.get('text', '')))}</pre>"
+            "</div></details>"
+        )
+    return "\n".join(blocks)
+
+
+def attach_display(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the message's display payload (tool calls, RAG context) and return the message."""
+    display: Dict[str, Any] = {"tool_calls": [format_tool_call(tc) for tc in message.get("tool_calls") or []]}
+    if "rag_context" in message:
+        rag_context = message.get("rag_context") or []
+        display["rag_title"] = f"📚 参考了 {len(rag_context)} 个文档片段"
+        display["rag_stats"] = format_rag_stats(message.get("rag_stats"))
+        display["rag_html"] = format_rag_snippets(rag_context)
+    message[DISPLAY_KEY] = display
+    return message
+
+
+def message_display(message: Dict[str, Any]) -> Dict[str, Any]:
+    """The display payload, built now for messages created without one."""
+    if DISPLAY_KEY not in message:
+        attach_display(message)
+    return message[DISPLAY_KEY]
+
+
+def history_window(total: int, page_size: int, page: Optional[int] = None) -> Tuple[int, int, int, int]:
+    """
+    Split a history of `total` messages into the latest `page_size` messages, which
+    are always shown, and pages of older ones. Returns (page_start, page_end,
+    recent_start, pages): the selected older page (1 = oldest, default the newest
+    older page) is messages[page_start:page_end], the recent ones messages[recent_start:].
+    """
+    recent_start = max(0, total - page_size)
+    pages = -(-recent_start // page_size) if page_size else 0
+    if not pages:
+        return 0, 0, recent_start, 0
+    page = pages if page is None else min(max(page, 1), pages)
+    # Pages are aligned to the recent window, so the newest older page ends where it starts
+    page_end = recent_start - (pages - page) * page_size
+    return max(0, page_end - page_size), page_end, recent_start, pages
@@ -0,0 +1,109 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from src.utils.telemetry import telemetry
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution: the first caller
+    runs the function, the others wait for its result (or its exception).
+    Shared results are counted as `coalesce.<name>.shared`.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            telemetry.incr(f"coalesce.{self.name}.shared")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class _Batch:
+    def __init__(self):
+        self.items: List[Any] = []
+        self.closed = False
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results: List[Any] = []
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatcher:
+    """
+    Collects items submitted concurrently within `max_wait` seconds (or until
+    `max_batch` items) and processes them with one call of `func(items) -> results`.
+    The first submitter of a batch waits for it to fill and runs it; the others
+    block until their result is ready. No background thread is involved.
+    """
+
+    def __init__(self, name: str, func: Callable[[List[Any]], List[Any]],
+                 max_batch: int = 10, max_wait: float = 0.005):
+        self.name = name
+        self.func = func
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._open: Optional[_Batch] = None
+
+    def submit(self, item: Any) -> Any:
+        with self._lock:
+            batch = self._open
+            leader = batch is None or batch.closed or len(batch.items) >= self.max_batch
+            if leader:
+                batch = self._open = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch:
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                batch.closed = True
+                if self._open is batch:
+                    self._open = None
+            telemetry.incr(f"coalesce.{self.name}.batches")
+            telemetry.incr(f"coalesce.{self.name}.items", len(batch.items))
+            try:
+                batch.results = self.func(batch.items)
+            except BaseException as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
@@ -0,0 +1,89 @@
+import importlib
+import os
+import threading
+from typing import Any, Iterable
+
+# Heavy modules imported in the background after the first page render
+PREWARM_MODULES = (
+    "camel.embeddings",
+    "camel.storages",
+    "camel.retrievers",
+    "camel.agents",
+    "camel.models",
+    "camel.toolkits",
+    "unstructured.partition.auto",
+)
+
+_prewarm_started = False
+_prewarm_lock = threading.Lock()
+
+# Serializes heavy imports: concurrent first imports of camel/openai from the
+# prewarm thread and a request thread can observe half-initialized packages.
+_import_lock = threading.RLock()
+
+
+class LazyObject:
+    """
+    Stand-in for a class or function from a heavy module.
+    The module is imported on first call or attribute access, so importing
+    the code that references it stays cheap.
+    """
+
+    def __init__(self, module_name: str, attr_name: str):
+        self._module_name = module_name
+        self._attr_name = attr_name
+        self._target = None
+
+    def _resolve(self) -> Any:
+        if self._target is None:
+            with _import_lock:
+                if self._target is None:
+                    module = importlib.import_module(self._module_name)
+                    self._target = getattr(module, self._attr_name)
+        return self._target
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return self._resolve()(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        # Dunder lookups (typing, copy, inspect) must not trigger the import
+        if name in ("_module_name", "_attr_name", "_target") or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self._resolve(), name)
+
+    def __instancecheck__(self, obj: Any) -> bool:
+        return isinstance(obj, self._resolve())
+
+    def __repr__(self) -> str:
+        return f"<lazy {self._module_name}.{self._attr_name}>"
+
+
+def lazy_import(module_name: str, attr_name: str) -> Any:
+    """Return a lazy reference to `module_name.attr_name`."""
+    return LazyObject(module_name, attr_name)
+
+
+def prewarm(modules: Iterable[str] = PREWARM_MODULES) -> bool:
+    """
+    Import heavy modules in a daemon thread, once per process.
+    Disabled with MEDRAG_PREWARM=0. Returns True if the thread was started.
+    """
+    global _prewarm_started
+    if os.getenv("MEDRAG_PREWARM", "1").lower() in ("0", "false", "no"):
+        return False
+
+    with _prewarm_lock:
+        if _prewarm_started:
+            return False
+        _prewarm_started = True
+
+    def run():
+        with _import_lock:
+            for module_name in modules:
+                try:
+                    importlib.import_module(module_name)
+                except Exception as e:
+                    print(f"Prewarm import failed for {module_name}: {e}")
+
+    threading.Thread(target=run, name="medrag-prewarm", daemon=True).start()
+    return True
@@ -0,0 +1,460 @@
+"""
+Load test for capacity planning: many simulated sessions, each with its own
+RAGManager, AgentManager and QA settings (like Streamlit sessions), run the
+retrieval, Expert QA and simulation code paths concurrently against a local
+fake LLM/embedding server (src.utils.mock_openai) with configurable latency.
+
+    python -m src.utils.loadtest --sessions 20 --turns 5 --latency-ms 300 --json report.json
+
+Reports throughput, latency percentiles per operation, RSS per session and lock
+contention on the local Qdrant storage.
+"""
+import argparse
+import gc
+import importlib
+import json
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.core.agents import AgentManager, SimulationStatus
+from src.core.context import DEFAULT_TOKEN_BUDGET
+from src.core.models import ModelConfig, TOKEN_COUNTER_ENV
+from src.core.rag import RAGManager
+from src.ui.tabs.expert_qa import answer_question
+from src.utils.lazy import PREWARM_MODULES
+from src.utils.telemetry import telemetry
+
+SCENARIOS = ("retrieve", "qa", "sim")
+DEFAULT_KB_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "临床药理学.txt"))
+
+QUESTIONS = [
+    "临床药理学的主要研究内容和核心任务分别是什么?",
+    "新药临床试验的 I、II、III、IV 期各自的主要内容是什么",
+    "临床试验中必须遵循哪些核心伦理学原则？",
+    "什么是药物的半衰期",
+    "治疗药物监测需要监测哪些药物",
+    "影响药物生物转化的因素",
+    "药物的排泄途径有哪些",
+    "什么是生物等效性试验",
+]
+
+PATIENT_PROFILE = "男，58岁，反复头晕两周，晨起明显，有高血压家族史，平时饮酒较多。"
+DOCTOR_INSTRUCTION = "你是一名心内科医生，请通过问诊明确诊断，诊断完成后输出 <DIAGNOSIS_DONE>。"
+
+LOCK_COUNTERS = ("storage.lock_acquisitions", "storage.lock_contended", "storage.lock_wait_ms")
+
+
+@dataclass
+class LoadTestConfig:
+    sessions: int = 10
+    turns: int = 5
+    scenarios: List[str] = field(default_factory=lambda: list(SCENARIOS))
+    # Fake provider; llm_url points at an external server instead
+    latency_ms: float = 300.0
+    latency_spread_ms: float = 50.0
+    latency_dist: str = "uniform"
+    embedding_latency_ms: Optional[float] = None
+    tokens_per_s: float = 0.0
+    llm_url: Optional[str] = None
+    api_key: str = "sk-loadtest"
+    model_name: str = "qwen-flash"
+    # Separate patient model for the sim scenario (None: the patient shares the doctor's model)
+    patient_model_name: Optional[str] = None
+    patient_max_tokens: Optional[int] = None
+    patient_latency_ms: Optional[float] = None
+    # Knowledge base built once and opened by every session
+    kb_file: str = DEFAULT_KB_FILE
+    chunking: str = "hierarchical"
+    # "qdrant" or "sharded" (memory-mapped shard files)
+    storage: str = "qdrant"
+    base_path: Optional[str] = None
+    top_k: int = 3
+    threshold: float = 0.3
+    # Pause between operations of one session, like a user reading the answer
+    think_ms: float = 0.0
+    answer_cache: bool = False
+    sim_records: str = ""
+    seed: int = 0
+
+
+@dataclass
+class OperationStats:
+    count: int
+    errors: int
+    throughput_per_s: float
+    p50_ms: float
+    p90_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+@dataclass
+class LoadTestReport:
+    config: Dict[str, Any]
+    wall_seconds: float
+    ingest_seconds: float
+    total_operations: int
+    throughput_per_s: float
+    operations: Dict[str, OperationStats]
+    rss_baseline_mb: float
+    rss_after_setup_mb: float
+    rss_after_run_mb: float
+    rss_per_session_mb: float
+    lock: Dict[str, float]
+    provider_requests: Dict[str, int]
+    chat_requests_by_model: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class _Upload:
+    def __init__(self, path: str):
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f:
+            self._data = f.read()
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self._data)
+
+
+@contextmanager
+def _provider_env(base_url: str, api_key: str) -> Iterator[None]:
+    """Outside Streamlit, RAGManager takes the embedding endpoint from these variables."""
+    overrides = {"OPENAI_BASE_URL": base_url, "OPENAI_API_KEY": api_key, TOKEN_COUNTER_ENV: "estimate"}
+    saved = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class SimulatedSession:
+    """The per-session objects a Streamlit session holds, driven without the UI."""
+
+    def __init__(self, index: int, config: LoadTestConfig, base_path: str, kb_name: str, model_config: ModelConfig,
+                 patient_model_config: Optional[ModelConfig] = None):
+        self.index = index
+        self.config = config
+        self.rag_manager = RAGManager(base_path=base_path)
+        self.rag_manager.load_knowledge_base(kb_name)
+        self.agent_manager = AgentManager()
+        self.model_config = model_config
+        self.patient_model_config = patient_model_config
+        # Same attributes handle_user_input reads from st.session_state
+        self.state = SimpleNamespace(
+            rag_manager=self.rag_manager,
+            model_config=model_config,
+            qa_system_prompt="你是一个经验丰富的全科医生。",
+            qa_cache_enabled=config.answer_cache,
+            enable_rag=True,
+            rag_threshold=config.threshold,
+            rag_top_k=config.top_k,
+            rag_rerank=None,
+            rag_token_budget=DEFAULT_TOKEN_BUDGET,
+            rag_filters=None,
+            messages_qa=[],
+        )
+        self._random = random.Random(config.seed + index)
+
+    def _question(self) -> str:
+        return self._random.choice(QUESTIONS)
+
+    def retrieve(self) -> bool:
+        results = self.rag_manager.retrieve(self._question(), self.config.threshold, self.config.top_k)
+        return not any(str(r.get("text", "")).startswith("检索失败") for r in results)
+
+    def qa(self) -> bool:
+        question = self._question()
+        message = answer_question(question, self.state)
+        self.state.messages_qa.extend([{"role": "user", "content": question}, message])
+        return not message["content"].startswith("模型响应失败")
+
+    def sim(self) -> bool:
+        manager = self.agent_manager
+        if manager.status != SimulationStatus.RUNNING:
+            manager.initialize_agents(
+                PATIENT_PROFILE, DOCTOR_INSTRUCTION, self.model_config,
+                rag_content=self.config.sim_records, max_steps=self.config.turns, rag_manager=self.rag_manager,
+                patient_model_config=self.patient_model_config,
+            )
+        message = manager.step_simulation()
+        return message is not None and not message["content"].startswith("Error:")
+
+
+def _run_session(session: SimulatedSession, config: LoadTestConfig,
+                 record: Callable[[str, float, bool], None], start_barrier: threading.Barrier):
+    start_barrier.wait()
+    for _ in range(config.turns):
+        for scenario in config.scenarios:
+            start = time.perf_counter()
+            try:
+                ok = getattr(session, scenario)()
+            except Exception as e:
+                print(f"Session {session.index} {scenario} failed: {e}")
+                ok = False
+            record(scenario, (time.perf_counter() - start) * 1000, ok)
+            if config.think_ms:
+                time.sleep(config.think_ms / 1000)
+
+
+def run_load_test(config: LoadTestConfig) -> LoadTestReport:
+    unknown = set(config.scenarios) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"unknown scenarios: {sorted(unknown)}")
+
+    mock = server = None
+    base_url = config.llm_url
+    if not base_url:
+        from src.utils.mock_openai import LatencyModel, MockOpenAI, start_background_server
+
+        embedding_ms = config.latency_ms / 4 if config.embedding_latency_ms is None else config.embedding_latency_ms
+        model_latency = {}
+        if config.patient_model_name and config.patient_latency_ms is not None:
+            model_latency[config.patient_model_name] = LatencyModel(
+                config.patient_latency_ms, config.latency_spread_ms, config.latency_dist)
+        mock = MockOpenAI(
+            chat_latency=LatencyModel(config.latency_ms, config.latency_spread_ms, config.latency_dist),
+            embedding_latency=LatencyModel(embedding_ms, config.latency_spread_ms / 4, config.latency_dist),
+            tokens_per_s=config.tokens_per_s,
+            seed=config.seed,
+            model_latency=model_latency,
+        )
+        server = start_background_server(mock)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    model_config = ModelConfig(base_url=base_url, api_key=config.api_key, model_name=config.model_name, temperature=0.2)
+    patient_model_config = None
+    if config.patient_model_name or config.patient_max_tokens:
+        patient_model_config = ModelConfig(base_url="", api_key="", model_name=config.patient_model_name or "",
+                                           temperature=0.7, max_tokens=config.patient_max_tokens)
+
+    # The app imports these in the background before the first request; keep them out of the timings
+    for module_name in PREWARM_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            print(f"Prewarm import failed for {module_name}: {e}")
+
+    tmp = tempfile.TemporaryDirectory() if config.base_path is None else None
+    base_path = config.base_path or os.path.join(tmp.name, "local_data")
+    try:
+        with _provider_env(base_url, config.api_key):
+            kb_name = "loadtest"
+            start = time.perf_counter()
+            builder = RAGManager(base_path=base_path)
+            builder.process_files(kb_name, [_Upload(config.kb_file)], chunking=config.chunking,
+                                  storage=config.storage)
+            ingest_seconds = time.perf_counter() - start
+            if builder.current_kb_name != kb_name:
+                raise RuntimeError(f"building the load-test KB failed: {builder.vector_store_status}")
+            del builder
+
+            gc.collect()
+            rss_baseline = current_rss_mb()
+            sessions = [SimulatedSession(i, config, base_path, kb_name, model_config, patient_model_config) for i in range(config.sessions)]
+            gc.collect()
+            rss_after_setup = current_rss_mb()
+
+            latencies: Dict[str, List[float]] = {scenario: [] for scenario in config.scenarios}
+            errors: Dict[str, int] = {scenario: 0 for scenario in config.scenarios}
+            results_lock = threading.Lock()
+
+            def record(scenario: str, elapsed_ms: float, ok: bool):
+                with results_lock:
+                    latencies[scenario].append(elapsed_ms)
+                    if not ok:
+                        errors[scenario] += 1
+
+            counters_before = telemetry.counters()
+            barrier = threading.Barrier(len(sessions))
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(sessions), thread_name_prefix="loadtest-session") as pool:
+                for future in [pool.submit(_run_session, s, config, record, barrier) for s in sessions]:
+                    future.result()
+            wall_seconds = time.perf_counter() - start
+            counters_after = telemetry.counters()
+            gc.collect()
+            rss_after_run = current_rss_mb()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if tmp is not None:
+            tmp.cleanup()
+
+    operations = {}
+    for scenario, values in latencies.items():
+        values.sort()
+        operations[scenario] = OperationStats(
+            count=len(values),
+            errors=errors[scenario],
+            throughput_per_s=len(values) / wall_seconds if wall_seconds else 0.0,
+            p50_ms=percentile(values, 0.50),
+            p90_ms=percentile(values, 0.90),
+            p95_ms=percentile(values, 0.95),
+            p99_ms=percentile(values, 0.99),
+            max_ms=values[-1] if values else 0.0,
+        )
+    total = sum(stats.count for stats in operations.values())
+
+    lock = {name.split(".", 1)[1]: counters_after.get(name, 0.0) - counters_before.get(name, 0.0) for name in LOCK_COUNTERS}
+    acquisitions = lock["lock_acquisitions"]
+    lock["contended_ratio"] = lock["lock_contended"] / acquisitions if acquisitions else 0.0
+    lock["mean_wait_ms"] = lock["lock_wait_ms"] / acquisitions if acquisitions else 0.0
+    # Share of all session time spent waiting for the storage lock
+    lock["wait_share"] = lock["lock_wait_ms"] / (wall_seconds * 1000 * config.sessions) if wall_seconds else 0.0
+
+    return LoadTestReport(
+        config=asdict(config),
+        wall_seconds=wall_seconds,
+        ingest_seconds=ingest_seconds,
+        total_operations=total,
+        throughput_per_s=total / wall_seconds if wall_seconds else 0.0,
+        operations=operations,
+        rss_baseline_mb=rss_baseline,
+        rss_after_setup_mb=rss_after_setup,
+        rss_after_run_mb=rss_after_run,
+        rss_per_session_mb=(rss_after_run - rss_baseline) / max(config.sessions, 1),
+        lock=lock,
+        provider_requests=dict(mock.requests) if mock else {},
+        chat_requests_by_model=dict(mock.chat_models) if mock else {},
+    )
+
+
+def format_report(report: LoadTestReport) -> str:
+    config = report.config
+    lines = [
+        f"Sessions: {config['sessions']} · turns: {config['turns']} · scenarios: {', '.join(config['scenarios'])} · "
+        f"LLM latency: {config['latency_ms']:.0f}±{config['latency_spread_ms']:.0f} ms ({config['latency_dist']})",
+        f"KB ingest: {report.ingest_seconds:.2f} s · run: {report.wall_seconds:.2f} s · "
+        f"{report.total_operations} ops · {report.throughput_per_s:.2f} ops/s",
+        "",
+        f"{'operation':<10}{'count':>7}{'errors':>8}{'ops/s':>9}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)",
+    ]
+    for name, stats in report.operations.items():
+        lines.append(
+            f"{name:<10}{stats.count:>7}{stats.errors:>8}{stats.throughput_per_s:>9.2f}{stats.p50_ms:>9.1f}"
+            f"{stats.p90_ms:>9.1f}{stats.p95_ms:>9.1f}{stats.p99_ms:>9.1f}{stats.max_ms:>9.1f}"
+        )
+    lock = report.lock
+    lines += [
+        "",
+        f"RSS: baseline {report.rss_baseline_mb:.1f} MB · after setup {report.rss_after_setup_mb:.1f} MB · "
+        f"after run {report.rss_after_run_mb:.1f} MB · per session {report.rss_per_session_mb:.2f} MB",
+        f"Qdrant local lock: {lock['lock_acquisitions']:.0f} acquisitions · {lock['contended_ratio']:.1%} contended · "
+        f"wait {lock['lock_wait_ms']:.1f} ms total, {lock['mean_wait_ms']:.3f} ms mean · "
+        f"{lock['wait_share']:.2%} of session time",
+    ]
+    if report.provider_requests:
+        lines.append(f"Fake provider requests: {report.provider_requests}")
+    if len(report.chat_requests_by_model) > 1:
+        lines.append(f"Chat requests by model: {report.chat_requests_by_model}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of concurrent Expert QA and simulation sessions")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=5, help="iterations of the scenarios per session")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated: retrieve,qa,sim")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="fake chat completion latency")
+    parser.add_argument("--latency-spread-ms", type=float, default=50.0)
+    parser.add_argument("--latency-dist", default="uniform", choices=["fixed", "uniform", "normal", "lognormal"])
+    parser.add_argument("--embedding-latency-ms", type=float, default=None, help="default: latency-ms / 4")
+    parser.add_argument("--tokens-per-s", type=float, default=0.0, help="fake completion token rate (0: instant)")
+    parser.add_argument("--llm-url", default=None, help="use this OpenAI-compatible endpoint instead of the fake server")
+    parser.add_argument("--api-key", default="sk-loadtest")
+    parser.add_argument("--model", default="qwen-flash")
+    parser.add_argument("--patient-model", default=None, help="separate model for the simulated patient")
+    parser.add_argument("--patient-max-tokens", type=int, default=None)
+    parser.add_argument("--patient-latency-ms", type=float, default=None, help="fake latency of the patient model")
+    parser.add_argument("--kb-file", default=DEFAULT_KB_FILE)
+    parser.add_argument("--chunking", default="hierarchical", choices=["hierarchical", "flat"])
+    parser.add_argument("--storage", default="qdrant", choices=["qdrant", "sharded"])
+    parser.add_argument("--base-path", default=None, help="KB directory (default: a temporary directory)")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--think-ms", type=float, default=0.0)
+    parser.add_argument("--answer-cache", action="store_true", help="enable the semantic answer cache")
+    parser.add_argument("--sim-records", default=None, help="text file with medical records for the doctor's tool")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report as JSON")
+    args = parser.parse_args()
+
+    # Sessions run outside `streamlit run`; its bare-mode warnings are expected
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+
+    sim_records = ""
+    if args.sim_records:
+        with open(args.sim_records, encoding="utf-8") as f:
+            sim_records = f.read()
+    config = LoadTestConfig(
+        sessions=args.sessions,
+        turns=args.turns,
+        scenarios=[s.strip() for s in args.scenarios.split(",") if s.strip()],
+        latency_ms=args.latency_ms,
+        latency_spread_ms=args.latency_spread_ms,
+        latency_dist=args.latency_dist,
+        embedding_latency_ms=args.embedding_latency_ms,
+        tokens_per_s=args.tokens_per_s,
+        llm_url=args.llm_url,
+        api_key=args.api_key,
+        model_name=args.model,
+        patient_model_name=args.patient_model,
+        patient_max_tokens=args.patient_max_tokens,
+        patient_latency_ms=args.patient_latency_ms,
+        kb_file=args.kb_file,
+        chunking=args.chunking,
+        storage=args.storage,
+        base_path=args.base_path,
+        top_k=args.top_k,
+        threshold=args.threshold,
+        think_ms=args.think_ms,
+        answer_cache=args.answer_cache,
+        sim_records=sim_records,
+        seed=args.seed,
+    )
+    report = run_load_test(config)
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+"""
+Local mock of the OpenAI-compatible API used by the app: chat completions
+(plain, streaming and tool calls), embeddings and the model list. Latency
+distributions, token rates and injected faults (429 / 500 / timeouts) are
+configurable, and replies and embeddings are deterministic, so benchmarks,
+load tests and resilience tests run without network access or provider cost.
+
+    python -m src.utils.mock_openai --port 8900 --latency-ms 300 --latency-dist lognormal \\
+        --latency-spread-ms 150 --tokens-per-s 40 --rate-limit-rate 0.05
+
+Point the app at it with base_url http://127.0.0.1:8900/v1 and any API key.
+GET /mock/stats returns the request and fault counters.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.core.context import estimate_tokens
+from src.core.embeddings import HashingEmbedding
+
+DEFAULT_EMBEDDING_DIM = 1024
+DEFAULT_MODELS = ("qwen-flash", "qwen-plus", "text-embedding-v4")
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+# Marker the doctor agent emits when the diagnosis is complete
+DIAGNOSIS_MARKER = "<DIAGNOSIS_DONE>"
+
+_PHRASES = [
+    "根据您描述的情况，", "建议先完善相关检查，", "注意观察症状变化，", "目前考虑与生活习惯有关，",
+    "需要结合血压和血糖结果判断，", "请按时服药并复诊，", "如有加重请及时就医，", "平时注意清淡饮食，",
+    "可以先对症处理，", "必要时进一步评估，",
+]
+
+
+@dataclass
+class LatencyModel:
+    """
+    Simulated delay before the first token. spread_ms is the half-width for
+    "uniform" and the standard deviation for "normal" and "lognormal".
+    """
+    mean_ms: float = 0.0
+    spread_ms: float = 0.0
+    distribution: str = "fixed"
+
+    def __post_init__(self):
+        if self.distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"unknown latency distribution: {self.distribution}")
+
+    def sample(self, rng: random.Random) -> float:
+        """Delay in milliseconds, never negative."""
+        if self.distribution == "fixed" or not self.spread_ms:
+            value = self.mean_ms
+        elif self.distribution == "uniform":
+            value = rng.uniform(self.mean_ms - self.spread_ms, self.mean_ms + self.spread_ms)
+        elif self.distribution == "normal":
+            value = rng.gauss(self.mean_ms, self.spread_ms)
+        else:
+            if self.mean_ms <= 0:
+                return 0.0
+            sigma2 = math.log(1 + (self.spread_ms / self.mean_ms) ** 2)
+            value = rng.lognormvariate(math.log(self.mean_ms) - sigma2 / 2, math.sqrt(sigma2))
+        return max(0.0, value)
+
+
+@dataclass
+class FaultConfig:
+    """Share of requests answered with a fault instead of a result."""
+    rate_limit_rate: float = 0.0
+    server_error_rate: float = 0.0
+    # Request hangs for timeout_s, then the connection is dropped without a response
+    timeout_rate: float = 0.0
+    timeout_s: float = 30.0
+    retry_after_s: int = 1
+    # Which endpoints faults apply to
+    endpoints: List[str] = field(default_factory=lambda: ["chat", "embeddings"])
+
+
+class MockFault(Exception):
+    """An injected fault; the HTTP handler turns it into the matching response."""
+
+    def __init__(self, kind: str, status: int = 0, message: str = ""):
+        super().__init__(message or kind)
+        self.kind = kind
+        self.status = status
+
+
+class MockOpenAI:
+    """
+    Request handling of the mock API. Replies and embeddings depend only on the
+    request; latency and faults are drawn from a seeded random generator.
+
+    Chat behaviour:
+    - With `tools` in the request and a user message last, the reply calls the
+      first tool, with arguments filled in from its JSON schema.
+    - After a tool result, the reply quotes the start of the result.
+    - With finish_after > 0 and DIAGNOSIS_MARKER in the system prompt, the reply
+      appends the marker once the conversation has that many assistant turns.
+    """
+
+    def __init__(self, chat_latency: Optional[LatencyModel] = None, embedding_latency: Optional[LatencyModel] = None,
+                 tokens_per_s: float = 0.0, faults: Optional[FaultConfig] = None,
+                 embedding_dim: int = DEFAULT_EMBEDDING_DIM, reply_chars: int = 60, tool_calls: bool = True,
+                 finish_after: int = 0, models: Optional[List[str]] = None, seed: Optional[int] = None,
+                 model_latency: Optional[Dict[str, LatencyModel]] = None):
+        self.chat_latency = chat_latency or LatencyModel()
+        # Chat latency per model name, e.g. a fast small model next to a slow large one
+        self.model_latency = dict(model_latency or {})
+        self.embedding_latency = embedding_latency or LatencyModel()
+        self.tokens_per_s = tokens_per_s
+        self.faults = faults or FaultConfig()
+        self.embedding_dim = embedding_dim
+        self.reply_chars = reply_chars
+        self.tool_calls = tool_calls
+        self.finish_after = finish_after
+        self.models = list(models or DEFAULT_MODELS)
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._embeddings: Dict[int, HashingEmbedding] = {}
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {"chat": 0, "embeddings": 0, "models": 0}
+        self.chat_models: Dict[str, int] = {}
+        self.faults_injected: Dict[str, int] = {"rate_limit": 0, "server_error": 0, "timeout": 0}
+
+    # --- randomness, faults and timing ---
+
+    def _draw(self) -> float:
+        with self._random_lock:
+            return self._random.random()
+
+    def _sleep(self, latency: LatencyModel):
+        with self._random_lock:
+            delay = latency.sample(self._random) / 1000
+        if delay:
+            time.sleep(delay)
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _maybe_fault(self, endpoint: str):
+        if endpoint not in self.faults.endpoints:
+            return
+        draw = self._draw()
+        faults = self.faults
+        kind = None
+        if draw < faults.rate_limit_rate:
+            kind = "rate_limit"
+        elif draw < faults.rate_limit_rate + faults.server_error_rate:
+            kind = "server_error"
+        elif draw < faults.rate_limit_rate + faults.server_error_rate + faults.timeout_rate:
+            kind = "timeout"
+        if kind is None:
+            return
+        with self._lock:
+            self.faults_injected[kind] += 1
+        if kind == "rate_limit":
+            raise MockFault(kind, 429, "Rate limit reached (injected by mock server)")
+        if kind == "server_error":
+            raise MockFault(kind, 500, "Internal server error (injected by mock server)")
+        time.sleep(faults.timeout_s)
+        raise MockFault(kind)
+
+    def _token_delay(self, tokens: int) -> float:
+        return tokens / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"requests": dict(self.requests), "chat_models": dict(self.chat_models),
+                    "faults": dict(self.faults_injected)}
+
+    # --- replies ---
+
+    def _reply_text(self, messages: List[Dict[str, Any]]) -> str:
+        last = messages[-1] if messages else {}
+        if last.get("role") == "tool":
+            text = f"根据查询结果：{_content_text(last)[:30]}。"
+        else:
+            last_user = next((_content_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+            text = f"（模拟回复）关于“{last_user.split(chr(10))[0][:20]}”，"
+        seed = int.from_bytes(hashlib.sha1(json.dumps(messages, ensure_ascii=False, default=str).encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        while len(text) < self.reply_chars:
+            text += rng.choice(_PHRASES)
+        text = text[:self.reply_chars].rstrip("，") + "。"
+
+        system = next((_content_text(m) for m in messages if m.get("role") == "system"), "")
+        assistant_turns = sum(1 for m in messages if m.get("role") == "assistant")
+        if self.finish_after and DIAGNOSIS_MARKER in system and assistant_turns >= self.finish_after:
+            text += DIAGNOSIS_MARKER
+        return text
+
+    def _tool_call(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        tools = request.get("tools") or []
+        messages = request.get("messages") or []
+        if not self.tool_calls or not tools or not messages or messages[-1].get("role") != "user":
+            return None
+        if request.get("tool_choice") == "none":
+            return None
+        function = tools[0].get("function") or {}
+        query = _content_text(messages[-1]).split("\n")[0][:20]
+        return {
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {
+                "name": function.get("name", "tool"),
+                "arguments": json.dumps(_fill_arguments(function.get("parameters") or {}, query), ensure_ascii=False),
+            },
+        }
+
+    def chat_completions(self, request: Dict[str, Any]) -> Any:
+        """Response dict, or an iterator of chunk dicts when request["stream"] is set."""
+        self._count("chat")
+        model = request.get("model", "mock")
+        with self._lock:
+            self.chat_models[model] = self.chat_models.get(model, 0) + 1
+        self._maybe_fault("chat")
+        self._sleep(self.model_latency.get(model, self.chat_latency))
+
+        messages = request.get("messages") or []
+        tool_call = self._tool_call(request)
+        content = None if tool_call else self._reply_text(messages)
+        prompt_tokens = sum(estimate_tokens(_content_text(m)) for m in messages)
+        completion_tokens = estimate_tokens(content) if content else estimate_tokens(tool_call["function"]["arguments"])
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "created": int(time.time()), "model": model}
+
+        if request.get("stream"):
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            return self._stream(base, content, tool_call, usage if include_usage else None)
+
+        time.sleep(self._token_delay(completion_tokens))
+        message: Dict[str, Any] = {"role": "assistant", "content": content}
+        if tool_call:
+            message["tool_calls"] = [tool_call]
+        return {
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+            "usage": usage,
+        }
+
+    def _stream(self, base: Dict[str, Any], content: Optional[str], tool_call: Optional[Dict[str, Any]],
+                usage: Optional[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+            return {**base, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        yield chunk({"role": "assistant", "content": "" if content is not None else None})
+        if tool_call:
+            time.sleep(self._token_delay(estimate_tokens(tool_call["function"]["arguments"])))
+            yield chunk({"tool_calls": [{"index": 0, **tool_call}]})
+            yield chunk({}, "tool_calls")
+        else:
+            # Two characters per chunk, paced by the token rate
+            for start in range(0, len(content), 2):
+                piece = content[start:start + 2]
+                time.sleep(self._token_delay(estimate_tokens(piece)))
+                yield chunk({"content": piece})
+            yield chunk({}, "stop")
+        if usage is not None:
+            yield {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+
+    def embeddings(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        self._count("embeddings")
+        self._maybe_fault("embeddings")
+        self._sleep(self.embedding_latency)
+        texts = request.get("input") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        dim = int(request.get("dimensions") or self.embedding_dim)
+        with self._lock:
+            model = self._embeddings.get(dim)
+            if model is None:
+                model = self._embeddings[dim] = HashingEmbedding(output_dim=dim)
+        vectors: List[List[float]] = model.embed_list([str(t) for t in texts])
+        tokens = sum(estimate_tokens(str(t)) for t in texts)
+        return {
+            "object": "list",
+            "model": request.get("model", "mock-embedding"),
+            "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def list_models(self) -> Dict[str, Any]:
+        self._count("models")
+        return {
+            "object": "list",
+            "data": [{"id": name, "object": "model", "created": 0, "owned_by": "mock"} for name in self.models],
+        }
+
+
+def _content_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        # Multi-part content: keep the text parts
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def _fill_arguments(schema: Dict[str, Any], query: str) -> Dict[str, Any]:
+    """Plausible arguments for a JSON schema: strings get the query, numbers their default or a small value."""
+    properties = schema.get("properties") or {}
+    names = schema.get("required") or list(properties)
+    arguments = {}
+    for name in names:
+        spec = properties.get(name) or {}
+        if "default" in spec:
+            arguments[name] = spec["default"]
+            continue
+        kind = spec.get("type")
+        if isinstance(kind, list):
+            kind = next((k for k in kind if k != "null"), "string")
+        if kind == "integer":
+            arguments[name] = 3
+        elif kind == "number":
+            arguments[name] = 0.3
+        elif kind == "boolean":
+            arguments[name] = False
+        elif kind == "array":
+            arguments[name] = [query]
+        elif kind == "object":
+            arguments[name] = {}
+        else:
+            arguments[name] = query
+    return arguments
+
+
+def _error_body(message: str, error_type: str, code: str) -> Dict[str, Any]:
+    return {"error": {"message": message, "type": error_type, "code": code}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock: MockOpenAI = None
+
+    def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, chunks: Iterator[Dict[str, Any]]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data: bytes):
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        for item in chunks:
+            write(f"data: {json.dumps(item, ensure_ascii=False)}\n\n".encode("utf-8"))
+        write(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_fault(self, fault: MockFault):
+        if fault.kind == "timeout":
+            # The client sees a request that never completes
+            self.close_connection = True
+            return
+        if fault.status == 429:
+            self._send(429, _error_body(str(fault), "requests", "rate_limit_exceeded"),
+                       {"Retry-After": str(self.mock.faults.retry_after_s)})
+        else:
+            self._send(fault.status, _error_body(str(fault), "server_error", "internal_error"))
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/models"):
+            self._send(200, self.mock.list_models())
+        elif path.endswith("/mock/stats"):
+            self._send(200, self.mock.stats())
+        else:
+            self._send(404, _error_body(f"unknown path: {self.path}", "invalid_request_error", "not_found"))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, _error_body("invalid JSON", "invalid_request_error", "invalid_json"))
+            return
+        path = self.path.split("?")[0].rstrip("/")
+        try:
+            if path.endswith("/chat/completions"):
+                response = self.mock.chat_completions(request)
+                if isinstance(response, dict):
+                    self._send(200, response)
+                else:
+                    self._send_stream(response)
+            elif path.endswith("/embeddings"):
+                self._send(200, self.mock.embeddings(request))
+            else:
+                self._send(404, _error_body(f"unknown path: {self.path}", "invalid_request_error", "not_found"))
+        except MockFault as fault:
+            self._send_fault(fault)
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8900, mock: Optional[MockOpenAI] = None) -> ThreadingHTTPServer:
+    """Build the HTTP server (port 0 picks a free port); call serve_forever() to run it."""
+    handler = type("MockOpenAIHandler", (_Handler,), {"mock": mock or MockOpenAI()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_background_server(mock: MockOpenAI, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve on a daemon thread; the base URL is f"http://{host}:{server.server_address[1]}/v1"."""
+    server = create_server(host, port, mock)
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI-compatible API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean time to first token of chat completions")
+    parser.add_argument("--latency-spread-ms", type=float, default=0.0)
+    parser.add_argument("--latency-dist", default="fixed", choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--embedding-latency-ms", type=float, default=None, help="default: latency-ms / 4")
+    parser.add_argument("--tokens-per-s", type=float, default=0.0, help="completion token rate (0: instant)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests that hang")
+    parser.add_argument("--timeout-s", type=float, default=30.0)
+    parser.add_argument("--embedding-dim", type=int, default=DEFAULT_EMBEDDING_DIM)
+    parser.add_argument("--reply-chars", type=int, default=60)
+    parser.add_argument("--no-tool-calls", action="store_true")
+    parser.add_argument("--finish-after", type=int, default=0, help=f"append {DIAGNOSIS_MARKER} after this many assistant turns")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    embedding_ms = args.latency_ms / 4 if args.embedding_latency_ms is None else args.embedding_latency_ms
+    mock = MockOpenAI(
+        chat_latency=LatencyModel(args.latency_ms, args.latency_spread_ms, args.latency_dist),
+        embedding_latency=LatencyModel(embedding_ms, args.latency_spread_ms / 4, args.latency_dist),
+        tokens_per_s=args.tokens_per_s,
+        faults=FaultConfig(args.rate_limit_rate, args.server_error_rate, args.timeout_rate, args.timeout_s),
+        embedding_dim=args.embedding_dim,
+        reply_chars=args.reply_chars,
+        tool_calls=not args.no_tool_calls,
+        finish_after=args.finish_after,
+        seed=args.seed,
+    )
+    server = create_server(args.host, args.port, mock)
+    print(f"Mock OpenAI API listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+PROFILE_ENV = "MEDRAG_PROFILE"
+PROFILE_DIR_ENV = "MEDRAG_PROFILE_DIR"
+DEFAULT_PROFILE_DIR = "local_profiles"
+
+
+class StackSampler:
+    """Samples the call stack of one thread at a fixed interval and counts collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="medrag-stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        """Return the samples in the collapsed-stack format read by flamegraph.pl / speedscope."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """
+    Opt-in profiler for single QA turns, ingestions and simulation steps.
+    Enabled for the whole process by the MEDRAG_PROFILE environment variable, or
+    for one session's calls by the sidebar toggle (see use_session_flag).
+    Only one call is profiled at a time: cProfile cannot run concurrently on
+    Python 3.12+, so calls made while another is profiled run unprofiled.
+    """
+
+    def __init__(self, output_dir: Optional[str] = None, enabled: Optional[bool] = None):
+        self.output_dir = output_dir or os.getenv(PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR)
+        if enabled is None:
+            enabled = os.getenv(PROFILE_ENV, "").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self.sample_interval = 0.005
+        self._local = threading.local()
+        self._running = threading.Lock()
+
+    def use_session_flag(self, enabled: bool):
+        """Set the profiling toggle of the session whose script runs on this thread."""
+        self._local.session_enabled = enabled
+
+    def is_enabled(self) -> bool:
+        return self.enabled or getattr(self._local, "session_enabled", False)
+
+    def profiled(self, name: str):
+        """Decorator that profiles each call of the function while profiling is enabled."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                # Nested profiled calls are covered by the outer profile
+                if not self.is_enabled() or getattr(self._local, "active", False):
+                    return func(*args, **kwargs)
+                if not self._running.acquire(blocking=False):
+                    return func(*args, **kwargs)
+                try:
+                    return self.run(name, func, *args, **kwargs)
+                finally:
+                    self._running.release()
+            return wrapper
+        return decorator
+
+    def run(self, name: str, func, *args, **kwargs) -> Any:
+        """Call `func` under cProfile and the stack sampler and save both outputs."""
+        self._local.active = True
+        profile = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), self.sample_interval)
+        started = time.perf_counter()
+        sampler.start()
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            sampler.stop()
+            self._local.active = False
+            try:
+                self._save(name, profile, sampler, time.perf_counter() - started)
+            except Exception as e:
+                print(f"Failed to save profile: {e}")
+
+    def _save(self, name: str, profile: cProfile.Profile, sampler: StackSampler, elapsed: float):
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        stem = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{name}_{elapsed * 1000:.0f}ms"
+        base = os.path.join(self.output_dir, stem)
+        profile.dump_stats(base + ".pstats")
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            f.write(sampler.collapsed())
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """List saved profiles, newest first."""
+        if not os.path.exists(self.output_dir):
+            return []
+        profiles = []
+        for file_name in sorted(os.listdir(self.output_dir), reverse=True):
+            if not file_name.endswith(".pstats"):
+                continue
+            stem = file_name[:-len(".pstats")]
+            parts = stem.split("_")
+            profiles.append({
+                "id": stem,
+                "name": "_".join(parts[1:-1]),
+                "elapsed": parts[-1],
+                "pstats_path": os.path.join(self.output_dir, file_name),
+                "collapsed_path": os.path.join(self.output_dir, stem + ".collapsed"),
+            })
+        return profiles
+
+    @staticmethod
+    def summarize(pstats_path: str, limit: int = 20) -> str:
+        """Return the top functions by cumulative time as text."""
+        stream = io.StringIO()
+        stats = pstats.Stats(pstats_path, stream=stream)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+
+# Process-wide instance; the sidebar toggle sets a per-session flag (use_session_flag)
+profiler = Profiler()
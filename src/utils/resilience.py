@@ -0,0 +1,318 @@
+"""
+Resilience layer for provider calls (chat completions and embeddings):
+per-call deadlines, hedged duplicate requests after a p95-based delay, a
+retry budget and a circuit breaker per provider endpoint.
+
+Settings (environment):
+    MEDRAG_LLM_DEADLINE_S      chat completion deadline (default 60)
+    MEDRAG_EMBED_DEADLINE_S    embedding deadline (default 10)
+    MEDRAG_HEDGE               "0" disables hedged requests
+    MEDRAG_BREAKER_FAILURES    consecutive failures that open a breaker (default 5)
+    MEDRAG_BREAKER_OPEN_S      seconds a breaker stays open before a probe (default 30)
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.utils.telemetry import telemetry
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(Exception):
+    """A provider call failed fast or ran out of time; callers may degrade instead of failing."""
+
+
+class DeadlineExceeded(ProviderUnavailable, TimeoutError):
+    """No attempt finished before the call's deadline."""
+
+
+class CircuitOpenError(ProviderUnavailable):
+    """The provider's circuit breaker is open; the call was not attempted."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, connection errors, 429 and 5xx say the provider is struggling; other errors do not."""
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(exc, (TimeoutError, ConnectionError)) or type(exc).__name__ in (
+        "APITimeoutError", "APIConnectionError",
+    )
+
+
+def describe_provider_error(exc: BaseException) -> str:
+    """User-facing text for a failed provider call."""
+    if isinstance(exc, CircuitOpenError):
+        return "模型服务暂时不可用（连续失败，已暂停请求），请稍后重试。"
+    if isinstance(exc, DeadlineExceeded):
+        return f"模型服务响应超时（{exc}），请稍后重试。"
+    if isinstance(exc, ProviderUnavailable):
+        return f"模型服务暂时不可用（{exc}），请稍后重试。"
+    return str(exc)
+
+
+class LatencyTracker:
+    """Recent successful call latencies, for the hedging delay."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """None until min_samples latencies are known."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RetryBudget:
+    """
+    Caps retries and hedges at `ratio` of calls, plus `min_per_s` so that
+    low-traffic processes can still retry. Stops retry storms against a
+    provider that is already overloaded.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_s: float = 1.0, max_tokens: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ratio = ratio
+        self.min_per_s = min_per_s
+        self.max_tokens = max_tokens
+        self._clock = clock
+        self._tokens = max_tokens
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_s)
+        self._updated = now
+
+    def record_call(self):
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive provider failures; while open,
+    calls fail fast. After `open_s` one probe call is let through (half-open):
+    success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, open_s: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.open_s = open_s
+        self._clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.open_s:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if self._clock() - self._opened_at < self.open_s:
+                    return False
+                self._state = HALF_OPEN
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = self._clock()
+            self._probing = False
+
+
+@dataclass
+class ResiliencePolicy:
+    deadline_s: float = 60.0
+    # Attempts including hedges and retries
+    max_attempts: int = 3
+    hedge: bool = True
+    hedge_quantile: float = 0.95
+    backoff_s: float = 0.2
+    failure_threshold: int = 5
+    open_s: float = 30.0
+    retry_ratio: float = 0.1
+
+
+# Attempts run here so the caller can stop waiting at the deadline
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="medrag-provider")
+
+
+class ResilientCaller:
+    """
+    Runs provider calls under a policy. The call is idempotent from the caller's
+    view (a chat completion for a fixed message list, an embedding request), so a
+    slow attempt can be duplicated: once the first attempt has taken longer than
+    the recent p95, a hedge is sent and the first successful result wins.
+    Counters: resilience.<name>.{calls,hedges,hedge_wins,retries,deadline_exceeded,short_circuited,failures}.
+    """
+
+    def __init__(self, name: str, policy: ResiliencePolicy, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.policy = policy
+        self._clock = clock
+        self.breaker = CircuitBreaker(policy.failure_threshold, policy.open_s, clock)
+        self.budget = RetryBudget(policy.retry_ratio, clock=clock)
+        self.latency = LatencyTracker()
+
+    def _incr(self, counter: str):
+        telemetry.incr(f"resilience.{self.name}.{counter}")
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.policy.hedge:
+            return None
+        return self.latency.percentile(self.policy.hedge_quantile)
+
+    def call(self, func: Callable[[], Any]) -> Any:
+        if not self.breaker.allow():
+            self._incr("short_circuited")
+            raise CircuitOpenError(f"{self.name} circuit open")
+        self._incr("calls")
+        self.budget.record_call()
+
+        policy = self.policy
+        start = self._clock()
+        deadline = start + policy.deadline_s
+        started: Dict[Future, float] = {}
+        pending = set()
+
+        def launch() -> Future:
+            # Each attempt runs in a copy of the caller's context, so its spans nest under the caller's
+            future = _executor.submit(contextvars.copy_context().run, func)
+            started[future] = self._clock()
+            pending.add(future)
+            return future
+
+        first = launch()
+        delay = self.hedge_delay()
+        hedge_at = start + delay if delay is not None else None
+        last_error: Optional[BaseException] = None
+
+        while True:
+            now = self._clock()
+            remaining = deadline - now
+            if remaining <= 0:
+                self.breaker.record_failure()
+                self._incr("deadline_exceeded")
+                raise DeadlineExceeded(f"{self.name} call exceeded {policy.deadline_s:g}s") from last_error
+            wait_for = remaining
+            if hedge_at is not None:
+                if now >= hedge_at:
+                    hedge_at = None
+                    if len(started) < policy.max_attempts and self.budget.try_spend():
+                        self._incr("hedges")
+                        launch()
+                    continue
+                wait_for = min(wait_for, hedge_at - now)
+
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                error = future.exception()
+                if error is None:
+                    self.latency.record(self._clock() - started[future])
+                    self.breaker.record_success()
+                    if future is not first:
+                        self._incr("hedge_wins")
+                    return future.result()
+                if not is_retryable(error):
+                    # The provider answered; a bad request says nothing about its health
+                    self.breaker.record_success()
+                    raise error
+                last_error = error
+            if not done or pending:
+                continue
+
+            # Every attempt so far failed with a retryable error
+            backoff = policy.backoff_s * (2 ** (len(started) - 1))
+            if len(started) < policy.max_attempts and backoff < deadline - self._clock() and self.budget.try_spend():
+                self._incr("retries")
+                time.sleep(backoff)
+                launch()
+                hedge_at = None
+                continue
+            self.breaker.record_failure()
+            self._incr("failures")
+            raise ProviderUnavailable(f"{self.name} failed after {len(started)} attempt(s): {last_error}") from last_error
+
+
+_callers: Dict[Tuple[str, str], ResilientCaller] = {}
+_callers_lock = threading.Lock()
+
+
+def default_policy(kind: str) -> ResiliencePolicy:
+    """Policy for "llm" or "embedding" calls from the environment."""
+    deadline_env, deadline_default = (
+        ("MEDRAG_EMBED_DEADLINE_S", "10") if kind == "embedding" else ("MEDRAG_LLM_DEADLINE_S", "60")
+    )
+    return ResiliencePolicy(
+        deadline_s=float(os.getenv(deadline_env, deadline_default)),
+        hedge=os.getenv("MEDRAG_HEDGE", "1").lower() not in ("0", "false", "no"),
+        failure_threshold=int(os.getenv("MEDRAG_BREAKER_FAILURES", "5")),
+        open_s=float(os.getenv("MEDRAG_BREAKER_OPEN_S", "30")),
+    )
+
+
+def get_caller(kind: str, endpoint: str = "") -> ResilientCaller:
+    """Process-wide caller per (kind, endpoint), so all sessions share breaker state and latency history."""
+    key = (kind, endpoint or "")
+    with _callers_lock:
+        caller = _callers.get(key)
+        if caller is None:
+            caller = _callers[key] = ResilientCaller(kind, default_policy(kind))
+        return caller
+
+
+def provider_health() -> Dict[str, str]:
+    """Breaker state per "kind endpoint", e.g. for the sidebar."""
+    with _callers_lock:
+        callers = dict(_callers)
+    return {f"{kind} {endpoint}".strip(): caller.breaker.state for (kind, endpoint), caller in callers.items()}
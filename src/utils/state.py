@@ -1,7 +1,60 @@
+import re
+import secrets
+from typing import Optional
+
 import streamlit as st
 from src.core.models import ModelConfig
-from src.core.rag import RAGManager
+from src.core.rag import create_rag_manager
 from src.core.agents import AgentManager
+from src.core.conversations import Conversation, get_conversation_store
+
+# URL parameter holding the owner token of the browser's conversations
+OWNER_PARAM = "u"
+_OWNER_RE = re.compile(r"[A-Za-z0-9_\-]{22,64}")
+
+
+def session_owner() -> str:
+    """
+    Owner token of this browser's stored conversations: a random token kept in the
+    URL (?u=...), so it survives reloads. Conversations are listed and resumed only
+    with their owner's token; a conversation ID alone does not give access.
+    """
+    if "conversation_owner" not in st.session_state:
+        token = st.query_params.get(OWNER_PARAM)
+        if not token or not _OWNER_RE.fullmatch(token):
+            token = secrets.token_urlsafe(16)
+        st.session_state.conversation_owner = token
+    st.query_params[OWNER_PARAM] = st.session_state.conversation_owner
+    return st.session_state.conversation_owner
+
+
+def open_session_conversation(kind: str, conversation_id: Optional[str] = None,
+                              create: bool = True) -> Optional[Conversation]:
+    """
+    Open the stored conversation `conversation_id` of `kind` ("qa" or "sim"),
+    by default the one in the URL (?qa=<id>), so reloading the page or restarting
+    the app resumes it. Without one a new conversation is created (or None with
+    create=False). The opened conversation's ID is written back to the URL.
+    Conversations of other owners are not opened.
+    """
+    store = get_conversation_store()
+    owner = session_owner()
+    conversation_id = conversation_id or st.query_params.get(kind)
+    conversation = store.open(conversation_id, owner=owner) if conversation_id else None
+    if conversation is None or conversation.kind != kind:
+        if not create:
+            return None
+        conversation = store.create(kind, owner=owner)
+    st.query_params[kind] = conversation.id
+    return conversation
+
+
+def new_session_conversation(kind: str) -> Conversation:
+    """Start a new stored conversation of `kind` and put its ID in the URL."""
+    conversation = get_conversation_store().create(kind, owner=session_owner())
+    st.query_params[kind] = conversation.id
+    return conversation
+
 
 def init_session_state():
     """Initialize Streamlit session state variables."""
@@ -14,14 +67,31 @@ def init_session_state():
             temperature=0.2
         )
 
+    if "patient_model_config" not in st.session_state:
+        # Empty base URL / API key: same connection as model_config
+        st.session_state.patient_model_config = ModelConfig(
+            base_url="",
+            api_key="",
+            model_name="qwen-flash",
+            temperature=0.7,
+            max_tokens=256
+        )
+
+    if "use_patient_model" not in st.session_state:
+        st.session_state.use_patient_model = False
+
     if "rag_manager" not in st.session_state:
-        st.session_state.rag_manager = RAGManager()
+        st.session_state.rag_manager = create_rag_manager()
 
     if "agent_manager" not in st.session_state:
-        st.session_state.agent_manager = AgentManager()
+        st.session_state.agent_manager = AgentManager(store=get_conversation_store(), owner=session_owner())
+        # A simulation in the URL is shown read-only (its agents are not restored)
+        conversation = open_session_conversation("sim", create=False)
+        if conversation is not None:
+            st.session_state.agent_manager.resume(conversation)
 
     if "messages_qa" not in st.session_state:
-        st.session_state.messages_qa = []
+        st.session_state.messages_qa = open_session_conversation("qa")
         
     if "messages_sim" not in st.session_state:
         st.session_state.messages_sim = []
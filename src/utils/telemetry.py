@@ -0,0 +1,265 @@
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Iterator, List, Optional
+
+# Numeric span attributes that are summed into counters by the Prometheus exporter
+SUMMED_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "total_tokens", "tool_calls", "num_texts", "num_results")
+
+
+@dataclass
+class Span:
+    """A single timed operation, e.g. one embedding call or one LLM step."""
+    name: str
+    span_id: str
+    request_id: str
+    parent_id: Optional[str] = None
+    start_time: float = 0.0
+    duration_ms: float = 0.0
+    status: str = "ok"
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes: Any):
+        """Attach attributes to the span."""
+        self.attributes.update(attributes)
+
+    def incr(self, key: str, value: float = 1):
+        """Increase a numeric attribute on the span."""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class SpanExporter:
+    """Receives finished spans and counter increments. Subclasses override what they need."""
+
+    def export(self, span: Span):
+        pass
+
+    def export_counter(self, name: str, value: float):
+        pass
+
+
+class InMemoryExporter(SpanExporter):
+    """Keeps the most recent spans in a ring buffer for the debug panel."""
+
+    def __init__(self, max_spans: int = 500):
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    def recent(self, limit: int = 50) -> List[Span]:
+        """Return the newest spans first."""
+        with self._lock:
+            spans = list(self._spans)
+        return spans[::-1][:limit]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+class JsonlExporter(SpanExporter):
+    """Appends every finished span as one JSON line to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class PrometheusExporter(SpanExporter):
+    """Aggregates spans and counters and renders them in the Prometheus text format."""
+
+    def __init__(self, prefix: str = "medrag"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._durations: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+        self._errors: Dict[str, int] = defaultdict(int)
+        self._attributes: Dict[tuple, float] = defaultdict(float)
+        self._counters: Dict[str, float] = defaultdict(float)
+
+    def export(self, span: Span):
+        with self._lock:
+            stats = self._durations[span.name]
+            stats[0] += 1
+            stats[1] += span.duration_ms / 1000.0
+            if span.status != "ok":
+                self._errors[span.name] += 1
+            for key in SUMMED_ATTRIBUTES:
+                value = span.attributes.get(key)
+                if isinstance(value, (int, float)):
+                    self._attributes[(key, span.name)] += value
+
+    def export_counter(self, name: str, value: float):
+        with self._lock:
+            self._counters[name] += value
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus exposition format."""
+        p = self.prefix
+        lines = []
+        with self._lock:
+            lines.append(f"# TYPE {p}_span_duration_seconds summary")
+            for name, (count, total) in sorted(self._durations.items()):
+                lines.append(f'{p}_span_duration_seconds_count{{span="{name}"}} {count}')
+                lines.append(f'{p}_span_duration_seconds_sum{{span="{name}"}} {total:.6f}')
+            lines.append(f"# TYPE {p}_span_errors_total counter")
+            for name, count in sorted(self._errors.items()):
+                lines.append(f'{p}_span_errors_total{{span="{name}"}} {count}')
+            for key in SUMMED_ATTRIBUTES:
+                rows = sorted((span, v) for (k, span), v in self._attributes.items() if k == key)
+                if rows:
+                    lines.append(f"# TYPE {p}_{key}_total counter")
+                    lines.extend(f'{p}_{key}_total{{span="{span}"}} {v:g}' for span, v in rows)
+            if self._counters:
+                lines.append(f"# TYPE {p}_events_total counter")
+                for name, value in sorted(self._counters.items()):
+                    lines.append(f'{p}_events_total{{event="{name}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("medrag_current_span", default=None)
+
+
+class Telemetry:
+    """Creates spans and counters and fans them out to the registered exporters."""
+
+    def __init__(self, exporters: Optional[List[SpanExporter]] = None):
+        self.exporters: List[SpanExporter] = list(exporters or [])
+        self.enabled = True
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add_exporter(self, exporter: SpanExporter):
+        self.exporters.append(exporter)
+
+    def get_exporter(self, exporter_type: type) -> Optional[SpanExporter]:
+        """Return the first registered exporter of the given type."""
+        for exporter in self.exporters:
+            if isinstance(exporter, exporter_type):
+                return exporter
+        return None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        Time the enclosed block. Nested spans share the request_id of the
+        outermost span, so one QA turn or simulation step can be followed end to end.
+        """
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            span_id=uuid.uuid4().hex[:16],
+            request_id=parent.request_id if parent else uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+            start_time=time.time(),
+            attributes=dict(attributes),
+        )
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.status = "error"
+            span.error = str(e)
+            raise
+        finally:
+            span.duration_ms = (time.perf_counter() - start) * 1000.0
+            _current_span.reset(token)
+            if self.enabled:
+                for exporter in self.exporters:
+                    try:
+                        exporter.export(span)
+                    except Exception as e:
+                        print(f"Telemetry export error: {e}")
+
+    def traced(self, name: str, **attributes: Any):
+        """Decorator form of `span` for whole functions."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **attributes):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def incr(self, name: str, value: float = 1):
+        """Increase a process-wide counter and the same attribute on the current span."""
+        with self._lock:
+            self._counters[name] += value
+        span = _current_span.get()
+        if span is not None:
+            span.incr(name, value)
+        if self.enabled:
+            for exporter in self.exporters:
+                exporter.export_counter(name, value)
+
+    def record_cache(self, cache_name: str, hit: bool):
+        """Count a cache lookup so hit rates show up per request and process-wide."""
+        self.incr(f"cache.{cache_name}.{'hit' if hit else 'miss'}")
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def cache_hit_rates(self) -> Dict[str, float]:
+        """Return the hit rate of every cache that has recorded at least one lookup."""
+        counters = self.counters()
+        names = {key.split(".")[1] for key in counters if key.startswith("cache.")}
+        rates = {}
+        for name in sorted(names):
+            hits = counters.get(f"cache.{name}.hit", 0)
+            misses = counters.get(f"cache.{name}.miss", 0)
+            if hits + misses:
+                rates[name] = hits / (hits + misses)
+        return rates
+
+
+def record_llm_response(span: Span, response: Any):
+    """Copy token usage and tool-call counts from a camel ChatAgentResponse onto a span."""
+    info = getattr(response, "info", None) or {}
+    usage = info.get("usage") or {}
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        if usage.get(key) is not None:
+            span.set(**{key: usage[key]})
+    span.set(tool_calls=len(info.get("tool_calls") or []))
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def _build_default_telemetry() -> Telemetry:
+    exporters: List[SpanExporter] = [
+        InMemoryExporter(int(os.getenv("MEDRAG_TELEMETRY_BUFFER", "500"))),
+        PrometheusExporter(),
+    ]
+    jsonl_path = os.getenv("MEDRAG_TELEMETRY_JSONL")
+    if jsonl_path:
+        exporters.append(JsonlExporter(jsonl_path))
+    return Telemetry(exporters)
+
+
+# Process-wide instance shared by every Streamlit session
+telemetry = _build_default_telemetry()
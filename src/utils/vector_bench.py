@@ -0,0 +1,169 @@
+"""
+Recall / latency benchmark of two-stage vector search (sharded storage).
+
+Every configuration indexes the same vectors and answers the same queries.
+Recall@k is measured against exact full-dimension search. The first-pass
+bytes show how much index one unfiltered query scans.
+
+    python -m src.utils.vector_bench --kb-file 临床药理学.txt --coarse-dims 128,64
+    python -m src.utils.vector_bench --synthetic 200000 --dim 1024 --coarse-dims 256,128,64
+
+--kb-file embeds the child chunks of a document with the offline hashing
+embedding (not Matryoshka-trained, so truncation costs it more recall than a
+real text-embedding-v4 index). --synthetic draws vectors whose variance decays
+along the dimensions, as in Matryoshka embeddings.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_KB_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "临床药理学.txt")
+
+
+@dataclass
+class BenchConfig:
+    kb_file: str = DEFAULT_KB_FILE
+    # Number of synthetic vectors; 0 uses kb_file
+    synthetic: int = 0
+    dim: int = 1024
+    coarse_dims: List[int] = field(default_factory=lambda: [256, 128, 64])
+    top_k: int = 10
+    queries: int = 200
+    rescore_factor: int = 10
+    seed: int = 0
+    base_path: Optional[str] = None
+
+
+@dataclass
+class BenchRow:
+    coarse_dim: Optional[int]
+    recall_at_k: float
+    p50_ms: float
+    p95_ms: float
+    first_pass_mb: float
+    disk_mb: float
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def load_vectors(config: BenchConfig) -> Tuple[np.ndarray, np.ndarray]:
+    """(document vectors, query vectors) for the configuration."""
+    rng = np.random.default_rng(config.seed)
+    if config.synthetic:
+        scale = (np.arange(config.dim) + 1.0) ** -0.5
+        docs = (rng.normal(size=(config.synthetic, config.dim)) * scale).astype(np.float32)
+        picked = rng.choice(config.synthetic, size=config.queries)
+        noise = rng.normal(size=(config.queries, config.dim)) * scale * 0.5
+        return docs, (docs[picked] + noise).astype(np.float32)
+
+    from src.core.embeddings import HashingEmbedding
+    from src.core.hierarchy import outline_document
+
+    with open(config.kb_file, encoding="utf-8", errors="ignore") as f:
+        _, children = outline_document(f.read(), os.path.basename(config.kb_file))
+    texts = [c.text for c in children]
+    embedding = HashingEmbedding(output_dim=config.dim)
+    docs = np.asarray(embedding.embed_list(texts), dtype=np.float32)
+    # A query is the start of a chunk, like a question quoting part of a passage
+    picked = rng.choice(len(texts), size=config.queries)
+    queries = np.asarray(embedding.embed_list([texts[i][:max(8, len(texts[i]) // 3)] for i in picked]),
+                         dtype=np.float32)
+    return docs, queries
+
+
+def run_benchmark(config: BenchConfig) -> List[BenchRow]:
+    from camel.storages import VectorDBQuery
+    from src.core.sharded_storage import ShardedStorage
+
+    docs, queries = load_vectors(config)
+    tmp = tempfile.TemporaryDirectory() if config.base_path is None else None
+    base_path = config.base_path or tmp.name
+    rows: List[BenchRow] = []
+    exact: List[List[str]] = []
+    try:
+        for coarse_dim in [None] + list(config.coarse_dims):
+            storage = ShardedStorage(config.dim, os.path.join(base_path, f"coarse-{coarse_dim or 0}"),
+                                     coarse_dim=coarse_dim, rescore_factor=config.rescore_factor)
+            storage.add_arrays(docs, [{"source": "bench"} for _ in range(len(docs))],
+                               [str(i) for i in range(len(docs))])
+            latencies, results = [], []
+            for query in queries:
+                start = time.perf_counter()
+                hits = storage.query(VectorDBQuery(query_vector=query.tolist(), top_k=config.top_k))
+                latencies.append((time.perf_counter() - start) * 1000)
+                results.append([hit.record.id for hit in hits])
+            if coarse_dim is None:
+                exact = results
+            recall = float(np.mean([len(set(r) & set(e)) / max(1, len(e)) for r, e in zip(results, exact)]))
+            rows.append(BenchRow(
+                coarse_dim=coarse_dim,
+                recall_at_k=recall,
+                p50_ms=_percentile(latencies, 0.5),
+                p95_ms=_percentile(latencies, 0.95),
+                first_pass_mb=storage.vector_bytes(coarse=bool(coarse_dim)) / 2 ** 20,
+                disk_mb=storage.disk_bytes() / 2 ** 20,
+            ))
+            storage.close()
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+    return rows
+
+
+def format_report(config: BenchConfig, rows: List[BenchRow]) -> str:
+    source = f"synthetic x{config.synthetic}" if config.synthetic else os.path.basename(config.kb_file)
+    lines = [
+        f"vectors: {source} · dim {config.dim} · top_k {config.top_k} · queries {config.queries} "
+        f"· rescore x{config.rescore_factor}",
+        f"{'first pass':>12} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8} {'scan MB':>9} {'disk MB':>9}",
+    ]
+    for row in rows:
+        label = f"{row.coarse_dim} dims" if row.coarse_dim else "exact"
+        lines.append(f"{label:>12} {row.recall_at_k:>9.3f} {row.p50_ms:>8.2f} {row.p95_ms:>8.2f} "
+                     f"{row.first_pass_mb:>9.1f} {row.disk_mb:>9.1f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark of two-stage vector search")
+    parser.add_argument("--kb-file", default=DEFAULT_KB_FILE)
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of --kb-file")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--coarse-dims", default="256,128,64")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rescore-factor", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--base-path", default=None, help="index directory (default: a temporary directory)")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the rows as JSON")
+    args = parser.parse_args()
+
+    config = BenchConfig(
+        kb_file=args.kb_file,
+        synthetic=args.synthetic,
+        dim=args.dim,
+        coarse_dims=[int(d) for d in args.coarse_dims.split(",") if d.strip()],
+        top_k=args.top_k,
+        queries=args.queries,
+        rescore_factor=args.rescore_factor,
+        seed=args.seed,
+        base_path=args.base_path,
+    )
+    rows = run_benchmark(config)
+    print(format_report(config, rows))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": asdict(config), "rows": [asdict(r) for r in rows]}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
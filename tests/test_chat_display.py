@@ -0,0 +1,88 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from camel.types.agents import ToolCallingRecord
+from streamlit.testing.v1 import AppTest
+
+from src.utils.chat_display import DISPLAY_KEY, attach_display, history_window, message_display
+
+
+def _history_app():
+    import streamlit as st
+    from src.ui.chat_history import render_history, render_tool_calls
+    from src.utils.chat_display import attach_display
+
+    if "history" not in st.session_state:
+        st.session_state.history = [
+            attach_display({"role": "Doctor", "content": f"第 {i} 条", "tool_calls": [
+                {"tool_name": "search_medical_records", "args": {"query": f"q{i}"}, "result": "血压 150/95"}
+            ]})
+            for i in range(95)
+        ]
+
+    def render(msg):
+        with st.chat_message(msg["role"]):
+            st.write(msg["content"])
+            render_tool_calls(msg)
+
+    render_history(st.session_state.history, render, key="test", page_size=20)
+
+
+class TestChatDisplay(unittest.TestCase):
+    def test_payload_built_once(self):
+        """测试消息创建时预先序列化工具调用与检索片段"""
+        record = ToolCallingRecord(tool_name="search_medical_records", args={"query": "血压"},
+                                   result="收缩压 <b>160</b>", tool_call_id="call_1")
+        message = attach_display({"role": "Doctor", "content": "请问", "tool_calls": [record]})
+        self.assertEqual(len(message[DISPLAY_KEY]["tool_calls"]), 1)
+        self.assertIn('"query": "血压"', message[DISPLAY_KEY]["tool_calls"][0])
+        self.assertIn("search_medical_records", message[DISPLAY_KEY]["tool_calls"][0])
+
+        answer = attach_display({
+            "role": "assistant", "content": "答案",
+            "rag_context": [{"text": "<script>x</script>半衰期", "similarity": 0.91, "section": "第一节"}],
+            "rag_stats": None,
+        })
+        display = answer[DISPLAY_KEY]
+        self.assertEqual(display["rag_title"], "📚 参考了 1 个文档片段")
+        self.assertIn("相似度: 0.9100", display["rag_html"])
+        self.assertIn("&lt;script&gt;", display["rag_html"])
+        self.assertNotIn("<script>", display["rag_html"])
+        # Already built: the same payload object is returned
+        self.assertIs(message_display(answer), display)
+        # Messages from before this change get their payload on first render
+        self.assertEqual(message_display({"role": "user", "content": "hi"})["tool_calls"], [])
+        print("✅ 预序列化显示测试通过！")
+
+    def test_history_window(self):
+        """测试历史分页：最近消息始终显示，更早消息按页切分"""
+        self.assertEqual(history_window(5, 20), (0, 0, 0, 0))
+        self.assertEqual(history_window(95, 20), (55, 75, 75, 4))
+        self.assertEqual(history_window(95, 20, page=1), (0, 15, 75, 4))
+        self.assertEqual(history_window(95, 20, page=2), (15, 35, 75, 4))
+        self.assertEqual(history_window(95, 20, page=99), (55, 75, 75, 4))
+        print("✅ 历史分页测试通过！")
+
+    def test_rerun_renders_bounded_history(self):
+        """测试长对话每次重跑只渲染最近一页，展开后只多渲染一页"""
+        app = AppTest.from_function(_history_app)
+        app.run()
+        self.assertFalse(app.exception)
+        self.assertEqual(len(app.chat_message), 20)
+        self.assertEqual(app.chat_message[-1].markdown[0].value, "第 94 条")
+
+        app.toggle(key="test_show_older").set_value(True).run()
+        self.assertEqual(len(app.chat_message), 40)
+        self.assertEqual(app.chat_message[0].markdown[0].value, "第 55 条")
+
+        app.number_input(key="test_older_page").set_value(1).run()
+        self.assertEqual(len(app.chat_message), 35)
+        self.assertEqual(app.chat_message[0].markdown[0].value, "第 0 条")
+        print("✅ 历史渲染有界测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import sys
+import os
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from camel.embeddings.base import BaseEmbedding
+
+from src.core.embeddings import CoalescingEmbedding
+from src.utils.coalesce import MicroBatcher
+
+
+class SlowEmbedding(BaseEmbedding[str]):
+    """Records every provider call and takes a little while to answer."""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def embed_list(self, objs, **kwargs):
+        with self._lock:
+            self.calls.append(list(objs))
+        time.sleep(0.05)
+        return [[float(len(obj)), 1.0] for obj in objs]
+
+    def get_output_dim(self):
+        return 2
+
+
+def run_concurrently(func, args):
+    results = [None] * len(args)
+
+    def worker(i, arg):
+        results[i] = func(arg)
+
+    threads = [threading.Thread(target=worker, args=(i, arg)) for i, arg in enumerate(args)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def test_concurrent_items_share_one_call(self):
+        """测试并发提交的请求被合并为一次批量调用"""
+        batches = []
+
+        def process(items):
+            batches.append(list(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher("test", process, max_batch=10, max_wait=0.1)
+        results = run_concurrently(batcher.submit, list(range(6)))
+
+        self.assertEqual(results, [0, 2, 4, 6, 8, 10])
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(sorted(batches[0]), list(range(6)))
+        print("✅ 微批合并测试通过！")
+
+    def test_max_batch_and_errors(self):
+        """测试批量上限与异常传播"""
+        batches = []
+
+        def process(items):
+            batches.append(len(items))
+            if 13 in items:
+                raise RuntimeError("provider down")
+            return items
+
+        batcher = MicroBatcher("test", process, max_batch=2, max_wait=0.05)
+        self.assertEqual(sorted(run_concurrently(batcher.submit, [1, 2, 3, 4])), [1, 2, 3, 4])
+        self.assertTrue(all(size <= 2 for size in batches))
+        with self.assertRaises(RuntimeError):
+            batcher.submit(13)
+        print("✅ 微批上限与异常测试通过！")
+
+
+class TestCoalescingEmbedding(unittest.TestCase):
+    def test_identical_and_distinct_queries(self):
+        """测试相同问题只请求一次、不同问题合并为一批"""
+        model = SlowEmbedding()
+        embedding = CoalescingEmbedding(model, max_batch=10, max_wait=0.1)
+
+        same = run_concurrently(embedding.embed, ["什么是药物代谢?"] * 8)
+        self.assertEqual(len(model.calls), 1)
+        self.assertTrue(all(vector == same[0] for vector in same))
+
+        model.calls.clear()
+        questions = [f"问题{i}" + "药" * i for i in range(6)]
+        vectors = run_concurrently(embedding.embed, questions)
+        self.assertEqual(len(model.calls), 1)
+        self.assertEqual([v[0] for v in vectors], [float(len(q)) for q in questions])
+
+        model.calls.clear()
+        embedding.embed_list(["片段一", "片段二"])
+        self.assertEqual(model.calls, [["片段一", "片段二"]])
+        print("✅ 向量请求合并测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
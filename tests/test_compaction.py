@@ -0,0 +1,163 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import shutil
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from camel.storages import VectorRecord
+
+from src.core.compaction import find_near_duplicates
+from src.core.hierarchy import load_parents
+from src.core.kb_meta import KnowledgeBaseMeta
+from src.core.rag import RAGManager, STORAGE_QDRANT, STORAGE_SHARDED
+from src.core.storage import InstrumentedStorage
+from tests.test_kb_meta import FakeEmbedding, FakeUpload, fake_build
+
+DOC_A = "# 第一章 高血压\n高血压首选钙通道阻滞剂。\n# 第二章 糖尿病\n二甲双胍是一线用药。"
+DOC_B = "# 第一章 哮喘\n吸入糖皮质激素是控制哮喘的基础。"
+
+
+class RecordingEmbedding(FakeEmbedding):
+    """FakeEmbedding that remembers every text sent to the provider."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.texts = []
+
+    def embed_list(self, objs, **kwargs):
+        self.texts.extend(objs)
+        return super().embed_list(objs, **kwargs)
+
+
+class TestCompaction(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base_path = os.path.join(self.tmp.name, "local_data")
+        self.embedding = RecordingEmbedding()
+        patcher = patch.object(RAGManager, "_get_embedding_model", side_effect=lambda *a, **k: self.embedding)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ingest_skips_duplicate_chunks(self):
+        """测试重复上传与文档内重复片段不会再次向量化和入库"""
+        manager = RAGManager(self.base_path)
+        with patch("src.core.rag.build_retriever_from_files", side_effect=fake_build):
+            status = manager.process_files("flat", [FakeUpload("a.txt", "免责声明\n阿司匹林\n免责声明")])
+            self.assertIn("跳过 1 个重复片段", status)
+            self.embedding.texts.clear()
+            status = manager.process_files("flat", [FakeUpload("b.txt", "阿司匹林\n布洛芬")])
+        self.assertTrue(status.startswith("✅"), status)
+        self.assertIn("共 2 文件，新增 1 文件", status)
+        self.assertEqual(self.embedding.texts, ["布洛芬"])
+        self.assertEqual(KnowledgeBaseMeta.load(os.path.join(self.base_path, "flat")).chunk_count, 3)
+
+        manager.process_files("tree", [FakeUpload("a.md", DOC_A)], chunking="hierarchical")
+        manager.process_files("tree", [FakeUpload("b.md", DOC_B)], chunking="hierarchical")
+        self.embedding.texts.clear()
+        status = manager.process_files("tree", [FakeUpload("a.md", DOC_A)], chunking="hierarchical")
+        self.assertTrue(status.startswith("✅"), status)
+        self.assertEqual(self.embedding.texts, [])
+        # Sections of earlier uploads stay available after a later upload
+        self.assertEqual({p.source for p in load_parents(os.path.join(self.base_path, "tree")).values()},
+                         {"a.md", "b.md"})
+        # Queries are embedded normally after ingestion
+        self.assertEqual(len(manager.retrieve("二甲双胍是一线用药。", threshold=-1.0, top_k=1)), 1)
+        print("✅ 入库去重测试通过！")
+
+    def test_compaction_removes_duplicates_and_orphans(self):
+        """测试整理知识库：删除完全/近似重复、孤立片段与重复文件，并紧凑重写索引"""
+        for storage in (STORAGE_QDRANT, STORAGE_SHARDED):
+            with self.subTest(storage=storage):
+                kb = f"kb_{storage}"
+                kb_path = os.path.join(self.base_path, kb)
+                manager = RAGManager(self.base_path)
+                manager.process_files(kb, [FakeUpload("a.md", DOC_A)], chunking="hierarchical", storage=storage)
+                manager.process_files(kb, [FakeUpload("b.md", DOC_B)], chunking="hierarchical")
+                shutil.copy(os.path.join(kb_path, "a.md"), os.path.join(kb_path, "a_copy.md"))
+                points = list(manager.storage.iter_points())
+                original = len(points)
+                _, vector, payload = points[0]
+                rng = np.random.default_rng(0)
+                manager.storage.add([
+                    VectorRecord(vector=vector.tolist(), payload=dict(payload)),
+                    VectorRecord(vector=(vector + rng.normal(size=len(vector)) * 1e-4).tolist(),
+                                 payload={**payload, "text": payload["text"] + "（转载）"}),
+                    VectorRecord(vector=rng.normal(size=len(vector)).tolist(),
+                                 payload={"text": "已删除文件的片段", "metadata": {"filename": "gone.md"}}),
+                    VectorRecord(vector=rng.normal(size=len(vector)).tolist(),
+                                 payload={"text": "父段落缺失", "metadata": {"filename": "b.md", "parent_id": "b.md#9"}}),
+                ])
+
+                # Near duplicates are only removed when a threshold is given
+                self.assertEqual(manager.compact_knowledge_base(kb, dry_run=True).near_duplicates, 0)
+                preview = manager.compact_knowledge_base(kb, near_threshold=0.9999, dry_run=True)
+                self.assertEqual(preview.points_after, original)
+                self.assertEqual(len(list(manager.storage.iter_points(with_vectors=False))), original + 4)
+                self.assertTrue(os.path.exists(os.path.join(kb_path, "a_copy.md")))
+
+                report = RAGManager(self.base_path).compact_knowledge_base(kb, near_threshold=0.9999) \
+                    if storage == STORAGE_SHARDED else manager.compact_knowledge_base(kb, near_threshold=0.9999)
+                self.assertEqual((report.points_before, report.points_after), (original + 4, original))
+                self.assertEqual((report.exact_duplicates, report.near_duplicates, report.orphans), (1, 1, 2))
+                self.assertEqual(report.files_removed, ["a_copy.md"])
+                self.assertGreater(report.bytes_reclaimed, 0)
+                self.assertIn("释放空间", report.summary())
+
+                meta = KnowledgeBaseMeta.load(kb_path)
+                self.assertEqual((meta.chunk_count, meta.files), (original, ["a.md", "b.md"]))
+                reopened = RAGManager(self.base_path)
+                self.assertTrue(reopened.load_knowledge_base(kb), reopened.vector_store_status)
+                self.assertEqual(reopened.storage.status().vector_count, original)
+                results = reopened.retrieve("哮喘", threshold=-1.0, top_k=1, filters={"source": "b.md"})
+                self.assertIn("哮喘", results[0]["text"])
+        print("✅ 知识库整理测试通过！")
+
+    def test_failed_rewrite_keeps_collection(self):
+        """测试重写索引中途失败时原集合保持完整"""
+        manager = RAGManager(self.base_path)
+        manager.process_files("kb", [FakeUpload("a.md", DOC_A + "\n" + DOC_B)], chunking="hierarchical")
+        points = list(manager.storage.iter_points())
+        _, vector, payload = points[0]
+        manager.storage.add([VectorRecord(vector=vector.tolist(), payload=dict(payload))])
+        real_add = InstrumentedStorage.add
+        calls = []
+
+        def failing_add(storage, records, **kwargs):
+            calls.append(len(records))
+            if len(calls) == 2:
+                raise OSError("disk full")
+            return real_add(storage, records, **kwargs)
+
+        with patch("src.core.compaction.REWRITE_BATCH", 1), patch.object(InstrumentedStorage, "add", failing_add):
+            with self.assertRaises(OSError):
+                manager.compact_knowledge_base("kb", near_threshold=None)
+        kb_path = os.path.join(self.base_path, "kb")
+        self.assertFalse(os.path.exists(os.path.join(kb_path, ".compact")))
+        self.assertEqual(len(list(manager.storage.iter_points(with_vectors=False))), len(points) + 1)
+
+        report = manager.compact_knowledge_base("kb", near_threshold=None)
+        self.assertEqual((report.exact_duplicates, report.points_after), (1, len(points)))
+        self.assertEqual(sorted(os.listdir(kb_path)), sorted([".lock", "a.md", "collection", "kb_meta.json",
+                                                              "meta.json", "parents.json"]))
+        self.assertEqual(RAGManager(self.base_path).get_kb_meta("kb").chunk_count, len(points))
+        self.assertEqual(len(manager.retrieve("哮喘", threshold=-1.0, top_k=1)), 1)
+        print("✅ 重写失败保护测试通过！")
+
+    def test_find_near_duplicates(self):
+        """测试 SimHash 分桶找出的近似重复与精确余弦比较一致"""
+        rng = np.random.default_rng(1)
+        vectors = rng.normal(size=(600, 64))
+        copies = vectors[:40] + rng.normal(size=(40, 64)) * 0.02
+        self.assertEqual(find_near_duplicates(np.vstack([vectors, copies]), 0.97), list(range(600, 640)))
+        print("✅ 近似重复检测测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core.context import pack_context, estimate_tokens
+from src.core.rag import format_retrieval_results
+
+SECTION = "新药临床试验分为四期：I 期为初步的临床药理学及人体安全性评价试验，观察人体对新药的耐受程度和药代动力学；II 期为治疗作用初步评价阶段。"
+NEXT_SECTION = "III 期为治疗作用确证阶段，进一步验证药物对目标适应证患者的治疗作用和安全性；IV 期为新药上市后应用研究阶段。"
+
+
+class TestContextPacking(unittest.TestCase):
+    def test_removes_duplicates_and_merges_neighbours(self):
+        """测试去除重复片段并合并同一来源的相邻片段"""
+        results = [
+            {'text': SECTION, 'similarity': 0.82, 'source': 'pharma.txt', 'chunk_index': 4},
+            {'text': SECTION.replace("。", "．"), 'similarity': 0.80, 'source': 'copy.txt', 'chunk_index': 9},
+            {'text': SECTION[-20:] + NEXT_SECTION, 'similarity': 0.75, 'source': 'pharma.txt', 'chunk_index': 5},
+            {'text': "受体是一类介导细胞信号转导的功能蛋白质。", 'similarity': 0.6, 'source': 'pharma.txt', 'chunk_index': 20},
+        ]
+
+        packed, stats = pack_context(results, token_budget=None)
+
+        self.assertEqual(stats['duplicates_removed'], 1)
+        self.assertEqual(stats['merged'], 1)
+        self.assertEqual(len(packed), 2)
+        self.assertEqual(packed[0]['chunk_span'], [4, 5])
+        self.assertEqual(packed[0]['text'], SECTION + NEXT_SECTION)
+        self.assertLess(stats['tokens_after'], stats['tokens_before'])
+        print("✅ 上下文去重与合并测试通过！")
+
+    def test_respects_token_budget_in_relevance_order(self):
+        """测试按相关性排序并截断到 token 预算"""
+        results = [
+            {'text': "低相关" * 100, 'similarity': 0.3},
+            {'text': "高相关" * 100, 'similarity': 0.9},
+        ]
+
+        packed, stats = pack_context(results, token_budget=400)
+
+        self.assertTrue(packed[0]['text'].startswith("高相关"))
+        self.assertLessEqual(stats['tokens_after'], 400 + 1)
+        self.assertEqual(stats['truncated'], 1)
+        self.assertTrue(packed[1]['truncated'])
+        print("✅ 上下文预算截断测试通过！")
+
+    def test_format_keeps_source_and_position(self):
+        """测试格式化检索结果时保留来源与片段序号"""
+        formatted = format_retrieval_results([
+            {'text': 'abc', 'similarity score': '0.7', 'content path': '/kb/a.txt',
+             'metadata': {'filename': 'a.txt', 'piece_num': 3}},
+        ])
+
+        self.assertEqual(formatted, [{'text': 'abc', 'similarity': 0.7, 'source': 'a.txt', 'chunk_index': 3}])
+        self.assertEqual(estimate_tokens("药物abcd"), 3)
+        print("✅ 检索结果格式化测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
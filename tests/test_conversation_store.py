@@ -0,0 +1,139 @@
+import unittest
+import json
+import sys
+import os
+import sqlite3
+import tempfile
+import zlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from camel.types.agents import ToolCallingRecord
+
+from src.core.agents import AgentManager
+from src.core.conversations import ConversationStore
+from src.utils.chat_display import attach_display, message_display
+
+RAG_CONTEXT = [{"text": "药物半衰期是血药浓度下降一半所需的时间。" * 20, "similarity": 0.9}]
+
+
+class TestConversationStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "conversations.db")
+        self.store = ConversationStore(self.path, window=5)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def _qa_turns(self, conversation, turns):
+        for i in range(turns):
+            conversation.append({"role": "user", "content": f"问题 {i}"})
+            conversation.append(attach_display({
+                "role": "assistant", "content": f"回答 {i}", "rag_context": RAG_CONTEXT,
+                "rag_stats": None, "cached": i % 2 == 1,
+            }))
+
+    def test_window_and_random_access(self):
+        """测试内存中只保留最近窗口，更早的消息从 SQLite 读取"""
+        conversation = self.store.create("qa")
+        self._qa_turns(conversation, 10)
+
+        self.assertEqual(len(conversation), 20)
+        self.assertEqual(len(conversation._window), 5)
+        self.assertEqual(conversation[-1]["content"], "回答 9")
+        self.assertEqual([m["content"] for m in conversation[0:2]], ["问题 0", "回答 0"])
+        self.assertTrue(conversation[3]["cached"])
+        self.assertEqual(conversation[1]["rag_context"], RAG_CONTEXT)
+        # The display payload is not stored; it is rebuilt from the loaded RAG context
+        self.assertNotIn("display", conversation[1])
+        self.assertIn("rag_html", message_display(conversation[1]))
+        self.assertEqual(len(list(conversation)), 20)
+        print("✅ 内存窗口与随机访问测试通过！")
+
+    def test_payloads_are_content_addressed(self):
+        """测试相同的检索上下文只存储一份"""
+        conversation = self.store.create("qa")
+        self._qa_turns(conversation, 10)
+
+        stats = self.store.stats()
+        self.assertEqual(stats["messages"], 20)
+        # All answers share the same RAG context, stored once and without display strings
+        self.assertEqual(stats["blobs"], 1)
+        blob = zlib.decompress(sqlite3.connect(self.path).execute("SELECT data FROM blobs").fetchone()[0])
+        self.assertEqual(sorted(json.loads(blob)), ["rag_context"])
+        self.assertEqual(sqlite3.connect(self.path).execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        print("✅ 内容寻址存储测试通过！")
+
+    def test_resume_after_restart(self):
+        """测试重启后按 ID 恢复会话，工具调用记录可正常显示"""
+        conversation = self.store.create("sim", title="张三")
+        record = ToolCallingRecord(tool_name="search_medical_records", args={"query": "血压"},
+                                   result="160/95", tool_call_id="call_1")
+        conversation.append(attach_display({"role": "Doctor", "content": "请问血压多少？", "tool_calls": [record]}))
+        conversation.append({"role": "Patient", "content": "有点高。"})
+        self.store.close()
+
+        self.store = ConversationStore(self.path, window=5)
+        resumed = self.store.open(conversation.id)
+
+        self.assertEqual(len(resumed), 2)
+        self.assertEqual(resumed.kind, "sim")
+        self.assertEqual(resumed[0]["tool_calls"][0]["args"], {"query": "血压"})
+        self.assertIn("search_medical_records", message_display(resumed[0])["tool_calls"][0])
+        self.assertEqual([c.id for c in self.store.list("sim")], [conversation.id])
+        self.assertIsNone(self.store.open("missing"))
+
+        manager = AgentManager(store=self.store)
+        manager.resume(resumed)
+        self.assertEqual(manager.chat_history[-1]["content"], "有点高。")
+        self.assertEqual(manager.current_step, 1)
+        print("✅ 会话恢复测试通过！")
+
+    def test_conversations_are_scoped_to_owner(self):
+        """测试会话只能由其所有者列出和恢复"""
+        mine = self.store.create("qa", owner="alice-token")
+        theirs = self.store.create("qa", owner="bob-token")
+        self._qa_turns(mine, 1)
+        self._qa_turns(theirs, 1)
+
+        self.assertEqual([c.id for c in self.store.list("qa", owner="alice-token")], [mine.id])
+        self.assertIsNone(self.store.open(theirs.id, owner="alice-token"))
+        self.assertEqual(len(self.store.open(mine.id, owner="alice-token")), 2)
+
+        manager = AgentManager(store=self.store, owner="alice-token")
+        manager.chat_history = self.store.create("sim", owner=manager.owner)
+        self.assertEqual(self.store.info(manager.chat_history.id).owner, "alice-token")
+
+        # A database from before owners gains the column; its conversations belong to nobody
+        self.store.close()
+        legacy = os.path.join(self.tmp.name, "legacy.db")
+        conn = sqlite3.connect(legacy)
+        conn.execute("CREATE TABLE conversations (id TEXT PRIMARY KEY, kind TEXT NOT NULL, title TEXT NOT NULL "
+                     "DEFAULT '', created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                     "message_count INTEGER NOT NULL DEFAULT 0)")
+        conn.execute("INSERT INTO conversations VALUES ('old', 'qa', '旧会话', 0, 0, 1)")
+        conn.commit()
+        conn.close()
+        self.store = ConversationStore(legacy, window=5)
+        self.assertEqual(self.store.list("qa", owner="alice-token"), [])
+        self.assertIsNone(self.store.open("old", owner="alice-token"))
+        print("✅ 会话所有者隔离测试通过！")
+
+    def test_delete_collects_orphan_blobs(self):
+        """测试删除会话时回收不再被引用的大字段"""
+        first = self.store.create("qa")
+        second = self.store.create("qa")
+        self._qa_turns(first, 2)
+        self._qa_turns(second, 1)
+
+        self.store.delete(first.id)
+        self.assertEqual(self.store.stats()["blobs"], 1)
+        self.store.delete(second.id)
+        self.assertEqual(self.store.stats(), {"conversations": 0, "messages": 0, "blobs": 0, "blob_bytes": 0})
+        print("✅ 会话删除测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
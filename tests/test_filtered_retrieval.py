@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from camel.embeddings.base import BaseEmbedding
+
+from src.core.rag import RAGManager
+from src.core.storage import add_structured_fields
+
+PHARMA = "\n".join([
+    "第一节药物的体内过程",
+    "药物自给药部位进入血液循环的过程称为吸收。",
+    "第二章临床药动学",
+    "第一节治疗药物监测",
+    "治疗药物监测通过测定血药浓度调整给药方案，血药浓度是监测的核心指标。",
+    "第三章治疗药物监测和给药个体化",
+])
+TRIALS = "\n".join([
+    "第一节新药临床试验",
+    "I 期临床试验观察人体对新药的耐受程度，也要监测血药浓度。",
+    "第七章药物的临床研究",
+])
+
+
+class KeywordEmbedding(BaseEmbedding[str]):
+    """Offline embedding: one dimension per keyword."""
+    KEYWORDS = ["吸收", "血药浓度", "监测", "临床试验"]
+
+    def __init__(self, *args, **kwargs):
+        self.model_type = "keyword-embedding"
+
+    def embed_list(self, objs, **kwargs):
+        return [[float(obj.count(k)) + 0.01 for k in self.KEYWORDS] for obj in objs]
+
+    def get_output_dim(self):
+        return len(self.KEYWORDS)
+
+
+class FakeUpload:
+    def __init__(self, name, text):
+        self.name = name
+        self._data = text.encode("utf-8")
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+
+class TestStructuredPayload(unittest.TestCase):
+    def test_fields_from_camel_metadata(self):
+        """测试从 camel 元数据提取文件名、章节、序号与入库时间"""
+        payload = {
+            "content path": "/kb/pharma/pharma.txt",
+            "metadata": {"piece_num": 7, "section": "第二章临床药动学 > 第一节治疗药物监测"},
+            "text": "...",
+        }
+
+        add_structured_fields(payload, ingested_at=123.0)
+
+        self.assertEqual(payload["source"], "pharma.txt")
+        self.assertEqual(payload["section"], ["第二章临床药动学", "第二章临床药动学 > 第一节治疗药物监测"])
+        self.assertEqual(payload["chunk_ordinal"], 7)
+        self.assertEqual(payload["ingested_at"], 123.0)
+        print("✅ 结构化 payload 测试通过！")
+
+
+class TestFilteredRetrieval(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = RAGManager(base_path=os.path.join(self.tmp.name, "local_data"))
+        self.patcher = patch.object(RAGManager, "_get_embedding_model", side_effect=KeywordEmbedding)
+        self.patcher.start()
+        self.manager.process_files(
+            "multi", [FakeUpload("pharma.txt", PHARMA), FakeUpload("trials.txt", TRIALS)], chunking="hierarchical"
+        )
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp.cleanup()
+
+    def test_filter_options(self):
+        """测试筛选项列出文档与章节"""
+        options = self.manager.list_filter_options()
+
+        self.assertEqual(options["source"], ["pharma.txt", "trials.txt"])
+        self.assertIn("第二章临床药动学", options["section"])
+        self.assertIn("第三章治疗药物监测和给药个体化 > 第一节治疗药物监测", options["section"])
+        print("✅ 检索筛选项测试通过！")
+
+    def test_filter_by_source_and_section(self):
+        """测试按文档与章节限定检索范围"""
+        unfiltered = self.manager.retrieve("血药浓度", threshold=0.3, top_k=5)
+        self.assertEqual({r['source'] for r in unfiltered}, {"pharma.txt", "trials.txt"})
+
+        by_source = self.manager.retrieve("血药浓度", threshold=0.3, top_k=5, filters={"source": "trials.txt"})
+        self.assertEqual({r['source'] for r in by_source}, {"trials.txt"})
+
+        by_section = self.manager.retrieve(
+            "血药浓度", threshold=0.0, top_k=5, filters={"section": "第三章治疗药物监测和给药个体化"}
+        )
+        self.assertEqual(len(by_section), 1)
+        self.assertIn("治疗药物监测", by_section[0]['text'])
+        print("✅ 筛选检索测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from camel.embeddings.base import BaseEmbedding
+
+from src.core.hierarchy import CHILD_CHARS, PARENTS_FILE, build_hierarchy, parse_outline, expand_to_parents
+from src.core.kb_meta import KnowledgeBaseMeta
+from src.core.rag import RAGManager
+
+TEXTBOOK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '临床药理学.txt'))
+
+SAMPLE = "\n".join([
+    "第一节药物的体内过程—、吸收",
+    "药物自给药部位进入血液循环的过程称为吸收。口服给药是最常用的给药途径。",
+    "第二章临床药动学",
+    "二、分布",
+    "药物吸收后随血液循环分布到各组织器官。",
+    "第二节药动学的基本原理",
+    "药动学用数学模型描述体内药量随时间变化的规律。",
+    "第一节治疗药物监测",
+    "治疗药物监测通过测定血药浓度调整给药方案。",
+    "第三章治疗药物监测和给药个体化",
+])
+
+
+class KeywordEmbedding(BaseEmbedding[str]):
+    """Offline embedding: one dimension per keyword."""
+    KEYWORDS = ["吸收", "分布", "药动学", "监测"]
+
+    def __init__(self, *args, **kwargs):
+        self.model_type = "keyword-embedding"
+        self.texts = []
+
+    def embed_list(self, objs, **kwargs):
+        self.texts.extend(objs)
+        return [[float(obj.count(k)) + 0.01 for k in self.KEYWORDS] for obj in objs]
+
+    def get_output_dim(self):
+        return len(self.KEYWORDS)
+
+
+class FakeUpload:
+    def __init__(self, name, text):
+        self.name = name
+        self._data = text.encode("utf-8")
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+
+class TestOutlineParsing(unittest.TestCase):
+    def test_sections_and_running_headers(self):
+        """测试按章节标题切分父段落，页眉章名不进入正文"""
+        parents = parse_outline(SAMPLE, "pharma.txt")
+
+        self.assertEqual([p.path for p in parents], [
+            ["第二章临床药动学", "第一节药物的体内过程", "一、吸收"],
+            ["第二章临床药动学", "第一节药物的体内过程", "二、分布"],
+            ["第二章临床药动学", "第二节药动学的基本原理", ""],
+            ["第三章治疗药物监测和给药个体化", "第一节治疗药物监测", ""],
+        ])
+        self.assertTrue(all("第二章" not in p.text for p in parents))
+        self.assertEqual(parents[0].parent_id, "pharma.txt#0")
+        print("✅ 章节结构解析测试通过！")
+
+    def test_textbook_children_are_small(self):
+        """测试教材的子片段长度受限且都能找到父段落"""
+        parents, children = build_hierarchy([TEXTBOOK])
+        ids = {p.parent_id for p in parents}
+
+        self.assertGreater(len(parents), 50)
+        self.assertGreater(len(children), len(parents))
+        self.assertTrue(all(len(c.text) <= CHILD_CHARS for c in children))
+        self.assertTrue(all(c.parent_id in ids for c in children))
+        self.assertIn("第一章绪论", {p.path[0] for p in parents})
+        print("✅ 教材层级分块测试通过！")
+
+
+class TestParentExpansion(unittest.TestCase):
+    def test_children_collapse_to_parents(self):
+        """测试命中同一父段落的子片段只返回一次父段落"""
+        parents = {p.parent_id: p for p in parse_outline(SAMPLE, "pharma.txt")}
+        results = [
+            {'text': "吸收子片段1", 'similarity': 0.9, 'parent_id': "pharma.txt#0"},
+            {'text': "吸收子片段2", 'similarity': 0.8, 'parent_id': "pharma.txt#0"},
+            {'text': "监测子片段", 'similarity': 0.7, 'parent_id': "pharma.txt#3"},
+            {'text': "无父段落", 'similarity': 0.6},
+        ]
+
+        expanded = expand_to_parents(results, parents, top_k=2)
+
+        self.assertEqual(len(expanded), 2)
+        self.assertEqual(expanded[0]['text'], parents["pharma.txt#0"].text)
+        self.assertEqual(expanded[0]['matched_children'], 2)
+        self.assertEqual(expanded[0]['similarity'], 0.9)
+        self.assertEqual(expanded[1]['section'], "第三章治疗药物监测和给药个体化 > 第一节治疗药物监测")
+        print("✅ 父段落去重测试通过！")
+
+
+class TestHierarchicalKnowledgeBase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base_path = os.path.join(self.tmp.name, "local_data")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_build_load_and_retrieve_parents(self):
+        """测试层级知识库的构建、离线加载与父段落检索"""
+        manager = RAGManager(base_path=self.base_path)
+        with patch.object(RAGManager, "_get_embedding_model", side_effect=KeywordEmbedding):
+            manager.process_files("pharma", [FakeUpload("pharma.txt", SAMPLE)], chunking="hierarchical")
+
+            kb_path = os.path.join(self.base_path, "pharma")
+            self.assertTrue(os.path.exists(os.path.join(kb_path, PARENTS_FILE)))
+            meta = KnowledgeBaseMeta.load(kb_path)
+            self.assertEqual(meta.chunking, "hierarchical")
+            self.assertEqual(meta.files, ["pharma.txt"])
+            self.assertEqual(meta.chunk_count, 4)
+
+            reopened = RAGManager(base_path=self.base_path)
+            self.assertTrue(reopened.load_knowledge_base("pharma"))
+            results = reopened.retrieve("血药浓度监测", threshold=0.5, top_k=1)
+
+        self.assertEqual(len(results), 1)
+        self.assertIn("治疗药物监测通过测定血药浓度", results[0]['text'])
+        self.assertEqual(results[0]['source'], "pharma.txt")
+        print("✅ 层级知识库检索测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
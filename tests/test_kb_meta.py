@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import hashlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from camel.embeddings.base import BaseEmbedding
+from camel.storages import VectorRecord
+
+from src.core.kb_meta import KnowledgeBaseMeta, KB_META_FILE
+from src.core.rag import RAGManager
+
+
+class FakeEmbedding(BaseEmbedding[str]):
+    """Deterministic offline embedding that counts provider calls."""
+
+    def __init__(self, model_type="fake-embedding", output_dim=None):
+        self.model_type = model_type
+        self.output_dim = output_dim
+        self.calls = 0
+
+    def embed_list(self, objs, **kwargs):
+        self.calls += 1
+        self.output_dim = 8
+        return [[float(hashlib.md5(f"{obj}{i}".encode()).digest()[0]) for i in range(8)] for obj in objs]
+
+    def get_output_dim(self):
+        if self.output_dim is None:
+            self.embed_list(["probe"])
+        return self.output_dim
+
+
+def fake_build(embedding_model, storage, file_paths):
+    """Index each line of each file without going through unstructured."""
+    for file_path in file_paths:
+        with open(file_path, encoding="utf-8") as f:
+            lines = [line for line in f.read().splitlines() if line]
+        vectors = embedding_model.embed_list(lines)
+        storage.add([VectorRecord(vector=v, payload={"text": t}) for v, t in zip(vectors, lines)])
+    return object()
+
+
+class FakeUpload:
+    def __init__(self, name, text):
+        self.name = name
+        self._data = text.encode("utf-8")
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+
+class TestKnowledgeBaseMeta(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base_path = os.path.join(self.tmp.name, "local_data")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ingest_writes_meta_and_open_is_offline(self):
+        """测试构建知识库时写入元数据，打开时不再请求向量模型"""
+        manager = RAGManager(base_path=self.base_path)
+        with patch.object(RAGManager, "_get_embedding_model", side_effect=lambda *a, **k: FakeEmbedding()), \
+             patch("src.core.rag.build_retriever_from_files", side_effect=fake_build):
+            status = manager.process_files("pharma", [FakeUpload("a.txt", "临床药理学研究药物在人体内的作用规律。\n新药临床试验分为四期。")])
+        self.assertIn("pharma", status)
+
+        meta = KnowledgeBaseMeta.load(os.path.join(self.base_path, "pharma"))
+        self.assertEqual(meta.dimension, 8)
+        self.assertEqual(meta.embedding_model, "fake-embedding")
+        self.assertEqual(meta.files, ["a.txt"])
+        self.assertEqual(meta.chunk_count, 2)
+        self.assertEqual(len(meta.content_hash), 64)
+
+        created = []
+
+        def make_embedding(model_type="text-embedding-v4", output_dim=None):
+            created.append((model_type, output_dim))
+            embedding = FakeEmbedding(model_type, output_dim)
+            created.append(embedding)
+            return embedding
+
+        other = RAGManager(base_path=self.base_path)
+        with patch.object(RAGManager, "_get_embedding_model", side_effect=make_embedding):
+            self.assertTrue(other.load_knowledge_base("pharma"))
+
+        self.assertEqual(created[0], ("fake-embedding", 8))
+        self.assertEqual(created[1].calls, 0)
+        self.assertEqual(other.current_kb_meta.content_hash, meta.content_hash)
+        print("✅ 知识库元数据 (离线打开) 测试通过！")
+
+    def test_kb_list_is_cached_until_directory_changes(self):
+        """测试知识库列表缓存在目录变化后失效"""
+        manager = RAGManager(base_path=self.base_path)
+        os.makedirs(os.path.join(self.base_path, "b_kb"))
+        self.assertEqual(manager.list_knowledge_bases(), ["b_kb"])
+
+        with patch("src.core.rag.os.listdir", side_effect=AssertionError("should use cache")):
+            self.assertEqual(manager.list_knowledge_bases(), ["b_kb"])
+
+        os.makedirs(os.path.join(self.base_path, "a_kb"))
+        manager.invalidate_kb_cache()
+        self.assertEqual(manager.list_knowledge_bases(), ["a_kb", "b_kb"])
+        self.assertFalse(os.path.exists(os.path.join(self.base_path, "a_kb", KB_META_FILE)))
+        print("✅ 知识库列表缓存测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
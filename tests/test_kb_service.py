@@ -0,0 +1,161 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from camel.embeddings.base import BaseEmbedding
+
+from src.core.kb_client import RemoteRAGManager, KBServiceUnavailable
+from src.core.kb_service import create_server
+from src.core.rag import RAGManager
+from src.core.rerank import LexicalReranker
+from src.utils.coalesce import SingleFlight
+
+PHARMA = "\n".join([
+    "第一节药物的体内过程",
+    "药物自给药部位进入血液循环的过程称为吸收。",
+    "第二节治疗药物监测",
+    "治疗药物监测通过测定血药浓度调整给药方案。",
+    "第二章临床药动学",
+])
+TRIALS = "I 期临床试验观察人体对新药的耐受程度。"
+
+
+class KeywordEmbedding(BaseEmbedding[str]):
+    """Offline embedding: one dimension per keyword."""
+    KEYWORDS = ["吸收", "血药浓度", "监测", "临床试验"]
+
+    def __init__(self, *args, **kwargs):
+        self.model_type = "keyword-embedding"
+
+    def embed_list(self, objs, **kwargs):
+        return [[float(obj.count(k)) + 0.01 for k in self.KEYWORDS] for obj in objs]
+
+    def get_output_dim(self):
+        return len(self.KEYWORDS)
+
+
+class FakeUpload:
+    def __init__(self, name, text):
+        self.name = name
+        self._data = text.encode("utf-8")
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_identical_calls_share_one_execution(self):
+        """测试并发的相同请求只执行一次"""
+        flight = SingleFlight("test")
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return "result"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("same", slow))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, ["result"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.do("same", lambda: "again"), "again")
+        print("✅ 单飞合并测试通过！")
+
+
+class TestKBService(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patcher = patch.object(RAGManager, "_get_embedding_model", side_effect=KeywordEmbedding)
+        self.patcher.start()
+        self.server = create_server(port=0, base_path=self.tmp.name)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.patcher.stop()
+        self.tmp.cleanup()
+
+    def test_remote_manager_round_trip(self):
+        """测试客户端通过本地服务完成建库、加载与检索"""
+        client = RemoteRAGManager(self.url)
+        status = client.process_files(
+            "pharma", [FakeUpload("pharma.txt", PHARMA), FakeUpload("trials.txt", TRIALS)], chunking="hierarchical"
+        )
+        self.assertIn("pharma", status)
+        self.assertEqual(client.current_kb_name, "pharma")
+        self.assertEqual(client.list_knowledge_bases(), ["pharma"])
+        self.assertEqual(client.get_kb_meta("pharma").files, ["pharma.txt", "trials.txt"])
+
+        other = RemoteRAGManager(self.url)
+        self.assertTrue(other.load_knowledge_base("pharma"))
+        self.assertEqual(other.current_kb_meta.chunking, "hierarchical")
+        self.assertEqual(other.list_filter_options()["source"], ["pharma.txt", "trials.txt"])
+
+        results = other.retrieve("血药浓度监测", threshold=0.5, top_k=1, reranker=LexicalReranker())
+        self.assertEqual(len(results), 1)
+        self.assertIn("血药浓度", results[0]['text'])
+
+        batches = other.retrieve_batch(["吸收", "临床试验"], threshold=0.5, top_k=1, filters={"source": "trials.txt"})
+        self.assertEqual([len(b) for b in batches], [0, 1])
+        self.assertEqual(batches[1][0]['source'], "trials.txt")
+
+        self.assertEqual(len(other.embed_query("吸收")), 4)
+        self.assertEqual(other.health()["loaded"], ["pharma"])
+
+        report = other.compact_knowledge_base("pharma", dry_run=True)
+        self.assertEqual((report.points_before, report.points_after), (client.current_kb_meta.chunk_count,) * 2)
+        report = other.compact_knowledge_base("pharma")
+        self.assertEqual(report.exact_duplicates + report.orphans, 0)
+        self.assertEqual(len(other.retrieve("血药浓度监测", threshold=0.5, top_k=1)), 1)
+        print("✅ 知识库服务往返测试通过！")
+
+    def test_tenants_are_isolated(self):
+        """测试不同租户互相看不到、也写不到对方的知识库"""
+        alice = RemoteRAGManager(self.url, tenant="alice")
+        default = RemoteRAGManager(self.url)
+        bob = RemoteRAGManager(self.url, tenant="bob")
+        self.assertIn("privatekb", alice.process_files("privatekb", [FakeUpload("pharma.txt", PHARMA)]))
+
+        self.assertEqual(default.list_knowledge_bases(), [])
+        self.assertEqual(bob.list_knowledge_bases(), [])
+        self.assertFalse(default.load_knowledge_base("alice"))
+        self.assertFalse(bob.load_knowledge_base("privatekb"))
+
+        # A KB named like a tenant or a namespace directory stays inside its own tenant
+        for kb in ("alice", "tenants", "default"):
+            self.assertIn(kb, default.process_files(kb, [FakeUpload("trials.txt", TRIALS)]))
+        bob.process_files("privatekb", [FakeUpload("trials.txt", TRIALS)])
+        self.assertEqual(default.list_knowledge_bases(), ["alice", "default", "tenants"])
+        self.assertEqual(alice.list_knowledge_bases(), ["privatekb"])
+        self.assertEqual(alice.get_kb_meta("privatekb").files, ["pharma.txt"])
+        self.assertEqual(bob.get_kb_meta("privatekb").files, ["trials.txt"])
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["default", "tenants"])
+        print("✅ 知识库服务租户隔离测试通过！")
+
+    def test_errors_are_reported(self):
+        """测试非法名称与不存在的知识库返回错误而不是崩溃"""
+        client = RemoteRAGManager(self.url)
+        self.assertFalse(client.load_knowledge_base("missing"))
+        self.assertIn("加载失败", client.vector_store_status)
+        with self.assertRaises(KBServiceUnavailable):
+            client._call("load", kb="../etc")
+        self.assertEqual(RemoteRAGManager("http://127.0.0.1:9").list_knowledge_bases(), [])
+        print("✅ 知识库服务错误处理测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
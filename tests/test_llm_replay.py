@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core.agents import AgentManager, SimulationStatus
+from src.core.models import ModelConfig
+from src.core.replay import REPLAY_MODE_ENV, REPLAY_PATH_ENV, ReplayStore
+from src.utils.mock_openai import MockOpenAI, start_background_server
+
+PATIENT_PROFILE = "男，58岁，反复头晕两周。"
+DOCTOR_INSTRUCTION = "你是一名心内科医生，请通过问诊明确诊断。"
+
+
+class TestLLMReplay(unittest.TestCase):
+    def setUp(self):
+        self.mock = MockOpenAI()
+        self.server = start_background_server(self.mock)
+        self.tmp = tempfile.TemporaryDirectory()
+        base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self.config = ModelConfig(base_url, "sk-mock", "qwen-flash", 0.2)
+        self.path = os.path.join(self.tmp.name, "replay.db")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def _simulate(self, mode: str, steps: int = 4):
+        env = {REPLAY_MODE_ENV: mode, REPLAY_PATH_ENV: self.path, "MEDRAG_TOKEN_COUNTER": "estimate"}
+        with patch.dict(os.environ, env):
+            manager = AgentManager()
+            manager.initialize_agents(PATIENT_PROFILE, DOCTOR_INSTRUCTION, self.config, max_steps=steps)
+            return [manager.step_simulation()["content"] for _ in range(steps)]
+
+    def test_record_then_replay(self):
+        """测试录制后重放：相同的对话不再请求模型，结果完全一致"""
+        recorded = self._simulate("record")
+        self.assertEqual(self.mock.requests["chat"], 4)
+
+        replayed = self._simulate("replay")
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(self.mock.requests["chat"], 4)
+        print("✅ 录制重放测试通过！")
+
+    def test_record_missing_only_pays_for_divergent_turns(self):
+        """测试 record-missing 模式：只有新增或变化的轮次请求模型"""
+        self._simulate("record-missing", steps=2)
+        self.assertEqual(self.mock.requests["chat"], 2)
+
+        # The first two turns are unchanged and replay; the next two are new
+        self._simulate("record-missing", steps=2)
+        self.assertEqual(self.mock.requests["chat"], 2)
+        print("✅ 按需录制测试通过！")
+
+    def test_replay_miss_is_an_error(self):
+        """测试纯重放模式下未录制的请求报错而不是请求模型"""
+        self._simulate("record", steps=1)
+        env = {REPLAY_MODE_ENV: "replay", REPLAY_PATH_ENV: self.path, "MEDRAG_TOKEN_COUNTER": "estimate"}
+        with patch.dict(os.environ, env):
+            manager = AgentManager()
+            manager.initialize_agents(PATIENT_PROFILE, DOCTOR_INSTRUCTION, self.config, max_steps=1)
+            self.assertIsNotNone(manager.step_simulation())
+            # Same opening turn as the recording; the patient turn after it was never recorded
+            message = manager.step_simulation()
+
+        self.assertTrue(message["content"].startswith("Error:"))
+        self.assertIn("no recorded response", message["content"])
+        self.assertEqual(self.mock.requests["chat"], 1)
+
+        with self.assertRaises(ValueError):
+            ReplayStore(self.path, mode="sometimes")
+        print("✅ 重放缺失测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.utils.loadtest import LoadTestConfig, run_load_test, format_report
+
+DOC = "\n".join([
+    "第一节药物的体内过程",
+    "药物自给药部位进入血液循环的过程称为吸收。药物的半衰期是血药浓度下降一半所需的时间。",
+    "第二章临床药动学",
+    "第一节治疗药物监测",
+    "治疗药物监测通过测定血药浓度调整给药方案，血药浓度是监测的核心指标。",
+    "第三章治疗药物监测和给药个体化",
+])
+
+
+class TestLoadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.kb_file = os.path.join(self.tmp.name, "pharma.txt")
+        with open(self.kb_file, "w", encoding="utf-8") as f:
+            f.write(DOC)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_concurrent_sessions_against_fake_provider(self):
+        """测试多会话并发压测：检索、问答与模拟三条路径均成功并输出指标"""
+        config = LoadTestConfig(
+            sessions=3, turns=2, latency_ms=5, latency_spread_ms=0, kb_file=self.kb_file,
+            base_path=os.path.join(self.tmp.name, "local_data"),
+        )
+
+        report = run_load_test(config)
+
+        self.assertEqual(set(report.operations), {"retrieve", "qa", "sim"})
+        for name, stats in report.operations.items():
+            self.assertEqual(stats.count, 6, name)
+            self.assertEqual(stats.errors, 0, name)
+            self.assertLessEqual(stats.p50_ms, stats.p95_ms)
+        self.assertEqual(report.total_operations, 18)
+        self.assertGreater(report.rss_after_run_mb, 0)
+        self.assertGreater(report.lock["lock_acquisitions"], 0)
+        # 6 QA answers + 6 simulation turns
+        self.assertEqual(report.provider_requests["chat"], 12)
+        self.assertIn("Qdrant local lock", format_report(report))
+        print("✅ 并发压测测试通过！")
+
+    def test_patient_model_tiering(self):
+        """测试病人使用独立的小模型：模拟轮次分别调用医生与病人模型"""
+        config = LoadTestConfig(
+            sessions=2, turns=2, scenarios=["sim"], latency_ms=5, latency_spread_ms=0, kb_file=self.kb_file,
+            base_path=os.path.join(self.tmp.name, "local_data"),
+            model_name="qwen-plus", patient_model_name="qwen-flash", patient_max_tokens=128, patient_latency_ms=1,
+        )
+
+        report = run_load_test(config)
+
+        self.assertEqual(report.operations["sim"].errors, 0)
+        # Doctor and patient alternate, starting with the doctor
+        self.assertEqual(report.chat_requests_by_model, {"qwen-plus": 2, "qwen-flash": 2})
+        self.assertIn("Chat requests by model", format_report(report))
+        print("✅ 病人模型分级测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import random
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openai
+
+from src.utils.mock_openai import (
+    DIAGNOSIS_MARKER, FaultConfig, LatencyModel, MockOpenAI, start_background_server,
+)
+
+
+class TestMockOpenAI(unittest.TestCase):
+    def start(self, mock):
+        server = start_background_server(mock)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return openai.OpenAI(
+            base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", api_key="sk-mock", max_retries=0, timeout=5
+        )
+
+    def test_chat_stream_and_models(self):
+        """测试普通与流式对话返回相同内容，并列出模型"""
+        client = self.start(MockOpenAI(reply_chars=30))
+        messages = [{"role": "user", "content": "头晕两周"}]
+
+        reply = client.chat.completions.create(model="qwen-flash", messages=messages)
+        stream = client.chat.completions.create(
+            model="qwen-flash", messages=messages, stream=True, stream_options={"include_usage": True}
+        )
+        chunks = list(stream)
+        streamed = "".join(c.choices[0].delta.content or "" for c in chunks if c.choices)
+
+        self.assertEqual(streamed, reply.choices[0].message.content)
+        self.assertIn("头晕两周", streamed)
+        self.assertGreater(chunks[-1].usage.total_tokens, 0)
+        self.assertIn("qwen-flash", [m.id for m in client.models.list().data])
+        print("✅ 模拟对话与流式输出测试通过！")
+
+    def test_tool_call_then_answer(self):
+        """测试带工具时先发起工具调用，收到工具结果后给出回答"""
+        client = self.start(MockOpenAI())
+        tools = [{"type": "function", "function": {
+            "name": "search_medical_records",
+            "parameters": {"type": "object", "properties": {
+                "query": {"type": "string"}, "top_k": {"type": "integer"}
+            }, "required": ["query", "top_k"]},
+        }}]
+        messages = [{"role": "user", "content": "血压多少"}]
+
+        first = client.chat.completions.create(model="qwen-flash", messages=messages, tools=tools)
+        call = first.choices[0].message.tool_calls[0]
+        messages += [first.choices[0].message.model_dump(exclude_none=True),
+                     {"role": "tool", "tool_call_id": call.id, "content": "血压 150/95 mmHg"}]
+        second = client.chat.completions.create(model="qwen-flash", messages=messages, tools=tools)
+
+        self.assertEqual(first.choices[0].finish_reason, "tool_calls")
+        self.assertEqual(call.function.name, "search_medical_records")
+        self.assertIn('"top_k": 3', call.function.arguments)
+        self.assertIn("150/95", second.choices[0].message.content)
+        print("✅ 模拟工具调用测试通过！")
+
+    def test_deterministic_embeddings_and_finish_marker(self):
+        """测试向量确定性，以及达到轮次后输出诊断完成标记"""
+        client = self.start(MockOpenAI(embedding_dim=64, finish_after=1))
+
+        first = client.embeddings.create(model="text-embedding-v4", input=["高血压", "糖尿病"])
+        second = client.embeddings.create(model="text-embedding-v4", input=["高血压"])
+        reply = client.chat.completions.create(model="qwen-flash", messages=[
+            {"role": "system", "content": f"确诊后输出 {DIAGNOSIS_MARKER}。"},
+            {"role": "user", "content": "头晕"},
+            {"role": "assistant", "content": "多久了？"},
+            {"role": "user", "content": "两周"},
+        ])
+
+        self.assertEqual(len(first.data[0].embedding), 64)
+        self.assertEqual(first.data[0].embedding, second.data[0].embedding)
+        self.assertTrue(reply.choices[0].message.content.endswith(DIAGNOSIS_MARKER))
+        print("✅ 确定性向量与结束标记测试通过！")
+
+    def test_fault_injection(self):
+        """测试注入 429、500 与超时故障"""
+        client = self.start(MockOpenAI(faults=FaultConfig(rate_limit_rate=1.0)))
+        with self.assertRaises(openai.RateLimitError):
+            client.chat.completions.create(model="qwen-flash", messages=[{"role": "user", "content": "hi"}])
+
+        client = self.start(MockOpenAI(faults=FaultConfig(server_error_rate=1.0, endpoints=["embeddings"])))
+        with self.assertRaises(openai.InternalServerError):
+            client.embeddings.create(model="text-embedding-v4", input=["hi"])
+        client.chat.completions.create(model="qwen-flash", messages=[{"role": "user", "content": "hi"}])
+
+        client = self.start(MockOpenAI(faults=FaultConfig(timeout_rate=1.0, timeout_s=0.5)))
+        with self.assertRaises((openai.APITimeoutError, openai.APIConnectionError)):
+            client.with_options(timeout=0.2).chat.completions.create(
+                model="qwen-flash", messages=[{"role": "user", "content": "hi"}]
+            )
+        print("✅ 故障注入测试通过！")
+
+    def test_latency_distributions(self):
+        """测试延迟分布的均值与非负性"""
+        rng = random.Random(0)
+        for distribution in ("fixed", "uniform", "normal", "lognormal"):
+            model = LatencyModel(100, 30, distribution)
+            samples = [model.sample(rng) for _ in range(4000)]
+            self.assertTrue(all(s >= 0 for s in samples))
+            self.assertAlmostEqual(sum(samples) / len(samples), 100, delta=5)
+        with self.assertRaises(ValueError):
+            LatencyModel(100, 30, "pareto")
+        print("✅ 延迟分布测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
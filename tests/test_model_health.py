@@ -0,0 +1,89 @@
+import time
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import socket
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core.models import ModelConfig, ModelManager, create_camel_model, shared_model_backend
+from src.core.rag import RAGManager
+from src.utils.mock_openai import MockOpenAI, start_background_server
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestModelHealth(unittest.TestCase):
+    def setUp(self):
+        self.mock = MockOpenAI(embedding_dim=48)
+        self.server = start_background_server(self.mock)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self.config = ModelConfig(self.base_url, "sk-mock", "qwen-flash", 0.2)
+        self.manager = ModelManager(interval_s=3600)
+
+    def tearDown(self):
+        self.manager.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_check_measures_latency_and_dimension(self):
+        """测试连接检查真实调用对话与向量接口，并记录延迟和向量维度"""
+        health = self.manager.check(self.config)
+
+        self.assertTrue(health.ok, health.error)
+        self.assertGreaterEqual(health.chat_ms, 0)
+        self.assertGreaterEqual(health.embedding_ms, 0)
+        self.assertEqual(health.embedding_dim, 48)
+        self.assertEqual(self.mock.requests["chat"], 1)
+        self.assertEqual(self.mock.requests["embeddings"], 1)
+        self.assertIs(self.manager.last_result(self.config), health)
+        self.assertTrue(self.manager.validate_connection(self.config))
+        print("✅ 连接检查测试通过！")
+
+    def test_check_warms_shared_clients(self):
+        """测试检查后的模型与向量客户端被后续请求复用，无需再次探测维度"""
+        self.manager.check(self.config)
+        embeddings_before = self.mock.requests["embeddings"]
+
+        model = create_camel_model(self.config)
+        self.assertIs(model.models[0], shared_model_backend(self.config))
+        env = {"OPENAI_BASE_URL": self.base_url, "OPENAI_API_KEY": "sk-mock"}
+        with patch.dict(os.environ, env):
+            dimension = RAGManager(base_path="unused")._get_embedding_model().get_output_dim()
+
+        self.assertEqual(dimension, 48)
+        self.assertEqual(self.mock.requests["embeddings"], embeddings_before)
+        print("✅ 连接预热测试通过！")
+
+    def test_check_reports_failures(self):
+        """测试缺少 API Key 或服务不可达时检查失败并给出原因"""
+        health = self.manager.check(ModelConfig(self.base_url, "", "qwen-flash", 0.2))
+        self.assertFalse(health.ok)
+        self.assertIn("API Key", health.error)
+
+        unreachable = ModelConfig(f"http://127.0.0.1:{_closed_port()}/v1", "sk-mock", "qwen-flash", 0.2)
+        health = self.manager.check(unreachable)
+        self.assertFalse(health.ok)
+        self.assertTrue(health.error)
+        print("✅ 连接失败检查测试通过！")
+
+    def test_watch_checks_new_config_in_background(self):
+        """测试新配置被立即在后台检查"""
+        self.assertIsNone(self.manager.watch(self.config))
+        deadline = time.time() + 10
+        while self.manager.last_result(self.config) is None and time.time() < deadline:
+            time.sleep(0.05)
+
+        health = self.manager.watch(self.config)
+        self.assertIsNotNone(health)
+        self.assertTrue(health.ok, health.error)
+        print("✅ 后台健康检查测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from camel.storages import VectorDBQueryResult
+
+from src.core.agents import AgentManager
+from src.core.models import ModelConfig
+from src.core.rag import RAGManager
+from src.core.tools import search_medical_records_multi
+from src.utils.mock_openai import MockOpenAI, start_background_server
+from tests.test_kb_meta import FakeEmbedding
+
+
+def make_result(text, similarity):
+    return VectorDBQueryResult.create(similarity=similarity, vector=[0.0], id=text, payload={'text': text})
+
+
+class TestMultiQueryTool(unittest.TestCase):
+    def setUp(self):
+        self.retriever = MagicMock()
+        self.retriever.embedding_model.embed_list.side_effect = lambda objs: [[float(i)] for i in range(len(objs))]
+        results_by_vector = {
+            0.0: [make_result('血压 160/95 mmHg', 0.9), make_result('甘油三酯 2.8 mmol/L', 0.4)],
+            1.0: [make_result('甘油三酯 2.8 mmol/L', 0.8), make_result('血压 160/95 mmHg', 0.6)],
+            2.0: [make_result('血糖 5.8 mmol/L', 0.1)],
+        }
+        self.retriever.storage.query.side_effect = lambda query: results_by_vector[query.query_vector[0]]
+
+    def test_batches_embeddings_and_groups_results(self):
+        """测试多查询工具只进行一次批量向量化，并按查询分组去重"""
+        result = search_medical_records_multi(["血压", "血脂", "血压", " ", "血糖"], self.retriever, top_k=2, similarity_threshold=0.5)
+
+        self.retriever.embedding_model.embed_list.assert_called_once_with(objs=["血压", "血脂", "血糖"])
+        self.assertEqual(self.retriever.storage.query.call_count, 3)
+
+        self.assertIn("【查询 1: 血压】\n血压 160/95 mmHg", result)
+        self.assertIn("【查询 2: 血脂】\n甘油三酯 2.8 mmol/L", result)
+        self.assertIn("【查询 3: 血糖】\n未找到相关记录。", result)
+        self.assertEqual(result.count("血压 160/95 mmHg"), 1)
+        print("✅ 多查询工具 (批量检索) 测试通过！")
+
+    def test_empty_queries(self):
+        """测试没有有效查询时直接返回未找到"""
+        result = search_medical_records_multi([], self.retriever)
+
+        self.assertIn("未找到相关记录", result)
+        self.retriever.embedding_model.embed_list.assert_not_called()
+        print("✅ 多查询工具 (空查询) 测试通过！")
+
+
+class TestDoctorRecordTools(unittest.TestCase):
+    def test_simulation_with_records_gives_doctor_search_tools(self):
+        """测试模拟开启 RAG 时医生获得病历检索工具"""
+        server = start_background_server(MockOpenAI())
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        config = ModelConfig(f"http://127.0.0.1:{server.server_address[1]}/v1", "sk-mock", "qwen-flash", 0.2)
+        with patch.object(RAGManager, "_get_embedding_model", side_effect=lambda *a, **k: FakeEmbedding()), \
+                patch.dict(os.environ, {"MEDRAG_TOKEN_COUNTER": "estimate"}):
+            rag_manager = RAGManager()
+            self.assertIsNotNone(rag_manager.create_temporary_retriever("血压 160/95 mmHg，血糖 5.8 mmol/L。"))
+            manager = AgentManager()
+            manager.initialize_agents("男，58岁，头晕。", "你是一名心内科医生。", config,
+                                      rag_content="血压 160/95 mmHg。", rag_manager=rag_manager)
+        self.assertEqual(sorted(manager.doctor_agent.tool_dict),
+                         ["search_medical_records", "search_medical_records_multi"])
+        self.assertIn("search_medical_records_multi", manager.doctor_agent.system_message.content)
+        print("✅ 医生病历检索工具测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import zipfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core import parsing
+from src.core.kb_meta import KnowledgeBaseMeta
+from src.core.parsing import normalize_text, parse_documents, parse_file
+from src.core.rag import RAGManager
+from tests.test_kb_meta import FakeEmbedding, FakeUpload
+
+_W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+
+def docx_bytes(paragraphs, table=None):
+    """Minimal .docx: (style id or None, text) paragraphs and an optional table of rows."""
+    body = []
+    for style, text in paragraphs:
+        ppr = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+        body.append(f"<w:p>{ppr}<w:r><w:t>{text}</w:t></w:r></w:p>")
+    if table:
+        rows = "".join(
+            "<w:tr>" + "".join(f"<w:tc><w:p><w:r><w:t>{cell}</w:t></w:r></w:p></w:tc>" for cell in row) + "</w:tr>"
+            for row in table
+        )
+        body.append(f"<w:tbl>{rows}</w:tbl>")
+    document = f'<?xml version="1.0" encoding="UTF-8"?><w:document xmlns:w="{_W_NS}"><w:body>{"".join(body)}</w:body></w:document>'
+    path = os.path.join(tempfile.mkdtemp(), "doc.docx")
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("[Content_Types].xml", "<Types/>")
+        archive.writestr("word/document.xml", document)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def pdf_bytes(lines):
+    """Minimal single-page PDF with one text line per entry (ASCII only)."""
+    stream = "BT /F1 12 Tf 72 720 Td " + " ".join(f"({line}) Tj 0 -16 Td" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out, offsets = "%PDF-1.4\n", []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n" + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+class BinaryUpload(FakeUpload):
+    def __init__(self, name, data):
+        self.name = name
+        self._data = data
+
+
+class TestParsing(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(data if isinstance(data, bytes) else data.encode("utf-8"))
+        return path
+
+    def test_formats_normalized_with_structure(self):
+        """测试 PDF/DOCX/Markdown 解析为规范化文本并带结构元数据"""
+        docx = parse_file(self._write("guide.docx", docx_bytes(
+            [("Heading1", "第一章 高血压"), (None, "血压持续升高。"), ("2", "第一节 诊断"), (None, "诊室血压 ≥140/90。")],
+            table=[["药物", "剂量"], ["氨氯地平", "5mg"]],
+        )))
+        self.assertTrue(docx.ok, docx.error)
+        self.assertIn("# 第一章 高血压", docx.text)
+        self.assertIn("## 第一节 诊断", docx.text)
+        self.assertIn("氨氯地平 | 5mg", docx.text)
+        self.assertEqual(docx.metadata["headings"], 2)
+        self.assertEqual(docx.metadata["tables"], 1)
+
+        pdf = parse_file(self._write("notes.pdf", pdf_bytes(["Hypertension treat-", "ment guideline"])))
+        self.assertTrue(pdf.ok, pdf.error)
+        self.assertEqual(pdf.metadata["pages"], 1)
+        self.assertIn("Hypertension", pdf.text)
+
+        md = parse_file(self._write("a.md", "# 标题\r\n\r\n\r\n\r\n正文\x07内容   \r\n"))
+        self.assertEqual(md.text, "# 标题\n\n正文内容")
+        self.assertEqual(normalize_text("treat-\nment，全角：保留"), "treatment，全角：保留")
+        print("✅ 文档格式解析测试通过！")
+
+    def test_failures_and_timeouts_are_isolated(self):
+        """测试损坏文件和超时只影响单个文件，其余文件照常解析"""
+        good = self._write("good.docx", docx_bytes([(None, "正常文档内容")]))
+        broken_pdf = self._write("broken.pdf", b"%PDF-1.4 not really a pdf")
+        broken_docx = self._write("broken.docx", b"PK not a zip")
+        text = self._write("a.txt", "文本文件")
+        results = {d.source: d for d in parse_documents([good, broken_pdf, text, broken_docx], max_workers=2)}
+        self.assertEqual(set(results), {"good.docx", "broken.pdf", "a.txt", "broken.docx"})
+        self.assertTrue(results["good.docx"].ok)
+        self.assertTrue(results["a.txt"].ok)
+        self.assertFalse(results["broken.pdf"].ok)
+        self.assertFalse(results["broken.docx"].ok)
+
+        # The timeout is shorter than parsing; the text file is unaffected and,
+        # with no file left, no replacement pool is started
+        with patch("src.core.parsing._new_pool", wraps=parsing._new_pool) as new_pool:
+            results = {d.source: d for d in parse_documents([good, text], timeout_s=0.01)}
+        self.assertEqual(new_pool.call_count, 1)
+        self.assertIn("超时", results["good.docx"].error)
+        self.assertEqual(results["a.txt"].text, "文本文件")
+        print("✅ 解析失败隔离测试通过！")
+
+    def test_process_files_indexes_mixed_formats(self):
+        """测试知识库构建接受 DOCX/PDF，失败文件被移除并在状态中报告"""
+        manager = RAGManager(base_path=os.path.join(self.tmp.name, "local_data"))
+        uploads = [
+            FakeUpload("a.md", "# 总论\n临床药理学研究药物在人体内的作用规律。"),
+            BinaryUpload("guide.docx", docx_bytes([("Heading1", "第一章 高血压"), (None, "高血压首选钙通道阻滞剂。")])),
+            BinaryUpload("broken.pdf", b"%PDF-1.4 garbage"),
+        ]
+        with patch.object(RAGManager, "_get_embedding_model", side_effect=lambda *a, **k: FakeEmbedding()):
+            status = manager.process_files("kb", uploads, chunking="hierarchical")
+        self.assertTrue(status.startswith("✅"), status)
+        self.assertIn("broken.pdf", status)
+
+        meta = KnowledgeBaseMeta.load(os.path.join(self.tmp.name, "local_data", "kb"))
+        self.assertEqual(meta.files, ["a.md", "guide.docx"])
+        self.assertEqual(meta.file_info["guide.docx"]["headings"], 1)
+        self.assertIn("第一章 高血压", manager.list_filter_options()["section"])
+        self.assertEqual(manager.list_filter_options()["source"], ["a.md", "guide.docx"])
+        print("✅ 多格式知识库构建测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import sys
+import os
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.utils.profiling import Profiler
+
+
+def busy_work():
+    deadline = time.perf_counter() + 0.05
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+class TestProfiling(unittest.TestCase):
+    def test_disabled_profiler_writes_nothing(self):
+        """测试未开启剖析时不产生任何文件"""
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = Profiler(output_dir=os.path.join(tmp, "profiles"), enabled=False)
+            wrapped = profiler.profiled("qa_turn")(busy_work)
+
+            self.assertGreater(wrapped(), 0)
+            self.assertEqual(profiler.list_profiles(), [])
+        print("✅ Profiling (关闭状态) 测试通过！")
+
+    def test_profiled_call_saves_pstats_and_collapsed(self):
+        """测试开启剖析后保存 pstats 与火焰图折叠栈文件"""
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = Profiler(output_dir=tmp, enabled=True)
+            profiler.sample_interval = 0.001
+            wrapped = profiler.profiled("step_simulation")(busy_work)
+
+            self.assertGreater(wrapped(), 0)
+            profiles = profiler.list_profiles()
+
+            self.assertEqual(len(profiles), 1)
+            self.assertEqual(profiles[0]["name"], "step_simulation")
+            self.assertIn("busy_work", profiler.summarize(profiles[0]["pstats_path"]))
+            with open(profiles[0]["collapsed_path"], encoding="utf-8") as f:
+                collapsed = f.read()
+            self.assertIn("busy_work (test_profiling.py", collapsed)
+        print("✅ Profiling (保存剖析文件) 测试通过！")
+
+    def test_session_flag_is_per_thread_and_runs_are_exclusive(self):
+        """测试会话开关只作用于本线程，且同一时刻只剖析一个调用"""
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = Profiler(output_dir=tmp, enabled=False)
+            wrapped = profiler.profiled("qa_turn")(busy_work)
+            profiler.use_session_flag(True)
+
+            other = threading.Thread(target=wrapped)
+            other.start()
+            other.join()
+            self.assertEqual(profiler.list_profiles(), [])
+
+            # A second session profiling concurrently runs its call unprofiled
+            with profiler._running:
+                self.assertGreater(wrapped(), 0)
+            self.assertEqual(profiler.list_profiles(), [])
+
+            wrapped()
+            self.assertEqual(len(profiler.list_profiles()), 1)
+            profiler.use_session_flag(False)
+        print("✅ Profiling (会话开关) 测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core.rag import RAGManager
+from src.core.rerank import LexicalReranker, LLMReranker, adaptive_cutoff, rerank_results
+
+
+class TestRerank(unittest.TestCase):
+    def test_adaptive_cutoff(self):
+        """测试自适应截断在分数骤降处截断，并受 top_k 上限约束"""
+        self.assertEqual(adaptive_cutoff([0.9, 0.85, 0.3, 0.2], max_keep=4), 2)
+        self.assertEqual(adaptive_cutoff([0.9, 0.88, 0.86, 0.84], max_keep=3), 3)
+        self.assertEqual(adaptive_cutoff([0.9, 0.1], max_keep=5, min_keep=2), 2)
+        self.assertEqual(adaptive_cutoff([], max_keep=3), 0)
+        print("✅ 自适应截断测试通过！")
+
+    def test_lexical_reranker_prefers_matching_text(self):
+        """测试本地词法重排将字面匹配的片段排到前面"""
+        candidates = [
+            {'text': '药物的体内过程包括吸收、分布、生物转化和排泄。', 'similarity': 0.62},
+            {'text': '新药临床试验分为 I、II、III、IV 期，I 期为耐受性试验。', 'similarity': 0.60},
+            {'text': '受体的概念及特征。', 'similarity': 0.61},
+        ]
+        results = rerank_results("新药临床试验分几期", candidates, LexicalReranker(), top_k=3)
+
+        self.assertEqual(results[0]['text'], candidates[1]['text'])
+        self.assertLess(len(results), 3)
+        print("✅ 本地词法重排测试通过！")
+
+    def test_llm_reranker_parses_scores_and_falls_back(self):
+        """测试 LLM 重排解析分数，解析失败时回退到向量相似度"""
+        self.assertEqual(LLMReranker.parse_scores("分数如下：[8, 2, 10]", 3), [0.8, 0.2, 1.0])
+        self.assertIsNone(LLMReranker.parse_scores("[8, 2]", 3))
+
+        reranker = LLMReranker(model_config=None)
+        candidates = [{'text': 'a', 'similarity': 0.4}, {'text': 'b', 'similarity': 0.7}]
+        with patch.object(LLMReranker, "_step", return_value=MagicMock(msg=MagicMock(content="无法评分"))):
+            self.assertEqual(reranker.score("q", candidates), [0.4, 0.7])
+        with patch.object(LLMReranker, "_step", return_value=MagicMock(msg=MagicMock(content="[1, 9]"))):
+            self.assertEqual(reranker.score("q", candidates), [0.1, 0.9])
+        print("✅ LLM 重排测试通过！")
+
+    def test_retrieve_overfetches_when_reranking(self):
+        """测试 RAGManager.retrieve 在开启重排时扩大候选数量"""
+        manager = RAGManager.__new__(RAGManager)
+        manager.current_kb_name = "kb"
+        manager.retriever = MagicMock()
+        manager.parents = None
+        manager.retriever.query.return_value = [
+            {'text': '临床试验伦理学原则', 'similarity score': '0.7'},
+            {'text': '药物排泄', 'similarity score': '0.69'},
+        ]
+
+        results = manager.retrieve("临床试验伦理", 0.5, 2, reranker=LexicalReranker())
+
+        manager.retriever.query.assert_called_once_with(query="临床试验伦理", top_k=6, similarity_threshold=0.5)
+        self.assertEqual(results[0]['text'], '临床试验伦理学原则')
+        self.assertIn('rerank_score', results[0])
+        print("✅ 重排检索流程测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core.models import ModelConfig
+from src.core.rag import RAGManager
+from src.ui.tabs.expert_qa import answer_question
+from src.utils.mock_openai import FaultConfig, MockOpenAI, start_background_server
+from src.utils.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, DeadlineExceeded, ProviderUnavailable,
+    ResiliencePolicy, ResilientCaller,
+)
+from src.utils.telemetry import telemetry
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResilientCaller(unittest.TestCase):
+    def test_hedge_after_p95(self):
+        """测试首个请求超过 p95 后发出对冲请求，先返回者胜出"""
+        caller = ResilientCaller("test_hedge", ResiliencePolicy(deadline_s=5))
+        for _ in range(20):
+            caller.latency.record(0.02)
+        calls = []
+        lock = threading.Lock()
+
+        def func():
+            with lock:
+                calls.append(len(calls))
+                first = len(calls) == 1
+            time.sleep(2.0 if first else 0.01)
+            return "slow" if first else "hedge"
+
+        before = telemetry.counters().get("resilience.test_hedge.hedge_wins", 0)
+        start = time.perf_counter()
+        result = caller.call(func)
+
+        self.assertEqual(result, "hedge")
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(telemetry.counters()["resilience.test_hedge.hedge_wins"], before + 1)
+        print("✅ 对冲请求测试通过！")
+
+    def test_deadline(self):
+        """测试超过截止时间后立即返回超时错误"""
+        caller = ResilientCaller("test_deadline", ResiliencePolicy(deadline_s=0.1, hedge=False))
+        start = time.perf_counter()
+        with self.assertRaises(DeadlineExceeded):
+            caller.call(lambda: time.sleep(1.0))
+        self.assertLess(time.perf_counter() - start, 0.5)
+        print("✅ 截止时间测试通过！")
+
+    def test_retry_only_provider_errors(self):
+        """测试只重试 429/5xx 等服务端错误，客户端错误直接抛出"""
+        caller = ResilientCaller("test_retry", ResiliencePolicy(deadline_s=5, hedge=False, backoff_s=0.01))
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ProviderError(503)
+            return "ok"
+
+        self.assertEqual(caller.call(flaky), "ok")
+        self.assertEqual(len(attempts), 2)
+
+        attempts.clear()
+
+        def bad_request():
+            attempts.append(1)
+            raise ProviderError(400)
+
+        with self.assertRaises(ProviderError):
+            caller.call(bad_request)
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(caller.breaker.state, CLOSED)
+        print("✅ 重试策略测试通过！")
+
+    def test_retry_budget_limits_retries(self):
+        """测试重试预算耗尽后不再重试"""
+        clock = FakeClock()
+        caller = ResilientCaller("test_budget", ResiliencePolicy(deadline_s=5, hedge=False, backoff_s=0.0,
+                                                                 failure_threshold=1000), clock=clock)
+        attempts = []
+
+        def failing():
+            attempts.append(1)
+            raise ProviderError(500)
+
+        for _ in range(20):
+            with self.assertRaises(ProviderUnavailable):
+                caller.call(failing)
+        # 20 first attempts + at most the initial budget of 10 tokens (the clock does not advance)
+        self.assertLessEqual(len(attempts), 20 + 10 + 1)
+        print("✅ 重试预算测试通过！")
+
+    def test_circuit_breaker(self):
+        """测试连续失败后熔断快速失败，冷却后探测成功恢复"""
+        clock = FakeClock()
+        caller = ResilientCaller("test_breaker", ResiliencePolicy(deadline_s=5, hedge=False, max_attempts=1,
+                                                                  failure_threshold=2, open_s=30), clock=clock)
+        calls = []
+
+        def failing():
+            calls.append(1)
+            raise ProviderError(500)
+
+        for _ in range(2):
+            with self.assertRaises(ProviderUnavailable):
+                caller.call(failing)
+        self.assertEqual(caller.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            caller.call(failing)
+        self.assertEqual(len(calls), 2)
+
+        clock.now += 31
+        self.assertEqual(caller.breaker.state, HALF_OPEN)
+        self.assertEqual(caller.call(lambda: "probe"), "probe")
+        self.assertEqual(caller.breaker.state, CLOSED)
+        print("✅ 熔断器测试通过！")
+
+    def test_half_open_allows_one_probe(self):
+        """测试半开状态只放行一个探测请求"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, open_s=10, clock=clock)
+        breaker.record_failure()
+        clock.now += 10
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        print("✅ 半开探测测试通过！")
+
+
+class FakeUpload:
+    def __init__(self, name, text):
+        self.name = name
+        self._data = text.encode("utf-8")
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+
+class TestNoRagFallback(unittest.TestCase):
+    def test_answer_without_rag_when_embedding_times_out(self):
+        """测试向量服务超时时降级为不使用知识库回答，且不写入答案缓存"""
+        mock = MockOpenAI(embedding_dim=64)
+        server = start_background_server(mock)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+
+        env = {"OPENAI_BASE_URL": base_url, "OPENAI_API_KEY": "sk-mock", "MEDRAG_TOKEN_COUNTER": "estimate",
+               "MEDRAG_EMBED_DEADLINE_S": "0.5", "MEDRAG_HEDGE": "0"}
+        with patch.dict(os.environ, env):
+            manager = RAGManager(base_path=os.path.join(tmp.name, "local_data"))
+            manager.process_files("kb", [FakeUpload("pharma.txt", "第一节药物吸收\n药物吸收进入血液循环。\n第一章总论")],
+                                  chunking="hierarchical")
+            self.assertEqual(manager.current_kb_name, "kb")
+
+            mock.faults = FaultConfig(timeout_rate=1.0, timeout_s=2.0, endpoints=["embeddings"])
+            state = SimpleNamespace(
+                rag_manager=manager, model_config=ModelConfig(base_url, "sk-mock", "qwen-flash", 0.2),
+                qa_system_prompt="你是医生。", qa_cache_enabled=True, enable_rag=True,
+                rag_threshold=0.0, rag_top_k=3, rag_rerank=None, rag_filters=None,
+            )
+            start = time.perf_counter()
+            message = answer_question("药物怎么吸收", state)
+
+        self.assertTrue(message["rag_degraded"])
+        self.assertEqual(message["rag_context"], [])
+        self.assertIn("模拟回复", message["content"])
+        # Well under the 10s default deadline: one 0.5s embedding attempt, then the LLM answer
+        self.assertLess(time.perf_counter() - start, 5.0)
+        print("✅ 无 RAG 降级回答测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
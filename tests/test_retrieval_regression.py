@@ -0,0 +1,125 @@
+import importlib
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core.embeddings import HashingEmbedding
+from src.core.rag import RAGManager
+
+TEXTBOOK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '临床药理学.txt'))
+
+# Performance budgets; generous enough for slow CI machines, tight enough to catch regressions
+INGEST_BUDGET_S = float(os.getenv("MEDRAG_BUDGET_INGEST_S", "30"))
+QUERY_P95_BUDGET_MS = float(os.getenv("MEDRAG_BUDGET_QUERY_P95_MS", "150"))
+INGEST_MEMORY_BUDGET_MB = float(os.getenv("MEDRAG_BUDGET_INGEST_MEMORY_MB", "200"))
+
+TOP_K = 3
+MIN_RECALL_AT_K = 0.8
+MIN_MRR = 0.6
+
+# Question -> part of the section path that answers it
+LABELED_QUESTIONS = [
+    ("什么是药物的半衰期", "三、主要的药动学参数及其临床意义"),
+    ("临床试验的伦理学要求有哪些", "第五节临床试验的伦理学要求"),
+    ("治疗药物监测需要监测哪些药物", "三、需要监测的药物"),
+    ("影响药物生物转化的因素", "三、生物转化"),
+    ("循证医学的概念", "一、循证医学的概念"),
+    ("转化医学是什么", "一、转化医学的概念"),
+    ("受体的分类和信号转导机制", "二、受体的分类和信号转导机制"),
+    ("药物的排泄途径有哪些", "四、排泄"),
+    ("生物标志物的选择和验证", "二、生物标志物的选择和验证"),
+    ("什么是生物等效性试验", "五、生物等效性试验"),
+    ("药物蓄积和中毒", "三、药物蓄积和中毒"),
+    ("群体药动学的方法学", "一、群体药动学的方法学"),
+    ("合理用药的原则是什么", "第七节合理用药的原则"),
+    ("年龄对药物作用的影响", "二、机体方面的因素"),
+    ("药物吸收后如何分布到各组织器官", "二、分布"),
+]
+
+
+class TextbookUpload:
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f:
+            self._data = f.read()
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+
+class TestRetrievalRegression(unittest.TestCase):
+    """
+    Builds a real KB from the textbook with a local hashing embedding (no network)
+    and checks retrieval quality and performance budgets.
+    Uses hierarchical chunking: the default chunking goes through unstructured,
+    which needs NLTK data that is not available offline.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.patcher = patch.object(RAGManager, "_get_embedding_model", side_effect=lambda *a, **k: HashingEmbedding())
+        cls.patcher.start()
+        cls.manager = RAGManager(base_path=os.path.join(cls.tmp.name, "local_data"))
+        # Import the lazily loaded camel/Qdrant modules first, so the budgets measure ingestion only
+        importlib.import_module("camel.retrievers")
+        importlib.import_module("src.core.storage")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        cls.status = cls.manager.process_files("textbook", [TextbookUpload(TEXTBOOK)], chunking="hierarchical")
+        cls.ingest_seconds = time.perf_counter() - start
+        cls.ingest_peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+        cls.latencies_ms = []
+        cls.ranks = []
+        for question, expected_section in LABELED_QUESTIONS:
+            start = time.perf_counter()
+            results = cls.manager.retrieve(question, threshold=0.0, top_k=TOP_K)
+            cls.latencies_ms.append((time.perf_counter() - start) * 1000)
+            sections = [r.get('section', '') for r in results]
+            rank = next((i + 1 for i, s in enumerate(sections) if expected_section in s), None)
+            cls.ranks.append(rank)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.patcher.stop()
+        cls.tmp.cleanup()
+
+    def test_index_built(self):
+        """测试教材知识库构建成功"""
+        self.assertIn("textbook", self.status)
+        self.assertGreater(self.manager.current_kb_meta.chunk_count, 300)
+        print(f"✅ 教材建库测试通过！({self.manager.current_kb_meta.chunk_count} 个片段)")
+
+    def test_recall_and_mrr(self):
+        """测试标注问题的 Recall@3 与 MRR 不低于基线"""
+        hits = [rank is not None for rank in self.ranks]
+        recall = sum(hits) / len(hits)
+        mrr = sum(1.0 / rank for rank in self.ranks if rank) / len(self.ranks)
+        missed = [q for (q, _), rank in zip(LABELED_QUESTIONS, self.ranks) if rank is None]
+
+        self.assertGreaterEqual(recall, MIN_RECALL_AT_K, f"missed: {missed}")
+        self.assertGreaterEqual(mrr, MIN_MRR)
+        print(f"✅ 检索质量测试通过！Recall@{TOP_K}={recall:.2f} MRR={mrr:.2f}")
+
+    def test_performance_budgets(self):
+        """测试建库耗时、查询 P95 延迟与建库内存峰值在预算内"""
+        latencies = sorted(self.latencies_ms)
+        p95 = latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+
+        self.assertLess(self.ingest_seconds, INGEST_BUDGET_S)
+        self.assertLess(p95, QUERY_P95_BUDGET_MS)
+        self.assertLess(self.ingest_peak_mb, INGEST_MEMORY_BUDGET_MB)
+        print(f"✅ 性能预算测试通过！建库 {self.ingest_seconds:.2f}s · P95 {p95:.1f}ms · 内存峰值 {self.ingest_peak_mb:.1f}MB")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from camel.embeddings.base import BaseEmbedding
+
+from src.core.cache import SemanticCache, make_namespace
+from src.core.embeddings import CachedEmbedding
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingEmbedding(BaseEmbedding[str]):
+    """Deterministic embedding that records every text sent to the model."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_list(self, objs, **kwargs):
+        self.calls.append(list(objs))
+        return [[float(len(text)), 1.0, 0.0] for text in objs]
+
+    def get_output_dim(self):
+        return 3
+
+
+class TestSemanticCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = SemanticCache(max_entries=2, ttl_seconds=60, clock=self.clock)
+        self.ns = make_namespace(kb_version="abc@2024", system_prompt="你是医生", model=["qwen-flash", 0.2])
+
+    def test_hit_above_threshold_only(self):
+        """测试相似度超过阈值时命中缓存"""
+        self.cache.store(self.ns, "临床药理学研究什么?", [1.0, 0.0, 0.0], "研究药物与人体的相互作用。")
+
+        hit = self.cache.lookup(self.ns, [0.99, 0.05, 0.0], threshold=0.95)
+        self.assertIsNotNone(hit)
+        entry, similarity = hit
+        self.assertEqual(entry.answer, "研究药物与人体的相互作用。")
+        self.assertGreater(similarity, 0.95)
+        self.assertEqual(entry.hits, 1)
+
+        self.assertIsNone(self.cache.lookup(self.ns, [0.0, 1.0, 0.0], threshold=0.95))
+        print("✅ 语义缓存阈值测试通过！")
+
+    def test_namespace_isolation(self):
+        """测试知识库版本或人设变化后不会命中旧答案"""
+        self.cache.store(self.ns, "问题", [1.0, 0.0, 0.0], "旧答案")
+        other = make_namespace(kb_version="def@2025", system_prompt="你是医生", model=["qwen-flash", 0.2])
+
+        self.assertNotEqual(self.ns, other)
+        self.assertIsNone(self.cache.lookup(other, [1.0, 0.0, 0.0]))
+        self.assertIsNotNone(self.cache.lookup(self.ns, [1.0, 0.0, 0.0]))
+        print("✅ 语义缓存命名空间测试通过！")
+
+    def test_ttl_and_lru_eviction(self):
+        """测试过期淘汰与 LRU 淘汰"""
+        self.cache.store(self.ns, "a", [1.0, 0.0, 0.0], "A")
+        self.cache.store(self.ns, "b", [0.0, 1.0, 0.0], "B")
+        # Touch "a" so "b" becomes the least recently used entry
+        self.assertIsNotNone(self.cache.lookup(self.ns, [1.0, 0.0, 0.0]))
+        self.cache.store(self.ns, "c", [0.0, 0.0, 1.0], "C")
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.lookup(self.ns, [0.0, 1.0, 0.0]))
+        self.assertIsNotNone(self.cache.lookup(self.ns, [1.0, 0.0, 0.0]))
+
+        self.clock.now += 61
+        self.assertIsNone(self.cache.lookup(self.ns, [1.0, 0.0, 0.0]))
+        self.assertEqual(len(self.cache), 0)
+        print("✅ 语义缓存淘汰测试通过！")
+
+
+class TestCachedEmbedding(unittest.TestCase):
+    def test_repeated_query_embedded_once(self):
+        """测试重复问题只调用一次向量模型，批量入库不进入缓存"""
+        model = CountingEmbedding()
+        cached = CachedEmbedding(model, max_entries=10)
+
+        first = cached.embed("什么是药物代谢?")
+        second = cached.embed("什么是药物代谢?")
+        self.assertEqual(first, second)
+        self.assertEqual(model.calls, [["什么是药物代谢?"]])
+
+        cached.embed_list(["片段一", "片段二"])
+        cached.embed_list(["片段一", "片段二"])
+        self.assertEqual(len(model.calls), 3)
+        self.assertEqual(cached.get_output_dim(), 3)
+        print("✅ 查询向量缓存测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from camel.storages import VectorDBQuery, VectorRecord
+
+from src.core.kb_meta import KnowledgeBaseMeta
+from src.core.rag import RAGManager, STORAGE_SHARDED
+from src.core.sharded_storage import ShardedStorage
+from src.utils.vector_bench import BenchConfig, run_benchmark
+from tests.test_kb_meta import FakeEmbedding, FakeUpload
+
+DIM = 16
+
+
+def make_records(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        VectorRecord(id=f"r{seed}-{i}", vector=rng.normal(size=DIM).tolist(),
+                     payload={"text": f"chunk {i}", "source": f"file{i % 3}.txt",
+                              "section": ["第一章", f"第一章 > 第{i % 2 + 1}节"]})
+        for i in range(count)
+    ]
+
+
+def brute_force(records, query, top_k, keep=lambda r: True):
+    matrix = np.array([r.vector for r in records], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    q = np.asarray(query, dtype=np.float32) / np.linalg.norm(query)
+    scored = sorted(((float(v @ q), r.id) for v, r in zip(matrix, records) if keep(r)), reverse=True)
+    return scored[:top_k]
+
+
+class TestShardedStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fan_out_matches_brute_force(self):
+        """测试分片并行检索与全量暴力检索结果一致（含过滤和删除）"""
+        storage = ShardedStorage(DIM, self.tmp.name, shard_max_vectors=50)
+        records = make_records(230)
+        storage.add(records[:120])
+        storage.add(records[120:])
+        self.assertEqual(len(storage._shards()), 5)
+        self.assertEqual(storage.status().vector_count, 230)
+
+        query = np.random.default_rng(1).normal(size=DIM).tolist()
+        results = storage.query(VectorDBQuery(query_vector=query, top_k=10))
+        expected = brute_force(records, query, 10)
+        self.assertEqual([r.record.id for r in results], [i for _, i in expected])
+        np.testing.assert_allclose([r.similarity for r in results], [s for s, _ in expected], rtol=1e-5)
+        self.assertEqual(results[0].record.payload["text"], next(r.payload["text"] for r in records
+                                                                  if r.id == expected[0][1]))
+
+        storage.delete([expected[0][1], expected[3][1]])
+        results = storage.query(VectorDBQuery(query_vector=query, top_k=8),
+                                filter_conditions={"source": "file1.txt", "section": "第一章 > 第2节"})
+        deleted = {expected[0][1], expected[3][1]}
+        expected = brute_force(records, query, 8, lambda r: r.id not in deleted and r.payload["source"] == "file1.txt"
+                               and "第一章 > 第2节" in r.payload["section"])
+        self.assertEqual([r.record.id for r in results], [i for _, i in expected])
+        self.assertEqual(storage.status().vector_count, 228)
+        with self.assertRaises(ValueError):
+            storage.query(VectorDBQuery(query_vector=query, top_k=3), filter_conditions={"text": "chunk 1"})
+        print("✅ 分片并行检索测试通过！")
+
+    def test_open_is_lazy_and_survives_torn_append(self):
+        """测试打开分片存储不读取向量，且未提交的残留写入会被丢弃"""
+        records = make_records(120)
+        ShardedStorage(DIM, self.tmp.name, shard_max_vectors=50).add(records[:100])
+        # An add that crashed after writing vectors but before its index commit
+        with open(os.path.join(self.tmp.name, "shards", "shard-00001.f32"), "ab") as f:
+            f.write(b"\x00" * DIM * 4 * 7)
+
+        reopened = ShardedStorage(DIM, self.tmp.name, shard_max_vectors=50)
+        self.assertEqual(reopened._maps, {})
+        reopened.add(records[100:])
+        self.assertEqual(os.path.getsize(reopened.shard_file(2)), 20 * DIM * 4)
+        query = records[110].vector
+        results = reopened.query(VectorDBQuery(query_vector=query, top_k=5))
+        self.assertEqual([r.record.id for r in results], [i for _, i in brute_force(records, query, 5)])
+        self.assertEqual(sorted(shard for shard, _ in reopened._maps), [0, 1, 2])
+        print("✅ 分片延迟映射测试通过！")
+
+    def test_compact_with_relative_path(self):
+        """测试相对路径下紧凑重写分片，以及替换失败时保留原分片"""
+        cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.addCleanup(os.chdir, cwd)
+        records = make_records(120)
+        storage = ShardedStorage(DIM, os.path.join("local_data", "kb"), shard_max_vectors=50)
+        storage.add(records)
+        storage.delete([r.id for r in records[:60]])
+        query = records[100].vector
+        expected = [i for _, i in brute_force(records[60:], query, 5)]
+
+        real_replace = os.replace
+        calls = []
+
+        def failing_replace(src, dst):
+            calls.append(src)
+            if len(calls) == 2:
+                raise OSError("disk full")
+            real_replace(src, dst)
+
+        with patch("src.core.sharded_storage.os.replace", side_effect=failing_replace):
+            with self.assertRaises(OSError):
+                storage.compact()
+        self.assertEqual(sorted(os.listdir(os.path.join("local_data", "kb"))), ["shards"])
+        self.assertEqual([r.record.id for r in storage.query(VectorDBQuery(query_vector=query, top_k=5))], expected)
+
+        self.assertGreater(storage.compact(), 0)
+        self.assertEqual(sorted(os.listdir(os.path.join("local_data", "kb"))), ["shards"])
+        self.assertEqual(storage.status().vector_count, 60)
+        self.assertEqual([r.record.id for r in storage.query(VectorDBQuery(query_vector=query, top_k=5))], expected)
+        print("✅ 分片紧凑重写测试通过！")
+
+    def test_knowledge_base_on_sharded_storage(self):
+        """测试以磁盘分片方式构建、打开和检索知识库"""
+        base_path = os.path.join(self.tmp.name, "local_data")
+        text = "# 第一章 高血压\n高血压首选钙通道阻滞剂。\n# 第二章 糖尿病\n二甲双胍是一线用药。"
+        with patch.object(RAGManager, "_get_embedding_model", side_effect=lambda *a, **k: FakeEmbedding()):
+            status = RAGManager(base_path).process_files("big", [FakeUpload("a.md", text)],
+                                                         chunking="hierarchical", storage=STORAGE_SHARDED)
+            self.assertTrue(status.startswith("✅"), status)
+            meta = KnowledgeBaseMeta.load(os.path.join(base_path, "big"))
+            self.assertEqual(meta.storage, STORAGE_SHARDED)
+            self.assertGreater(meta.chunk_count, 0)
+            self.assertFalse(os.path.exists(os.path.join(base_path, "big", "collection")))
+
+            manager = RAGManager(base_path)
+            self.assertTrue(manager.load_knowledge_base("big"))
+            results = manager.retrieve("二甲双胍是一线用药。", threshold=-1.0, top_k=1,
+                                       filters={"section": "第二章 糖尿病"})
+        self.assertEqual(len(results), 1)
+        self.assertIn("二甲双胍", results[0]["text"])
+        print("✅ 分片知识库测试通过！")
+
+    def test_two_stage_search(self):
+        """测试低维粗排 + 全维重排的两阶段检索：召回率接近精确检索，扫描量降低"""
+        rows = run_benchmark(BenchConfig(synthetic=4000, dim=128, coarse_dims=[32], top_k=5, queries=40,
+                                         base_path=self.tmp.name))
+        exact, coarse = rows
+        self.assertIsNone(exact.coarse_dim)
+        self.assertEqual(exact.recall_at_k, 1.0)
+        self.assertGreaterEqual(coarse.recall_at_k, 0.9)
+        self.assertAlmostEqual(coarse.first_pass_mb * 4, exact.first_pass_mb, places=3)
+
+        # The first-pass dimension is fixed by the index and recorded in the KB meta
+        with self.assertRaises(ValueError):
+            ShardedStorage(DIM, os.path.join(self.tmp.name, "bad"), coarse_dim=DIM)
+        reopened = ShardedStorage(128, os.path.join(self.tmp.name, "coarse-32"))
+        self.assertEqual(reopened.coarse_dim, 32)
+
+        base_path = os.path.join(self.tmp.name, "local_data")
+        with patch.object(RAGManager, "_get_embedding_model", side_effect=lambda *a, **k: FakeEmbedding()):
+            manager = RAGManager(base_path)
+            status = manager.process_files("kb", [FakeUpload("a.md", "# 第一章\n高血压首选钙通道阻滞剂。")],
+                                           chunking="hierarchical", coarse_dim=4)
+            self.assertTrue(status.startswith("✅"), status)
+            status = manager.process_files("kb", [FakeUpload("b.md", "二甲双胍")], chunking="hierarchical", coarse_dim=2)
+            self.assertTrue(status.startswith("❌"), status)
+        meta = KnowledgeBaseMeta.load(os.path.join(base_path, "kb"))
+        self.assertEqual((meta.storage, meta.coarse_dim), (STORAGE_SHARDED, 4))
+        print(f"✅ 两阶段检索测试通过！recall@5={coarse.recall_at_k:.3f}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import subprocess
+import sys
+import os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from src.utils.lazy import lazy_import
+
+# Cold-start budget for `import app` in milliseconds (override with MEDRAG_IMPORT_BUDGET_MS)
+IMPORT_BUDGET_MS = float(os.getenv("MEDRAG_IMPORT_BUDGET_MS", "1500"))
+
+# Packages that must only be imported on first use of RAG or the agents
+HEAVY_PACKAGES = ("camel", "qdrant_client", "unstructured", "openai")
+
+
+def measure_imports(statement):
+    """Run `statement` in a fresh interpreter with -X importtime and parse the report."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "MEDRAG_PREWARM": "0"},
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr[-2000:])
+
+    cumulative_us = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _self_us, cumulative, name = [part.strip() for part in line.replace("import time:", "").split("|")]
+        cumulative_us[name] = int(cumulative)
+    return cumulative_us
+
+
+class TestStartupImportTime(unittest.TestCase):
+    def test_app_import_is_light(self):
+        """测试 app.py 冷启动不导入 camel / Qdrant / unstructured，且耗时在预算内"""
+        imports = measure_imports("import app")
+
+        heavy = sorted(name for name in imports if name.split(".")[0] in HEAVY_PACKAGES)
+        self.assertEqual(heavy, [], f"启动时不应导入重量级依赖: {heavy[:10]}")
+
+        app_ms = imports["app"] / 1000.0
+        self.assertLess(app_ms, IMPORT_BUDGET_MS, f"import app 耗时 {app_ms:.0f}ms，超出预算 {IMPORT_BUDGET_MS:.0f}ms")
+        print(f"✅ 启动导入测试通过！import app: {app_ms:.0f}ms")
+
+    def test_tab_modules_are_light(self):
+        """测试两个标签页模块本身也不会在导入时拉起 camel"""
+        imports = measure_imports("import src.ui.tabs.expert_qa, src.ui.tabs.consultation")
+
+        heavy = sorted(name for name in imports if name.split(".")[0] in HEAVY_PACKAGES)
+        self.assertEqual(heavy, [], f"标签页导入时不应加载重量级依赖: {heavy[:10]}")
+        print("✅ 标签页导入测试通过！")
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_lazy_object_resolves_on_first_use(self):
+        """测试 lazy_import 在首次调用时才真正导入目标"""
+        OrderedDict = lazy_import("collections", "OrderedDict")
+        self.assertIsNone(OrderedDict._target)
+
+        instance = OrderedDict(a=1)
+        self.assertIsInstance(instance, OrderedDict)
+        self.assertEqual(OrderedDict.fromkeys(["b"]), {"b": None})
+        self.assertIsNotNone(OrderedDict._target)
+        print("✅ 延迟导入测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import json
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.utils.telemetry import Telemetry, InMemoryExporter, JsonlExporter, PrometheusExporter
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.memory = InMemoryExporter(max_spans=10)
+        self.prometheus = PrometheusExporter()
+        self.telemetry = Telemetry([self.memory, self.prometheus])
+
+    def test_nested_spans_share_request(self):
+        """测试嵌套 span 共享 request_id 并记录父子关系"""
+        with self.telemetry.span("qa.turn") as root:
+            with self.telemetry.span("llm.step") as child:
+                child.set(prompt_tokens=12, completion_tokens=30)
+            self.telemetry.record_cache("answer", hit=False)
+
+        spans = self.memory.recent()
+        self.assertEqual([s.name for s in spans], ["qa.turn", "llm.step"])
+        self.assertEqual(child.request_id, root.request_id)
+        self.assertEqual(child.parent_id, root.span_id)
+        self.assertEqual(root.attributes["cache.answer.miss"], 1)
+        self.assertEqual(self.telemetry.cache_hit_rates(), {"answer": 0.0})
+        print("✅ Telemetry (嵌套 span) 测试通过！")
+
+    def test_error_status_and_prometheus(self):
+        """测试异常 span 的状态记录以及 Prometheus 文本导出"""
+        with self.assertRaises(RuntimeError):
+            with self.telemetry.span("rag.embedding", num_texts=3):
+                raise RuntimeError("timeout")
+
+        span = self.memory.recent()[0]
+        self.assertEqual(span.status, "error")
+        self.assertEqual(span.error, "timeout")
+
+        text = self.prometheus.render()
+        self.assertIn('medrag_span_duration_seconds_count{span="rag.embedding"} 1', text)
+        self.assertIn('medrag_span_errors_total{span="rag.embedding"} 1', text)
+        self.assertIn('medrag_num_texts_total{span="rag.embedding"} 3', text)
+        print("✅ Telemetry (Prometheus 导出) 测试通过！")
+
+    def test_jsonl_exporter(self):
+        """测试 JSONL 导出器逐行写入 span"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spans", "trace.jsonl")
+            telemetry = Telemetry([JsonlExporter(path)])
+
+            @telemetry.traced("sim.step", role="Doctor")
+            def step():
+                return "ok"
+
+            self.assertEqual(step(), "ok")
+            with open(path, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f]
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["name"], "sim.step")
+        self.assertEqual(rows[0]["attributes"]["role"], "Doctor")
+        print("✅ Telemetry (JSONL 导出) 测试通过！")
+
+
+if __name__ == '__main__':
+    unittest.main()